@@ -100,3 +100,21 @@ async def require_supabase_user(
     request.state.user_id = user.id
     return user
 
+
+
+def _admin_user_ids() -> set[str]:
+    return {user_id.strip() for user_id in os.getenv("ADMIN_USER_IDS", "").split(",") if user_id.strip()}
+
+
+def is_admin(user: AuthenticatedUser) -> bool:
+    """Listed in ``ADMIN_USER_IDS`` or given ``app_metadata.role = "admin"`` in Supabase."""
+    app_metadata = (user.raw or {}).get("app_metadata") or {}
+    return user.id in _admin_user_ids() or app_metadata.get("role") == "admin"
+
+
+async def require_admin_user(user: AuthenticatedUser = Depends(require_supabase_user)) -> AuthenticatedUser:
+    """FastAPI dependency for operator-only endpoints; other signed-in users get 403."""
+
+    if not is_admin(user):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required.")
+    return user
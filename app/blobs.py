@@ -0,0 +1,151 @@
+"""Local content-addressed store that keeps in-flight images out of process memory."""
+
+from __future__ import annotations
+
+import hashlib
+import io
+import logging
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import BinaryIO, Iterator
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+_CHUNK_SIZE = 1024 * 1024
+
+
+@dataclass(frozen=True, slots=True)
+class BlobRef:
+    """Handle to a stored blob; small and picklable, so it can cross into pool workers."""
+
+    digest: str
+    size: int
+    mime_type: str
+    path: str
+
+
+@contextmanager
+def open_blob(ref: BlobRef) -> Iterator[memoryview]:
+    """Map the blob read-only; pages are loaded by the OS on demand and shared between readers."""
+    with open(ref.path, "rb") as handle:
+        if ref.size == 0:
+            yield memoryview(b"")
+            return
+        mapped = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mapped)
+        try:
+            yield view
+        finally:
+            view.release()
+            mapped.close()
+
+
+def read_blob(ref: BlobRef) -> bytes:
+    with open(ref.path, "rb") as handle:
+        return handle.read()
+
+
+class BlobStore:
+    """Stores each distinct upload once under its sha256, bounded to ``max_bytes``.
+
+    Blobs are pinned while a task uses them (``put`` pins, ``release`` unpins)
+    and only unpinned blobs are evicted, least recently used first.
+    """
+
+    def __init__(self, root: str, max_bytes: int) -> None:
+        self._root = root
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._sizes: OrderedDict[str, int] = OrderedDict()
+        self._pins: dict[str, int] = {}
+        self._total = 0
+        os.makedirs(root, exist_ok=True)
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self._root, digest)
+
+    def put(self, data: bytes, mime_type: str) -> BlobRef:
+        return self.put_stream(io.BytesIO(data), mime_type)
+
+    def put_stream(self, stream: BinaryIO, mime_type: str) -> BlobRef:
+        """Copy ``stream`` into the store in chunks, hashing as it goes."""
+        hasher = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self._root, prefix=".incoming-")
+        try:
+            with os.fdopen(fd, "wb") as handle:
+                while chunk := stream.read(_CHUNK_SIZE):
+                    hasher.update(chunk)
+                    handle.write(chunk)
+                    size += len(chunk)
+            digest = hasher.hexdigest()
+            with self._lock:
+                if digest in self._sizes:
+                    os.unlink(tmp_path)
+                    self._sizes.move_to_end(digest)
+                    metrics.increment("blob_store.dedup_hits")
+                else:
+                    os.replace(tmp_path, self._path(digest))
+                    self._sizes[digest] = size
+                    self._total += size
+                self._pins[digest] = self._pins.get(digest, 0) + 1
+                self._evict()
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return BlobRef(digest=digest, size=size, mime_type=mime_type, path=self._path(digest))
+
+    def release(self, ref: BlobRef) -> None:
+        with self._lock:
+            pins = self._pins.get(ref.digest, 0) - 1
+            if pins > 0:
+                self._pins[ref.digest] = pins
+            else:
+                self._pins.pop(ref.digest, None)
+            self._evict()
+
+    def _evict(self) -> None:
+        for digest in list(self._sizes):
+            if self._total <= self._max_bytes:
+                break
+            if self._pins.get(digest):
+                continue
+            size = self._sizes.pop(digest)
+            self._total -= size
+            try:
+                os.unlink(self._path(digest))
+            except FileNotFoundError:
+                pass
+            metrics.increment("blob_store.evictions")
+        metrics.set_gauge("blob_store.bytes", self._total)
+        if self._total > self._max_bytes:
+            logger.warning("Blob store holds %d bytes of pinned blobs, above its %d byte budget", self._total, self._max_bytes)
+
+    def close(self) -> None:
+        """Delete every blob; in-flight tasks do not survive a restart anyway."""
+        with self._lock:
+            shutil.rmtree(self._root, ignore_errors=True)
+            self._sizes.clear()
+            self._pins.clear()
+            self._total = 0
+
+
+@lru_cache
+def get_blob_store() -> BlobStore:
+    # One directory per worker process, under BLOB_STORE_DIR if set.
+    root = tempfile.mkdtemp(prefix="ff-blobs-", dir=os.getenv("BLOB_STORE_DIR") or None)
+    return BlobStore(root, int(os.getenv("BLOB_STORE_MAX_BYTES", str(2 * 1024**3))))
@@ -0,0 +1,153 @@
+"""Small async key/value caches with an in-process tier and an optional Redis tier."""
+
+from __future__ import annotations
+
+import logging
+import os
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Optional
+
+import orjson
+from redis import asyncio as redis_asyncio
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache
+def get_redis_client() -> Optional[redis_asyncio.Redis]:
+    """Return a shared Redis client when ``REDIS_URL`` is configured."""
+    redis_url = os.getenv("REDIS_URL")
+    if not redis_url:
+        return None
+    return redis_asyncio.from_url(redis_url)
+
+
+class MemoryCache:
+    """Bounded LRU cache whose entries also expire after ``ttl_seconds``.
+
+    Values are stored as encoded bytes so callers always get a fresh object
+    back and can mutate it freely.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600) -> None:
+        self._max_entries = max_entries
+        self._ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get(self, key: str) -> Any | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, payload = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return orjson.loads(payload)
+
+    async def set(self, key: str, value: Any, ttl_seconds: float | None = None) -> None:
+        ttl = self._ttl_seconds if ttl_seconds is None else ttl_seconds
+        self._entries[key] = (time.monotonic() + ttl, orjson.dumps(value))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    async def add(self, key: str, value: Any, ttl_seconds: float | None = None) -> bool:
+        """Store ``value`` only if ``key`` is absent or expired; return whether it was stored."""
+        if await self.get(key) is not None:
+            return False
+        await self.set(key, value, ttl_seconds)
+        return True
+
+    async def delete(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+    async def clear(self) -> None:
+        self._entries.clear()
+
+
+class RedisCache:
+    """JSON values stored in Redis under a key prefix, expired by Redis itself."""
+
+    def __init__(self, client: redis_asyncio.Redis, prefix: str, ttl_seconds: float = 3600) -> None:
+        self._client = client
+        self._prefix = prefix
+        self._ttl_seconds = ttl_seconds
+
+    def _key(self, key: str) -> str:
+        return f"{self._prefix}:{key}"
+
+    async def get(self, key: str) -> Any | None:
+        try:
+            payload = await self._client.get(self._key(key))
+        except RedisError as exc:
+            logger.warning("Redis cache read failed for %s: %s", key, exc)
+            return None
+        if payload is None:
+            return None
+        return orjson.loads(payload)
+
+    async def set(self, key: str, value: Any, ttl_seconds: float | None = None) -> None:
+        ttl = self._ttl_seconds if ttl_seconds is None else ttl_seconds
+        try:
+            await self._client.set(self._key(key), orjson.dumps(value), ex=max(1, int(ttl)))
+        except RedisError as exc:
+            logger.warning("Redis cache write failed for %s: %s", key, exc)
+
+    async def add(self, key: str, value: Any, ttl_seconds: float | None = None) -> bool:
+        """``SET NX``: store ``value`` only if ``key`` is absent; return whether it was stored.
+
+        An unreachable Redis counts as stored, so callers carry on without the guard.
+        """
+        ttl = self._ttl_seconds if ttl_seconds is None else ttl_seconds
+        try:
+            return bool(await self._client.set(self._key(key), orjson.dumps(value), ex=max(1, int(ttl)), nx=True))
+        except RedisError as exc:
+            logger.warning("Redis cache add failed for %s: %s", key, exc)
+            return True
+
+    async def delete(self, key: str) -> None:
+        try:
+            await self._client.delete(self._key(key))
+        except RedisError as exc:
+            logger.warning("Redis cache delete failed for %s: %s", key, exc)
+
+
+class TieredCache:
+    """Read-through pair of caches: the in-process tier backed by a shared one."""
+
+    def __init__(self, local: MemoryCache, shared: RedisCache | None = None) -> None:
+        self.local = local
+        self.shared = shared
+
+    async def get(self, key: str) -> Any | None:
+        value = await self.local.get(key)
+        if value is not None or self.shared is None:
+            return value
+        value = await self.shared.get(key)
+        if value is not None:
+            await self.local.set(key, value)
+        return value
+
+    async def set(self, key: str, value: Any, ttl_seconds: float | None = None) -> None:
+        await self.local.set(key, value, ttl_seconds)
+        if self.shared is not None:
+            await self.shared.set(key, value, ttl_seconds)
+
+    async def delete(self, key: str) -> None:
+        await self.local.delete(key)
+        if self.shared is not None:
+            await self.shared.delete(key)
+
+
+def build_tiered_cache(prefix: str, *, max_entries: int, ttl_seconds: float) -> TieredCache:
+    """Create a cache that uses Redis as its shared tier when it is configured."""
+    client = get_redis_client()
+    shared = RedisCache(client, prefix, ttl_seconds) if client is not None else None
+    return TieredCache(MemoryCache(max_entries=max_entries, ttl_seconds=ttl_seconds), shared)
@@ -0,0 +1,60 @@
+"""Client latency budgets, carried from the request down to the LLM calls that must fit in them."""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Optional
+
+
+def _margin_seconds() -> float:
+    return float(os.getenv("DEADLINE_MARGIN_SECONDS", "1"))
+
+
+def fast_model_factor() -> float:
+    """Assumed duration of a step on the fast model, as a fraction of its usual duration."""
+    return float(os.getenv("DEADLINE_FAST_MODEL_FACTOR", "0.6"))
+
+
+@dataclass(frozen=True, slots=True)
+class Deadline:
+    """Point on the ``time.monotonic`` clock by which the client needs the result.
+
+    ``estimate`` returns the usual duration of a named step, so the workflow
+    can plan without depending on where the latency statistics live.
+    """
+
+    at: float
+    estimate: Callable[[str], float]
+
+    @classmethod
+    def from_budget(cls, budget_seconds: Optional[float], estimate: Callable[[str], float]) -> Optional["Deadline"]:
+        """Deadline ``budget_seconds`` from now, less ``DEADLINE_MARGIN_SECONDS`` for saving and polling."""
+        if budget_seconds is None:
+            return None
+        return cls(time.monotonic() + budget_seconds - _margin_seconds(), estimate)
+
+    def remaining(self) -> float:
+        return self.at - time.monotonic()
+
+    def fits(self, step: str, factor: float = 1.0) -> bool:
+        return self.estimate(step) * factor <= self.remaining()
+
+
+class DeadlineExceeded(TimeoutError):
+    """Work was cancelled because the client's deadline passed."""
+
+
+async def run_within(deadline: Optional[Deadline], awaitable: Awaitable[Any]) -> Any:
+    """Await ``awaitable``, cancelling it and raising :class:`DeadlineExceeded` once ``deadline`` passes."""
+    scope = asyncio.timeout(None if deadline is None else max(deadline.remaining(), 0.0))
+    try:
+        async with scope:
+            return await awaitable
+    except TimeoutError:
+        # Only our own deadline counts; a provider timeout keeps its meaning.
+        if scope.expired():
+            raise DeadlineExceeded from None
+        raise
@@ -0,0 +1,110 @@
+"""Content negotiation for large task payloads: JSON or msgpack, optionally compressed."""
+
+from __future__ import annotations
+
+import gzip
+import os
+from typing import Any, Mapping
+
+import orjson
+import ormsgpack
+import zstandard
+from fastapi import Request, Response
+from pydantic import BaseModel
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+MSGPACK_MEDIA_TYPES = (MSGPACK_MEDIA_TYPE, "application/x-msgpack", "application/vnd.msgpack")
+# Preferred first when the client weights them equally.
+SUPPORTED_CONTENT_ENCODINGS = ("zstd", "gzip")
+
+
+def compression_min_bytes() -> int:
+    return int(os.getenv("RESPONSE_COMPRESSION_MIN_BYTES", "1024"))
+
+
+def _parse_qualities(header: str | None) -> dict[str, float]:
+    qualities: dict[str, float] = {}
+    for part in (header or "").split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[token] = quality
+    return qualities
+
+
+def negotiate_content_encoding(accept_encoding: str | None) -> str | None:
+    """Pick the best supported ``Content-Encoding`` for an ``Accept-Encoding`` header."""
+    qualities = _parse_qualities(accept_encoding)
+    wildcard = qualities.get("*", 0.0)
+    best: str | None = None
+    best_quality = 0.0
+    for encoding in SUPPORTED_CONTENT_ENCODINGS:
+        quality = qualities.get(encoding, wildcard)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def negotiate_media_type(accept: str | None) -> str:
+    qualities = _parse_qualities(accept)
+    msgpack_quality = max((qualities.get(media, 0.0) for media in MSGPACK_MEDIA_TYPES), default=0.0)
+    if msgpack_quality > qualities.get(JSON_MEDIA_TYPE, 0.0):
+        return MSGPACK_MEDIA_TYPE
+    return JSON_MEDIA_TYPE
+
+
+def encode_body(payload: Any, media_type: str) -> bytes:
+    if media_type == MSGPACK_MEDIA_TYPE:
+        return ormsgpack.packb(payload)
+    return orjson.dumps(payload)
+
+
+def compress_body(body: bytes, content_encoding: str) -> bytes:
+    if content_encoding == "zstd":
+        return zstandard.ZstdCompressor(level=3).compress(body)
+    if content_encoding == "gzip":
+        return gzip.compress(body, compresslevel=6)
+    raise ValueError(f"Unsupported content encoding: {content_encoding}")
+
+
+def _plain(payload: Any) -> Any:
+    if isinstance(payload, BaseModel):
+        return payload.model_dump(mode="json")
+    if isinstance(payload, list):
+        return [_plain(item) for item in payload]
+    return payload
+
+
+def negotiated_response(
+    request: Request,
+    payload: Any,
+    *,
+    status_code: int = 200,
+    headers: Mapping[str, str] | None = None,
+) -> Response:
+    """Serialize ``payload`` in the representation and encoding the client asked for.
+
+    Bodies smaller than ``RESPONSE_COMPRESSION_MIN_BYTES`` are sent uncompressed
+    since the framing overhead outweighs the savings.
+    """
+    media_type = negotiate_media_type(request.headers.get("accept"))
+    body = encode_body(_plain(payload), media_type)
+    response_headers = dict(headers or {})
+    response_headers["Vary"] = "Accept, Accept-Encoding"
+
+    content_encoding = negotiate_content_encoding(request.headers.get("accept-encoding"))
+    if content_encoding is not None and len(body) >= compression_min_bytes():
+        body = compress_body(body, content_encoding)
+        response_headers["Content-Encoding"] = content_encoding
+
+    return Response(content=body, status_code=status_code, media_type=media_type, headers=response_headers)
@@ -0,0 +1,155 @@
+"""Rolling step latencies that tell pollers when a task will next change."""
+
+from __future__ import annotations
+
+import math
+import os
+import statistics
+import time
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Dict, Optional
+
+from . import metrics
+from .storage import TaskRecord
+from .workflow import GLOBAL_PROFILE_STEP, ISSUE_STEP_NAMES, ISSUE_STEPS, ISSUES_RUNNING_STATUS, SINGLE_CALL_STEP
+
+ANALYSIS_STEPS = (GLOBAL_PROFILE_STEP.name, *ISSUE_STEP_NAMES)
+ROUTINE_STEP = "routine"
+ROUTINE_NARRATIVE_STEP = "routine_narrative"
+REANALYSIS_STEP = "reanalysis"
+PARALLEL_ISSUES_STEP = "issues"
+FINALIZING_STEP = "finalizing"
+
+# Task status -> index in ANALYSIS_STEPS of the step now running.
+_RUNNING_STEP = {
+    "queued": 0,
+    "processing": 0,
+    **{step.status: index + 1 for index, step in enumerate((GLOBAL_PROFILE_STEP, *ISSUE_STEPS))},
+}
+# Progress status -> step that just finished.
+_FINISHED_STEP = {step.status: step.name for step in (GLOBAL_PROFILE_STEP, *ISSUE_STEPS)}
+
+
+def _min_retry_seconds() -> float:
+    return float(os.getenv("ETA_MIN_RETRY_SECONDS", "1"))
+
+
+def _max_retry_seconds() -> float:
+    return float(os.getenv("ETA_MAX_RETRY_SECONDS", "15"))
+
+
+def _retry_quantile() -> float:
+    return float(os.getenv("ETA_RETRY_QUANTILE", "0.1"))
+
+
+def _overrun_fraction() -> float:
+    return float(os.getenv("ETA_OVERRUN_FRACTION", "0.25"))
+
+
+@dataclass(slots=True)
+class ProgressHint:
+    current_step: str
+    eta_seconds: Optional[float]
+    retry_after: int
+
+    @property
+    def estimated_completion_at(self) -> Optional[str]:
+        if self.eta_seconds is None:
+            return None
+        return (datetime.now(timezone.utc) + timedelta(seconds=self.eta_seconds)).isoformat()
+
+
+class StepLatencyTracker:
+    """Median of the last ``window`` durations per step, with defaults until samples arrive.
+
+    Statistics are per worker; a worker that has not run a step yet falls back
+    to ``ETA_DEFAULT_STEP_SECONDS`` / ``ETA_DEFAULT_ROUTINE_SECONDS``.
+    """
+
+    def __init__(self, window: int = 50, default_step_seconds: float = 8.0, default_routine_seconds: float = 20.0) -> None:
+        self._window = window
+        # One combined call writes as much as the five steps, minus four round trips.
+        self._defaults = {ROUTINE_STEP: default_routine_seconds, SINGLE_CALL_STEP.name: 2 * default_step_seconds}
+        self._default_step_seconds = default_step_seconds
+        self._samples: Dict[str, deque[float]] = {}
+
+    def record(self, step: str, seconds: float) -> None:
+        samples = self._samples.get(step)
+        if samples is None:
+            samples = self._samples[step] = deque(maxlen=self._window)
+        samples.append(seconds)
+        metrics.observe(f"eta.{step}_seconds", seconds)
+
+    def record_progress(self, status: str, seconds: float) -> None:
+        """Record how long the analysis step that ended with ``status`` took."""
+        step = _FINISHED_STEP.get(status)
+        if step is not None:
+            self.record(step, seconds)
+
+    def expected(self, step: str, quantile: float = 0.5) -> float:
+        """Duration of ``step`` at ``quantile`` of the recent samples (the median by default)."""
+        samples = self._samples.get(step)
+        if samples:
+            ordered = sorted(samples)
+            return ordered[min(len(ordered) - 1, int(quantile * len(ordered)))]
+        if step == REANALYSIS_STEP:
+            return statistics.fmean(self.expected(name, quantile) for name in ISSUE_STEP_NAMES)
+        if step == PARALLEL_ISSUES_STEP:
+            return max(self.expected(name, quantile) for name in ISSUE_STEP_NAMES)
+        return self._defaults.get(step, self._default_step_seconds)
+
+    def _hint(self, step: str, elapsed: float, later_steps: float | None) -> ProgressHint:
+        # Wake when only the fastest runs of this step would be done, so early finishes
+        # are noticed quickly. Past that, poll at a fraction of the step's median, or
+        # at the floor when the step's end is the task's end.
+        wake_in = self.expected(step, _retry_quantile()) - elapsed
+        if wake_in <= 0 and later_steps != 0:
+            wake_in = _overrun_fraction() * self.expected(step)
+        retry_after = min(max(wake_in, _min_retry_seconds()), _max_retry_seconds())
+        eta = None if later_steps is None else round(max(self.expected(step) - elapsed, 0.0) + later_steps, 1)
+        return ProgressHint(current_step=step, eta_seconds=eta, retry_after=math.ceil(retry_after))
+
+    def hint(self, task: TaskRecord, routine_elapsed: float | None = None, now: float | None = None) -> Optional[ProgressHint]:
+        """Progress hint for a task still in flight, or ``None`` once nothing more is coming.
+
+        ``routine_elapsed`` is how long a routine job for the task has been
+        running, if one is; completed analyses are otherwise final.
+        """
+        if task.status == "completed":
+            if routine_elapsed is None or task.routine_json is not None:
+                return None
+            return self._hint(ROUTINE_STEP, routine_elapsed, 0.0)
+
+        elapsed = _since_last_change(task, time.time() if now is None else now)
+        if task.status == "reanalyzing":
+            return self._hint(REANALYSIS_STEP, elapsed, None)
+        if task.status == ISSUES_RUNNING_STATUS:
+            return self._hint(PARALLEL_ISSUES_STEP, elapsed, None)
+        index = _RUNNING_STEP.get(task.status)
+        if index is None:
+            return None
+        # Steps gated off after step 1 take no time.
+        skipped = (task.result or {}).get("skipped_steps") or {}
+        remaining = [name for name in ANALYSIS_STEPS[index:] if name not in skipped]
+        if not remaining:
+            return ProgressHint(current_step=FINALIZING_STEP, eta_seconds=0.0, retry_after=math.ceil(_min_retry_seconds()))
+        later = sum(self.expected(name) for name in remaining[1:])
+        return self._hint(remaining[0], elapsed, later)
+
+
+def _since_last_change(task: TaskRecord, now: float) -> float:
+    entries = task.change_log or []
+    at = entries[-1].get("at") if entries else None
+    return max(now - at, 0.0) if at is not None else 0.0
+
+
+@lru_cache
+def get_latency_tracker() -> StepLatencyTracker:
+    return StepLatencyTracker(
+        window=int(os.getenv("ETA_WINDOW", "50")),
+        default_step_seconds=float(os.getenv("ETA_DEFAULT_STEP_SECONDS", "8")),
+        default_routine_seconds=float(os.getenv("ETA_DEFAULT_ROUTINE_SECONDS", "20")),
+    )
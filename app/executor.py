@@ -0,0 +1,99 @@
+"""Offload CPU-bound helpers from the event loop and watch the loop's responsiveness."""
+
+from __future__ import annotations
+
+import asyncio
+import functools
+import logging
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, Callable, Optional, TypeVar
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+@lru_cache
+def get_offload_executor() -> Optional[Executor]:
+    """Pool configured by ``OFFLOAD_EXECUTOR`` (``thread``, ``process`` or ``inline``)."""
+    kind = os.getenv("OFFLOAD_EXECUTOR", "thread")
+    max_workers = int(os.getenv("OFFLOAD_MAX_WORKERS", str(min(8, (os.cpu_count() or 1) + 2))))
+    if kind == "inline":
+        return None
+    if kind == "process":
+        return ProcessPoolExecutor(max_workers=max_workers)
+    return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="offload")
+
+
+async def offload(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run ``fn`` in the offload pool and await its result.
+
+    With the process pool, ``fn`` and its arguments must be picklable, so only
+    module-level functions should be passed.
+    """
+    executor = get_offload_executor()
+    if executor is None:
+        return fn(*args, **kwargs)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(fn, *args, **kwargs))
+
+
+def shutdown_offload_executor() -> None:
+    executor = get_offload_executor()
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+    get_offload_executor.cache_clear()
+
+
+class LoopLagMonitor:
+    """Samples how late the event loop wakes up from a fixed sleep.
+
+    Lag above ``warn_after`` means some callback held the loop that long, and
+    is logged so the offending code path can be found and offloaded.
+    """
+
+    def __init__(self, interval: float = 0.25, warn_after: float = 0.1) -> None:
+        self._interval = interval
+        self._warn_after = warn_after
+        self._task: Optional[asyncio.Task[None]] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            loop = asyncio.get_running_loop()
+            if os.getenv("LOOP_DEBUG") == "1":
+                # asyncio's own per-callback warnings; costly, so opt-in only.
+                loop.set_debug(True)
+                loop.slow_callback_duration = self._warn_after
+            self._task = loop.create_task(self._run(), name="loop-lag-monitor")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            expected = time.perf_counter() + self._interval
+            await asyncio.sleep(self._interval)
+            lag = max(0.0, time.perf_counter() - expected)
+            metrics.observe("event_loop.lag_seconds", lag)
+            metrics.set_gauge("event_loop.lag_seconds", lag)
+            if lag > self._warn_after:
+                metrics.increment("event_loop.slow_callbacks")
+                logger.warning("Event loop was blocked for %.3fs", lag)
+
+
+_loop_monitor = LoopLagMonitor(
+    interval=float(os.getenv("LOOP_LAG_INTERVAL_SECONDS", "0.25")),
+    warn_after=float(os.getenv("LOOP_LAG_WARN_SECONDS", "0.1")),
+)
+
+
+def get_loop_monitor() -> LoopLagMonitor:
+    return _loop_monitor
@@ -0,0 +1,106 @@
+"""``Idempotency-Key`` support: a retried request gets the first response back instead of new work.
+
+Each key is scoped to the endpoint and the user and remembers a fingerprint
+of the request it first arrived with. While that request is still running
+the key holds a short-lived ``pending`` marker; once it succeeds the marker
+is replaced by the response, kept for ``IDEMPOTENCY_TTL_SECONDS``. Failed
+requests drop their key so the client can retry them.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+from functools import lru_cache
+from typing import Any, Dict, Optional
+
+import orjson
+from fastapi import HTTPException, status
+
+from . import metrics
+from .cache import MemoryCache, RedisCache, get_redis_client
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+COMPLETED = "completed"
+
+
+def idempotency_ttl_seconds() -> float:
+    return float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+
+
+def _pending_ttl_seconds() -> float:
+    # Long enough for a request to finish; short enough that a crashed worker's key frees itself.
+    return float(os.getenv("IDEMPOTENCY_PENDING_TTL_SECONDS", "60"))
+
+
+@lru_cache
+def get_idempotency_store() -> MemoryCache | RedisCache:
+    """Redis when configured, so every worker sees the same keys; otherwise this process only.
+
+    There is no in-process tier in front of Redis: a locally cached ``pending``
+    marker would keep answering 409 after another worker finished the request.
+    """
+    client = get_redis_client()
+    if client is not None:
+        return RedisCache(client, "idempotency", idempotency_ttl_seconds())
+    max_entries = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "10000"))
+    return MemoryCache(max_entries=max_entries, ttl_seconds=idempotency_ttl_seconds())
+
+
+def request_fingerprint(*parts: Any) -> str:
+    """Stable digest of everything that decides what a request does."""
+    return hashlib.sha256(orjson.dumps(parts, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+
+def _storage_key(scope: str, user_id: str, key: str) -> str:
+    return f"{scope}:{user_id}:{key}"
+
+
+def _in_progress() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail="A request with this Idempotency-Key is still in progress.",
+        headers={"Retry-After": "1"},
+    )
+
+
+async def begin(scope: str, user_id: str, key: str, fingerprint: str) -> Optional[Dict[str, Any]]:
+    """Reserve ``key`` for this request, or return the stored response of the one it repeats.
+
+    Raises ``422`` when the key was used with a different request and ``409``
+    while the first request is still running.
+    """
+    store = get_idempotency_store()
+    storage_key = _storage_key(scope, user_id, key)
+    for _ in range(2):
+        if await store.add(storage_key, {"state": PENDING, "fingerprint": fingerprint}, _pending_ttl_seconds()):
+            return None
+        record = await store.get(storage_key)
+        if record is None:
+            continue  # expired between the two calls
+        if record["fingerprint"] != fingerprint:
+            metrics.increment("idempotency.conflicts")
+            raise HTTPException(
+                status_code=422,
+                detail="Idempotency-Key was already used with a different request.",
+            )
+        if record["state"] == PENDING:
+            raise _in_progress()
+        metrics.increment("idempotency.replays")
+        return record["response"]
+    raise _in_progress()
+
+
+async def complete(scope: str, user_id: str, key: str, fingerprint: str, response: Dict[str, Any]) -> None:
+    """Store the successful ``response`` for replays of ``key``."""
+    record = {"state": COMPLETED, "fingerprint": fingerprint, "response": response}
+    await get_idempotency_store().set(_storage_key(scope, user_id, key), record)
+
+
+async def abandon(scope: str, user_id: str, key: str) -> None:
+    """Free ``key`` after a failed request so a retry runs it again."""
+    await get_idempotency_store().delete(_storage_key(scope, user_id, key))
+    logger.info("Released idempotency key for %s after a failed request", scope)
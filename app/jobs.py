@@ -0,0 +1,112 @@
+"""Registry of in-flight background jobs so they can be cancelled or drained."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Coroutine, Dict, Literal, Optional
+
+logger = logging.getLogger(__name__)
+
+JobKind = Literal["analysis", "routine", "reanalysis"]
+CancelReason = Literal["user", "superseded", "shutdown"]
+
+
+@dataclass(slots=True)
+class RunningJob:
+    task_id: str
+    user_id: str
+    kind: JobKind
+    task: asyncio.Task[Any]
+    started_at: float = field(default_factory=time.monotonic)
+    cancel_reason: Optional[CancelReason] = None
+
+
+class JobRegistry:
+    """Tracks the asyncio task behind every running analysis, reanalysis or routine job."""
+
+    def __init__(self) -> None:
+        self._jobs: Dict[tuple[str, JobKind], RunningJob] = {}
+
+    def __len__(self) -> int:
+        return len(self._jobs)
+
+    def start(self, task_id: str, user_id: str, kind: JobKind, coro: Coroutine[Any, Any, Any]) -> asyncio.Task[Any]:
+        """Run ``coro`` as the ``kind`` job of ``task_id``.
+
+        Raises ``RuntimeError`` while an earlier job of the same kind is still
+        running for the task: callers cancel it first (or answer 409), since
+        replacing the entry would leave it running where nothing can cancel it.
+        """
+        key = (task_id, kind)
+        existing = self._jobs.get(key)
+        if existing is not None and not existing.task.done():
+            coro.close()
+            raise RuntimeError(f"A {kind} job is already running for task {task_id}.")
+        task = asyncio.create_task(coro, name=f"{kind}:{task_id}")
+        job = RunningJob(task_id=task_id, user_id=user_id, kind=kind, task=task)
+        self._jobs[key] = job
+
+        def _forget(_: asyncio.Task[Any]) -> None:
+            if self._jobs.get(key) is job:
+                del self._jobs[key]
+
+        task.add_done_callback(_forget)
+        return task
+
+    def running(self) -> list[RunningJob]:
+        return list(self._jobs.values())
+
+    def get(self, task_id: str, kind: JobKind) -> Optional[RunningJob]:
+        return self._jobs.get((task_id, kind))
+
+    def for_task(self, task_id: str) -> list[RunningJob]:
+        return [job for (job_task_id, _), job in self._jobs.items() if job_task_id == task_id]
+
+    def for_user(self, user_id: str, kind: Optional[JobKind] = None) -> list[RunningJob]:
+        return [job for job in self._jobs.values() if job.user_id == user_id and (kind is None or job.kind == kind)]
+
+    def cancel_reason(self, task_id: str, kind: JobKind) -> Optional[CancelReason]:
+        job = self.get(task_id, kind)
+        return job.cancel_reason if job is not None else None
+
+    def cancel(self, job: RunningJob, reason: CancelReason) -> None:
+        if job.task.done():
+            return
+        job.cancel_reason = reason
+        job.task.cancel()
+
+    async def cancel_and_wait(self, jobs: list[RunningJob], reason: CancelReason, timeout: float = 10) -> None:
+        for job in jobs:
+            self.cancel(job, reason)
+        pending = [job.task for job in jobs if not job.task.done()]
+        if pending:
+            await asyncio.wait(pending, timeout=timeout)
+
+    async def shutdown(self, drain_timeout: Optional[float] = None) -> None:
+        """Let running jobs finish for up to ``drain_timeout`` seconds, then checkpoint the rest.
+
+        Jobs cancelled here see the ``shutdown`` reason and persist their latest
+        progress as ``interrupted`` instead of being silently dropped.
+        """
+        if drain_timeout is None:
+            drain_timeout = float(os.getenv("SHUTDOWN_DRAIN_SECONDS", "20"))
+        running = list(self._jobs.values())
+        if not running:
+            return
+        logger.info("Draining %d running jobs (timeout %.0fs)", len(running), drain_timeout)
+        await asyncio.wait([job.task for job in running], timeout=drain_timeout)
+        leftovers = [job for job in running if not job.task.done()]
+        if leftovers:
+            logger.warning("Checkpointing %d jobs that did not finish before shutdown", len(leftovers))
+            await self.cancel_and_wait(leftovers, "shutdown")
+
+
+_registry = JobRegistry()
+
+
+def get_job_registry() -> JobRegistry:
+    return _registry
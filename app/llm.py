@@ -2,44 +2,249 @@
 
 from __future__ import annotations
 
+import asyncio
 import base64
+import logging
 import os
 import json
+import time
+from dataclasses import dataclass, field
 from functools import lru_cache
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Type
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple, Type
 
+import httpx
+import openai
 from dotenv import load_dotenv
+from langchain_core.runnables import Runnable
 from langchain_openai import ChatOpenAI
 from pydantic import BaseModel
 
-from .schemas import FaceAnalysisResult
+from . import metrics
+from .ratelimit import record_llm_usage
+from .scheduler import Priority, get_llm_scheduler
+from .schemas import (
+    AcneRednessIssuesResult,
+    AgingIssuesResult,
+    CombinedAnalysisResult,
+    FaceAnalysisResult,
+    GlobalProfileResult,
+    PigmentationIssuesResult,
+    RoutineNarrative,
+    RoutinePlan,
+    TextureIssuesResult,
+)
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 PROMPT_PATH = Path(__file__).resolve().parent.parent / "docs" / "prompt.md"
 
+# Every schema the app asks the model for; compiled once during warm-up.
+STRUCTURED_SCHEMAS: tuple[Type[BaseModel], ...] = (
+    FaceAnalysisResult,
+    GlobalProfileResult,
+    TextureIssuesResult,
+    PigmentationIssuesResult,
+    AcneRednessIssuesResult,
+    AgingIssuesResult,
+    CombinedAnalysisResult,
+    RoutinePlan,
+    RoutineNarrative,
+)
+STREAMING_SCHEMAS: tuple[Type[BaseModel], ...] = (RoutinePlan,)
+
+_structured_models: Dict[tuple[Type[BaseModel], Optional[str]], Runnable] = {}
+_json_stream_models: Dict[Type[BaseModel], Runnable] = {}
+
 
 @lru_cache
 def load_prompt() -> str:
     return PROMPT_PATH.read_text(encoding="utf-8")
 
 
+def _model_name() -> str:
+    return os.getenv("OPENROUTER_MODEL", "meta-llama/Meta-Llama-3.1-70B-Instruct")
+
+
+def fast_model_name() -> Optional[str]:
+    """Cheaper model for low-stakes calls, if ``OPENROUTER_FAST_MODEL`` is set."""
+    return os.getenv("OPENROUTER_FAST_MODEL") or None
+
+
 @lru_cache
-def _get_chat_model() -> ChatOpenAI:
+def _get_chat_model(model_name: Optional[str] = None) -> ChatOpenAI:
     return ChatOpenAI(
         api_key=os.getenv("OPENROUTER_API_KEY"),
         base_url="https://openrouter.ai/api/v1",
-        model=os.getenv("OPENROUTER_MODEL", "meta-llama/Meta-Llama-3.1-70B-Instruct"),
+        model=model_name or _model_name(),
+        stream_usage=True,
     )
 
 
+# OpenRouter forwards explicit cache breakpoints to these providers; OpenAI-style
+# providers cache identical prefixes automatically and need no hint.
+_CACHE_CONTROL_MODEL_PREFIXES = ("anthropic/", "google/gemini")
+
+
+@lru_cache
+def supports_cache_control() -> bool:
+    override = os.getenv("LLM_CACHE_CONTROL")
+    if override is not None:
+        return override == "1"
+    return _model_name().startswith(_CACHE_CONTROL_MODEL_PREFIXES)
+
+
+def cacheable_text_block(text: str) -> Dict[str, Any]:
+    """Text content block marking the end of a static, cacheable prompt prefix."""
+    block: Dict[str, Any] = {"type": "text", "text": text}
+    if supports_cache_control():
+        block["cache_control"] = {"type": "ephemeral"}
+    return block
+
+
+async def record_usage(label: str, usage: Optional[Dict[str, Any]]) -> None:
+    """Add a response's token usage to the metrics and charge it to the user's quota."""
+    if not usage:
+        return
+    input_tokens = usage.get("input_tokens") or 0
+    cached_tokens = (usage.get("input_token_details") or {}).get("cache_read") or 0
+    output_tokens = usage.get("output_tokens") or 0
+    for prefix in ("llm", f"llm.{label}"):
+        metrics.increment(f"{prefix}.calls")
+        metrics.increment(f"{prefix}.input_tokens", input_tokens)
+        metrics.increment(f"{prefix}.cached_input_tokens", cached_tokens)
+        metrics.increment(f"{prefix}.output_tokens", output_tokens)
+    total_input = metrics.get_counter("llm.input_tokens")
+    if total_input:
+        metrics.set_gauge("llm.prompt_cache_hit_rate", metrics.get_counter("llm.cached_input_tokens") / total_input)
+    await record_llm_usage(1, input_tokens + output_tokens)
+
+
 def get_chat_model() -> ChatOpenAI:
     return _get_chat_model()
 
 
-def get_structured_model(output_schema: Type[BaseModel] = FaceAnalysisResult):
-    return _get_chat_model().with_structured_output(output_schema)
+def get_structured_model(output_schema: Type[BaseModel] = FaceAnalysisResult, model_name: Optional[str] = None) -> Runnable:
+    """Return the structured-output runnable for ``output_schema``, compiling it once per model."""
+    model = _structured_models.get((output_schema, model_name))
+    if model is None:
+        model = _structured_models[(output_schema, model_name)] = _get_chat_model(model_name).with_structured_output(
+            output_schema,
+            include_raw=True,
+        )
+    return model
+
+
+async def invoke_structured(
+    output_schema: Type[BaseModel],
+    messages: List[Dict[str, Any]] | Callable[[], Awaitable[List[Dict[str, Any]]]],
+    *,
+    priority: Optional[Priority] = None,
+    model_name: Optional[str] = None,
+) -> Any:
+    """Run the structured model for ``output_schema``, record usage and return the parsed result.
+
+    The call waits for a slot from the shared LLM scheduler first; ``priority``
+    defaults to the one bound to the current context. ``messages`` may be an
+    async factory, which is only called once the slot is granted so large
+    payloads are not held in memory while queued. ``model_name`` overrides
+    ``OPENROUTER_MODEL`` for this call.
+    """
+    async with get_llm_scheduler().slot(priority):
+        if callable(messages):
+            messages = await messages()
+        output = await get_structured_model(output_schema, model_name).ainvoke(messages)
+    raw = output.get("raw")
+    await record_usage(output_schema.__name__, getattr(raw, "usage_metadata", None))
+    if output.get("parsing_error") is not None:
+        raise output["parsing_error"]
+    return output["parsed"]
+
+
+def get_json_stream_model(output_schema: Type[BaseModel]) -> Runnable:
+    """Chat model constrained to ``output_schema`` whose raw JSON text can be streamed.
+
+    Unlike :func:`get_structured_model` nothing is parsed here; callers consume
+    ``astream`` chunks and validate the final document themselves.
+    """
+    model = _json_stream_models.get(output_schema)
+    if model is None:
+        model = _json_stream_models[output_schema] = _get_chat_model().bind(
+            response_format={
+                "type": "json_schema",
+                "json_schema": {
+                    "name": output_schema.__name__,
+                    "schema": output_schema.model_json_schema(),
+                    "strict": False,
+                },
+            }
+        )
+    return model
+
+
+@dataclass(slots=True)
+class WarmupState:
+    duration_seconds: Optional[float] = None
+    errors: Dict[str, str] = field(default_factory=dict)
+
+
+_warmup_state = WarmupState()
+
+
+def get_warmup_state() -> WarmupState:
+    return _warmup_state
+
+
+async def _prewarm_connection(timeout: float) -> None:
+    """Open the pooled HTTPS connection to the provider before the first user call."""
+    client = _get_chat_model().root_async_client.with_options(max_retries=0, timeout=timeout)
+    try:
+        await client.get("/key", cast_to=httpx.Response)
+    except openai.APIStatusError:
+        # Any HTTP answer means DNS, TCP and TLS are already done, which is the point.
+        pass
+
+
+async def warm_up() -> WarmupState:
+    """Load prompts, compile every structured runnable and pre-connect to the provider.
+
+    Failures are logged and recorded on the returned state rather than raised,
+    so a worker without credentials can still start and fail per request.
+    """
+    state = _warmup_state
+    if os.getenv("LLM_WARMUP", "1") == "0":
+        return state
+
+    started = time.perf_counter()
+    steps = {
+        "prompts": load_prompt,
+        "structured_models": lambda: [get_structured_model(schema) for schema in STRUCTURED_SCHEMAS]
+        + [get_json_stream_model(schema) for schema in STREAMING_SCHEMAS],
+    }
+    for name, step in steps.items():
+        step_started = time.perf_counter()
+        try:
+            step()
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("Warm-up step %s failed: %s", name, exc)
+            state.errors[name] = str(exc)
+        metrics.observe(f"startup.warmup.{name}_seconds", time.perf_counter() - step_started)
+
+    if "structured_models" not in state.errors:
+        step_started = time.perf_counter()
+        timeout = float(os.getenv("LLM_WARMUP_TIMEOUT_SECONDS", "5"))
+        try:
+            await asyncio.wait_for(_prewarm_connection(timeout), timeout=timeout)
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("Warm-up connection to the LLM provider failed: %s", exc)
+            state.errors["connection"] = str(exc) or type(exc).__name__
+        metrics.observe("startup.warmup.connection_seconds", time.perf_counter() - step_started)
+
+    state.duration_seconds = time.perf_counter() - started
+    metrics.observe("startup.warmup_seconds", state.duration_seconds)
+    return state
 
 
 def _encode_image(image_bytes: bytes, mime_type: str) -> Dict[str, Any]:
@@ -60,6 +265,46 @@ def build_multistep_user_message(
     previous_results: Optional[Dict[str, Any]] = None,
     real_age: Optional[int] = None,
 ) -> List[Dict[str, Any]]:
+    """Build a step message whose leading blocks are shared by every step of a task.
+
+    The image comes first and is closed by a cache breakpoint so steps 2-5 can
+    reuse the provider's cached prefix; step instructions and the growing
+    ``previous_results`` follow as the dynamic suffix.
+    """
+    return [
+        _encode_image(image_bytes, mime_type),
+        cacheable_text_block("The selfie to analyze is attached above."),
+        {"type": "text", "text": _step_text(instructions, previous_results, real_age)},
+    ]
+
+
+def build_tiled_user_message(
+    tiles: Sequence[Tuple[str, Sequence[str], bytes, str]],
+    instructions: str,
+    previous_results: Optional[Dict[str, Any]] = None,
+    real_age: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """Like :func:`build_multistep_user_message`, with crops of the selfie instead of the whole image.
+
+    ``tiles`` are ``(name, regions, image_bytes, mime_type)``; each crop is
+    captioned with the ML Kit regions it shows so findings keep using those
+    identifiers. Steps sending the same crops still share a cacheable prefix.
+    """
+    content: List[Dict[str, Any]] = []
+    for name, regions, image_bytes, mime_type in tiles:
+        content.append({"type": "text", "text": f"Crop `{name}` showing regions: {', '.join(regions)}."})
+        content.append(_encode_image(image_bytes, mime_type))
+    content.append(
+        cacheable_text_block(
+            "The crops above come from one selfie. Report each issue under the ML Kit region"
+            " it lies in, using only the regions listed for the crops."
+        )
+    )
+    content.append({"type": "text", "text": _step_text(instructions, previous_results, real_age)})
+    return content
+
+
+def _step_text(instructions: str, previous_results: Optional[Dict[str, Any]], real_age: Optional[int]) -> str:
     sections: list[str] = [instructions.strip()]
     if real_age is not None:
         sections.append(f"Reported real_age: {real_age}")
@@ -69,5 +314,4 @@ def build_multistep_user_message(
             + json.dumps(previous_results, ensure_ascii=False)
             + "\n```"
         )
-    text_block = "\n\n".join(sections)
-    return [{"type": "text", "text": text_block}, _encode_image(image_bytes, mime_type)]
+    return "\n\n".join(sections)
@@ -2,15 +2,56 @@
 
 from __future__ import annotations
 
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
 from fastapi import FastAPI, Request
 
+from . import metrics
+from .blobs import get_blob_store
+from .executor import get_loop_monitor, shutdown_offload_executor
+from .jobs import get_job_registry
+from .llm import warm_up
 from .routes import router
+from .storage import get_task_repository, get_trend_repository
+
+_IMPORTED_AT = time.perf_counter()
+
+
+@asynccontextmanager
+async def lifespan(application: FastAPI) -> AsyncIterator[None]:
+    """Warm the LLM clients before serving; drain running jobs and state write-backs on shutdown."""
+    await warm_up()
+    metrics.observe("startup.cold_start_seconds", time.perf_counter() - _IMPORTED_AT)
+    get_loop_monitor().start()
+    yield
+    await get_job_registry().shutdown()
+    # Flushes pending state write-backs, then closes the store's connections.
+    await get_task_repository().aclose()
+    await get_trend_repository().aclose()
+    await get_loop_monitor().stop()
+    shutdown_offload_executor()
+    get_blob_store().close()
 
 
 def create_app() -> FastAPI:
     """Create and configure the FastAPI application."""
-    application = FastAPI(title="ff-backend", version="0.1.0")
+    application = FastAPI(title="ff-backend", version="0.1.0", lifespan=lifespan)
     application.include_router(router)
+    first_request_seen = False
+
+    @application.middleware("http")
+    async def record_first_request(request: Request, call_next):  # noqa: D401
+        """Record how long the first request served by this worker took."""
+        nonlocal first_request_seen
+        if first_request_seen:
+            return await call_next(request)
+        first_request_seen = True
+        started = time.perf_counter()
+        response = await call_next(request)
+        metrics.observe("http.first_request_seconds", time.perf_counter() - started)
+        return response
 
     @application.middleware("http")
     async def log_recommend_payload(request: Request, call_next):  # noqa: D401
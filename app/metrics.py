@@ -0,0 +1,89 @@
+"""In-process metrics registry exposed through ``GET /metrics``."""
+
+from __future__ import annotations
+
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator
+
+
+@dataclass(slots=True)
+class _Summary:
+    count: int = 0
+    total: float = 0.0
+    min: float = float("inf")
+    max: float = float("-inf")
+    recent: deque[float] = field(default_factory=lambda: deque(maxlen=512))
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        self.recent.append(value)
+
+    def snapshot(self) -> Dict[str, Any]:
+        ordered = sorted(self.recent)
+
+        def _quantile(q: float) -> float:
+            return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+        return {
+            "count": self.count,
+            "mean": self.total / self.count,
+            "min": self.min,
+            "max": self.max,
+            "p50": _quantile(0.5),
+            "p95": _quantile(0.95),
+        }
+
+
+_summaries: Dict[str, _Summary] = {}
+_counters: Dict[str, float] = {}
+_gauges: Dict[str, float] = {}
+
+
+def observe(name: str, value: float) -> None:
+    """Record one sample (usually seconds or bytes) for a summary metric."""
+    summary = _summaries.get(name)
+    if summary is None:
+        summary = _summaries[name] = _Summary()
+    summary.observe(value)
+
+
+def increment(name: str, amount: float = 1) -> None:
+    _counters[name] = _counters.get(name, 0) + amount
+
+
+def get_counter(name: str) -> float:
+    return _counters.get(name, 0)
+
+
+def set_gauge(name: str, value: float) -> None:
+    _gauges[name] = value
+
+
+@contextmanager
+def timer(name: str) -> Iterator[None]:
+    """Observe the wall-clock duration of the wrapped block under ``name``."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started)
+
+
+def snapshot() -> Dict[str, Any]:
+    return {
+        "counters": dict(_counters),
+        "gauges": dict(_gauges),
+        "summaries": {name: summary.snapshot() for name, summary in _summaries.items()},
+    }
+
+
+def reset() -> None:
+    _summaries.clear()
+    _counters.clear()
+    _gauges.clear()
@@ -0,0 +1,194 @@
+"""On-demand diagnostics for a live worker: CPU samples, allocation diffs and asyncio task dumps.
+
+Nothing here runs until an admin asks for it. The sampler thread exists only
+for the length of one profile, and tracemalloc is off unless started.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from dataclasses import dataclass
+from types import FrameType
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+_profile_lock = threading.Lock()
+_tracemalloc_baseline: Optional[tracemalloc.Snapshot] = None
+# Allocations made by the diagnostics themselves are noise in a diff.
+_TRACEMALLOC_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+def max_profile_seconds() -> float:
+    return float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+
+
+class ProfilerBusy(RuntimeError):
+    """Another CPU profile is already running in this worker."""
+
+
+def _short_path(filename: str) -> str:
+    return "/".join(filename.replace("\\", "/").rsplit("/", 2)[-2:])
+
+
+def _frame_label(frame: FrameType) -> str:
+    # The function's first line, not the current one, so samples in one function merge.
+    code = frame.f_code
+    return f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _collapse(frame: Optional[FrameType], thread_name: str) -> str:
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join([thread_name, *reversed(labels)])
+
+
+def sample_cpu(seconds: float, interval: float = 0.005) -> Counter[str]:
+    """Sample every thread's stack for ``seconds`` and count identical stacks.
+
+    Blocks the calling thread, so run it in a worker thread. Only one profile
+    runs at a time; a second call raises :class:`ProfilerBusy`. Offloaded
+    work in a process pool is not visible from here.
+    """
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusy("A CPU profile is already running.")
+    try:
+        me = threading.get_ident()
+        stacks: Counter[str] = Counter()
+        deadline = time.monotonic() + min(seconds, max_profile_seconds())
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident != me:
+                    stacks[_collapse(frame, names.get(ident, f"thread-{ident}"))] += 1
+            time.sleep(interval)
+        return stacks
+    finally:
+        _profile_lock.release()
+
+
+def format_collapsed(stacks: Counter[str]) -> str:
+    """``stack count`` lines, the input format of flamegraph.pl, speedscope and inferno."""
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+def start_tracemalloc(frames: int = 10) -> Dict[str, Any]:
+    """Start tracing (if needed) and take the snapshot later diffs are compared with."""
+    global _tracemalloc_baseline
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+        logger.info("tracemalloc started with %d frames", frames)
+    _tracemalloc_baseline = tracemalloc.take_snapshot().filter_traces(_TRACEMALLOC_FILTERS)
+    return tracemalloc_status()
+
+
+def stop_tracemalloc() -> Dict[str, Any]:
+    global _tracemalloc_baseline
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+        logger.info("tracemalloc stopped")
+    _tracemalloc_baseline = None
+    return tracemalloc_status()
+
+
+def tracemalloc_status() -> Dict[str, Any]:
+    tracing = tracemalloc.is_tracing()
+    current, peak = tracemalloc.get_traced_memory() if tracing else (0, 0)
+    return {
+        "tracing": tracing,
+        "frames": tracemalloc.get_traceback_limit() if tracing else 0,
+        "traced_bytes": current,
+        "peak_traced_bytes": peak,
+    }
+
+
+def top_allocation_diffs(limit: int = 25, group_by: str = "lineno", reset: bool = False) -> list[Dict[str, Any]]:
+    """Largest allocation changes since the baseline snapshot, biggest growth first.
+
+    ``reset`` makes the current snapshot the new baseline, so repeated calls
+    show what grew between them. Raises ``RuntimeError`` when not tracing.
+    """
+    global _tracemalloc_baseline
+    if not tracemalloc.is_tracing() or _tracemalloc_baseline is None:
+        raise RuntimeError("tracemalloc is not running; start it first.")
+    snapshot = tracemalloc.take_snapshot().filter_traces(_TRACEMALLOC_FILTERS)
+    diffs = snapshot.compare_to(_tracemalloc_baseline, group_by)
+    if reset:
+        _tracemalloc_baseline = snapshot
+    return [
+        {
+            "location": [str(frame) for frame in diff.traceback] if group_by == "traceback" else str(diff.traceback[0]),
+            "size_diff": diff.size_diff,
+            "size": diff.size,
+            "count_diff": diff.count_diff,
+            "count": diff.count,
+        }
+        for diff in diffs[:limit]
+    ]
+
+
+@dataclass(slots=True)
+class TaskDump:
+    name: str
+    coroutine: str
+    state: str
+    awaiting: Optional[str]
+    stack: list[str]
+    job_age_seconds: Optional[float] = None
+
+
+def _await_chain(coro: Any, limit: int) -> tuple[list[str], Optional[str]]:
+    """Frames of a suspended coroutine and those it awaits, outermost first, and what the last one waits on."""
+    stack: list[str] = []
+    awaited = coro
+    while awaited is not None and len(stack) < limit:
+        frame = getattr(awaited, "cr_frame", None) or getattr(awaited, "gi_frame", None) or getattr(awaited, "ag_frame", None)
+        if frame is None:
+            break
+        stack.append(f"{frame.f_code.co_name} ({_short_path(frame.f_code.co_filename)}:{frame.f_lineno})")
+        awaited = getattr(awaited, "cr_await", None) or getattr(awaited, "gi_yieldfrom", None) or getattr(awaited, "ag_await", None)
+    return stack, repr(awaited) if awaited is not None else None
+
+
+def dump_tasks(job_started: Optional[Dict[asyncio.Task[Any], float]] = None, stack_limit: int = 20) -> list[TaskDump]:
+    """Every live asyncio task of the running loop, oldest job first.
+
+    ``job_started`` maps registry tasks to their ``time.monotonic`` start so
+    stuck jobs show their age.
+    """
+    job_started = job_started or {}
+    now = time.monotonic()
+    dumps = []
+    for task in asyncio.all_tasks():
+        coro = task.get_coro()
+        started = job_started.get(task)
+        stack, awaiting = _await_chain(coro, stack_limit)
+        # Awaiting a future shows up as an opaque iterator; the task knows the future itself.
+        waiter = getattr(task, "_fut_waiter", None)
+        if waiter is not None:
+            awaiting = repr(waiter)
+        dumps.append(
+            TaskDump(
+                name=task.get_name(),
+                coroutine=getattr(coro, "__qualname__", repr(coro)),
+                state="cancelling" if task.cancelling() else "done" if task.done() else "pending",
+                awaiting=awaiting,
+                stack=stack,
+                job_age_seconds=round(now - started, 3) if started is not None else None,
+            )
+        )
+    return sorted(dumps, key=lambda dump: (dump.job_age_seconds is None, -(dump.job_age_seconds or 0), dump.name))
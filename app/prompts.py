@@ -3,6 +3,8 @@ from __future__ import annotations
 import json
 from typing import Any, Dict, List
 
+from .llm import cacheable_text_block
+
 
 PRODUCTS = '''PRODUCT DATABASE
 
@@ -58,14 +60,9 @@ NEVER invent products. Use only items from the provided Product DB.
 Return VALID JSON only. Follow the output schema exactly."""
 
 
-ROUTINE_USER_PROMPT = """## INPUTS
-### A) Skin Analysis JSON
-{SKIN_ANALYSIS_JSON}
-
-### B) Intake JSON (any field may be missing or "unsure")
-{FORM_JSON}
-
-### C) Product DB (FULL; only use these items)
+# Static half of the routine prompt. It never changes between requests, so it is
+# sent first (right after the system prompt) where providers can cache it.
+ROUTINE_REFERENCE_PROMPT = """## Product DB (FULL; only use these items)
 {PRODUCT_TABLE}
 
 ## RULES (APPLY SILENTLY)
@@ -91,6 +88,16 @@ ROUTINE_USER_PROMPT = """## INPUTS
    - For each step: short "how", "frequency", "timing". Include SPF reminders (15 min before sun; reapply every 2 hours outdoors).
 7) Output:
    - Return a single JSON object matching the schema below. If a step is unsafe/disabled, simply omit it. If midday is not relevant, omit "midday".
+"""
+
+
+# Per-request half of the routine prompt, always sent after the static prefix.
+ROUTINE_USER_PROMPT = """## INPUTS
+### A) Skin Analysis JSON
+{SKIN_ANALYSIS_JSON}
+
+### B) Intake JSON (any field may be missing or "unsure")
+{FORM_JSON}
 
 ---
 Return JSON only.
@@ -150,14 +157,56 @@ def _json_block(payload: Dict[str, Any] | None) -> str:
     return json.dumps(payload or {}, ensure_ascii=False, indent=2)
 
 
-def build_routine_prompt_messages(analysis: Dict[str, Any], intake: Dict[str, Any]) -> List[Dict[str, str]]:
+ROUTINE_STATIC_PREFIX = ROUTINE_SYSTEM_PROMPT + "\n\n" + ROUTINE_REFERENCE_PROMPT.replace("{PRODUCT_TABLE}", PRODUCTS)
+
+
+ROUTINE_NARRATIVE_SYSTEM_PROMPT = """You are a skincare coach. The routine below was already chosen by fixed rules.
+Do NOT change, add or remove products, steps or concerns; only explain them.
+Write short, friendly English. Return VALID JSON only."""
+
+
+ROUTINE_NARRATIVE_USER_PROMPT = """## Routine (fixed)
+{ROUTINE_JSON}
+
+## Skin profile
+{PROFILE_JSON}
+
+## Intake
+{FORM_JSON}
+
+---
+Return JSON with:
+- product_why: one {"key": <exact product name>, "text": <one sentence on why it suits this person>} per product
+- concern_why: one {"key": <concern key>, "text": <one sentence grounded in the profile>} per prioritized concern
+- notes: 1-2 sentences on how to start the routine
+- lifestyle: sleep, stress, sun, habits, routine_hygiene, diet {increase, limit, supplements}; no supplements if pregnant or unsure
+"""
+
+
+def build_routine_narrative_messages(
+    routine: Dict[str, Any], analysis: Dict[str, Any], intake: Dict[str, Any]
+) -> List[Dict[str, Any]]:
+    """Messages asking for the explanatory text of a rule-built routine."""
+    user_prompt = (
+        ROUTINE_NARRATIVE_USER_PROMPT
+        .replace("{ROUTINE_JSON}", _json_block(routine))
+        .replace("{PROFILE_JSON}", _json_block(analysis.get("global_profile")))
+        .replace("{FORM_JSON}", _json_block(intake))
+    )
+    return [
+        {"role": "system", "content": [cacheable_text_block(ROUTINE_NARRATIVE_SYSTEM_PROMPT)]},
+        {"role": "user", "content": user_prompt},
+    ]
+
+
+def build_routine_prompt_messages(analysis: Dict[str, Any], intake: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Build routine messages as a byte-identical static prefix plus a dynamic suffix."""
     user_prompt = (
         ROUTINE_USER_PROMPT
         .replace("{SKIN_ANALYSIS_JSON}", _json_block(analysis))
         .replace("{FORM_JSON}", _json_block(intake))
-        .replace("{PRODUCT_TABLE}", PRODUCTS)
     )
     return [
-        {"role": "system", "content": ROUTINE_SYSTEM_PROMPT},
+        {"role": "system", "content": [cacheable_text_block(ROUTINE_STATIC_PREFIX)]},
         {"role": "user", "content": user_prompt},
     ]
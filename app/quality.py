@@ -0,0 +1,108 @@
+"""Fast local checks that turn away unusable selfies before any LLM call."""
+
+from __future__ import annotations
+
+import io
+import os
+from dataclasses import dataclass, field
+from typing import Any, BinaryIO, Dict, Optional
+
+import numpy as np
+from PIL import Image, UnidentifiedImageError
+
+from .blobs import BlobRef
+
+# Checks run on a copy no larger than this; decoding JPEGs straight to it is much cheaper.
+_ANALYSIS_SIDE = 512
+# Classic YCbCr skin-tone box, used as a cheap stand-in for face detection.
+_SKIN_CB = (77, 127)
+_SKIN_CR = (133, 173)
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.getenv(name, str(default)))
+
+
+@dataclass(slots=True)
+class QualityReport:
+    """Outcome of :func:`assess_image`; ``reason`` is a stable code when the image is rejected."""
+
+    reason: Optional[str] = None
+    message: Optional[str] = None
+    measurements: Dict[str, float] = field(default_factory=dict)
+
+    @property
+    def passed(self) -> bool:
+        return self.reason is None
+
+    def to_detail(self) -> Dict[str, Any]:
+        return {"reason": self.reason, "message": self.message, "measurements": self.measurements}
+
+
+def quality_gate_enabled() -> bool:
+    return os.getenv("QUALITY_GATE", "1") != "0"
+
+
+def assess_image(data: bytes) -> QualityReport:
+    """Decode the image and check resolution, aspect ratio, exposure, sharpness and skin presence.
+
+    Pure CPU work on a downscaled luma/chroma copy; call it through ``offload``.
+    """
+    return _assess(io.BytesIO(data))
+
+
+def assess_blob(ref: BlobRef) -> QualityReport:
+    """:func:`assess_image` on a stored blob; the reference is cheap to send to a pool worker."""
+    return _assess(ref.path)
+
+
+def _assess(source: str | BinaryIO) -> QualityReport:
+    try:
+        with Image.open(source) as image:
+            width, height = image.size
+            image.draft("YCbCr", (_ANALYSIS_SIDE, _ANALYSIS_SIDE))
+            small = image.convert("YCbCr")
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, ValueError):
+        return QualityReport("unreadable_image", "The file could not be decoded as an image.")
+    small.thumbnail((_ANALYSIS_SIDE, _ANALYSIS_SIDE))
+    pixels = np.asarray(small, dtype=np.float32)
+    luma = pixels[..., 0]
+
+    laplacian = 4 * luma[1:-1, 1:-1] - luma[:-2, 1:-1] - luma[2:, 1:-1] - luma[1:-1, :-2] - luma[1:-1, 2:]
+    histogram = np.bincount(luma.astype(np.uint8).ravel(), minlength=256) / luma.size
+    rows, cols = luma.shape
+    center = pixels[rows // 4 : rows - rows // 4, cols // 4 : cols - cols // 4]
+    cb, cr = center[..., 1], center[..., 2]
+    skin = (cb >= _SKIN_CB[0]) & (cb <= _SKIN_CB[1]) & (cr >= _SKIN_CR[0]) & (cr <= _SKIN_CR[1])
+
+    measurements = {
+        "width": float(width),
+        "height": float(height),
+        "sharpness": round(float(laplacian.var()), 2) if laplacian.size else 0.0,
+        "brightness": round(float(luma.mean()), 2),
+        "dark_fraction": round(float(histogram[:30].sum()), 4),
+        "clipped_fraction": round(float(histogram[236:].sum()), 4),
+        "skin_fraction": round(float(skin.mean()), 4) if skin.size else 0.0,
+    }
+
+    def _reject(reason: str, message: str) -> QualityReport:
+        return QualityReport(reason, message, measurements)
+
+    min_side = _env_float("QUALITY_MIN_SIDE", 160)
+    if min(width, height) < min_side:
+        return _reject("too_small", f"The image is {width}x{height}; the shorter side must be at least {min_side:g} px.")
+    if max(width, height) / min(width, height) > _env_float("QUALITY_MAX_ASPECT_RATIO", 2.5):
+        return _reject("bad_aspect_ratio", "The image is too narrow or too wide for a selfie.")
+    if measurements["brightness"] < _env_float("QUALITY_MIN_BRIGHTNESS", 40) or measurements["dark_fraction"] > _env_float(
+        "QUALITY_MAX_DARK_FRACTION", 0.6
+    ):
+        return _reject("too_dark", "The photo is too dark; retake it in better light.")
+    if measurements["brightness"] > _env_float("QUALITY_MAX_BRIGHTNESS", 225) or measurements["clipped_fraction"] > _env_float(
+        "QUALITY_MAX_CLIPPED_FRACTION", 0.4
+    ):
+        return _reject("overexposed", "The photo is overexposed; avoid direct light or flash.")
+    if measurements["sharpness"] < _env_float("QUALITY_MIN_SHARPNESS", 25):
+        return _reject("too_blurry", "The photo is blurry; hold the camera still and focus on the face.")
+    if measurements["skin_fraction"] < _env_float("QUALITY_MIN_SKIN_FRACTION", 0.1):
+        return _reject("no_face_detected", "No face was found in the middle of the photo.")
+    return QualityReport(measurements=measurements)
@@ -0,0 +1,211 @@
+"""Per-user request rate limits and daily LLM spend quotas."""
+
+from __future__ import annotations
+
+import logging
+import math
+import os
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Awaitable, Callable, Dict, Optional, Protocol
+
+from fastapi import Depends, HTTPException, status
+from redis import asyncio as redis_asyncio
+from redis.exceptions import RedisError
+
+from .auth import AuthenticatedUser, require_supabase_user
+from .cache import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+# User whose quota is charged for LLM calls made in the current context. Set by
+# the background jobs so that usage recorded deep inside the LLM helpers is
+# attributed without threading the id through every call.
+llm_usage_user: ContextVar[Optional[str]] = ContextVar("llm_usage_user", default=None)
+
+
+@dataclass(frozen=True, slots=True)
+class BucketConfig:
+    capacity: float
+    refill_per_second: float
+
+
+def _bucket_config(prefix: str, capacity: str, per_minute: str) -> BucketConfig:
+    return BucketConfig(
+        capacity=float(os.getenv(f"{prefix}_RATE_CAPACITY", capacity)),
+        refill_per_second=float(os.getenv(f"{prefix}_RATE_REFILL_PER_MINUTE", per_minute)) / 60,
+    )
+
+
+@lru_cache
+def get_bucket_configs() -> Dict[str, BucketConfig]:
+    return {
+        "analysis": _bucket_config("ANALYSIS", "3", "2"),
+        "routine": _bucket_config("ROUTINE", "5", "5"),
+    }
+
+
+def daily_call_quota() -> int:
+    return int(os.getenv("DAILY_LLM_CALL_QUOTA", "150"))
+
+
+def daily_token_quota() -> int:
+    return int(os.getenv("DAILY_LLM_TOKEN_QUOTA", "3000000"))
+
+
+def _utc_day() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+
+def _seconds_until_utc_midnight() -> float:
+    now = datetime.now(timezone.utc)
+    tomorrow = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return (tomorrow - now).total_seconds()
+
+
+class RateLimitBackend(Protocol):
+    async def take(self, key: str, config: BucketConfig, cost: float = 1) -> float:
+        """Consume ``cost`` tokens; return 0 when allowed, else seconds until it would be."""
+
+    async def add_usage(self, user_id: str, day: str, calls: int, tokens: int) -> None: ...
+
+    async def get_usage(self, user_id: str, day: str) -> tuple[int, int]: ...
+
+
+class MemoryRateLimitBackend:
+    """Process-local buckets; limits are per worker."""
+
+    def __init__(self) -> None:
+        self._buckets: Dict[str, tuple[float, float]] = {}
+        self._usage: Dict[tuple[str, str], list[int]] = {}
+
+    async def take(self, key: str, config: BucketConfig, cost: float = 1) -> float:
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.get(key, (config.capacity, now))
+        tokens = min(config.capacity, tokens + (now - updated_at) * config.refill_per_second)
+        if tokens >= cost:
+            self._buckets[key] = (tokens - cost, now)
+            return 0.0
+        self._buckets[key] = (tokens, now)
+        return (cost - tokens) / config.refill_per_second
+
+    async def add_usage(self, user_id: str, day: str, calls: int, tokens: int) -> None:
+        if len(self._usage) > 10_000:
+            self._usage = {key: value for key, value in self._usage.items() if key[1] == day}
+        usage = self._usage.setdefault((user_id, day), [0, 0])
+        usage[0] += calls
+        usage[1] += tokens
+
+    async def get_usage(self, user_id: str, day: str) -> tuple[int, int]:
+        calls, tokens = self._usage.get((user_id, day), (0, 0))
+        return calls, tokens
+
+
+_TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local retry_after = 0
+if tokens >= cost then
+    tokens = tokens - cost
+else
+    retry_after = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(retry_after)
+"""
+
+
+class RedisRateLimitBackend:
+    """Buckets and usage counters shared by every worker through Redis."""
+
+    def __init__(self, client: redis_asyncio.Redis, prefix: str = "ratelimit") -> None:
+        self._client = client
+        self._prefix = prefix
+        self._take_script = client.register_script(_TOKEN_BUCKET_SCRIPT)
+
+    async def take(self, key: str, config: BucketConfig, cost: float = 1) -> float:
+        retry_after = await self._take_script(
+            keys=[f"{self._prefix}:bucket:{key}"],
+            args=[config.capacity, config.refill_per_second, cost],
+        )
+        return float(retry_after)
+
+    async def add_usage(self, user_id: str, day: str, calls: int, tokens: int) -> None:
+        key = f"{self._prefix}:usage:{user_id}:{day}"
+        async with self._client.pipeline(transaction=True) as pipe:
+            pipe.hincrby(key, "calls", calls)
+            pipe.hincrby(key, "tokens", tokens)
+            pipe.expire(key, 2 * 24 * 3600)
+            await pipe.execute()
+
+    async def get_usage(self, user_id: str, day: str) -> tuple[int, int]:
+        calls, tokens = await self._client.hmget(f"{self._prefix}:usage:{user_id}:{day}", "calls", "tokens")
+        return int(calls or 0), int(tokens or 0)
+
+
+@lru_cache
+def get_rate_limit_backend() -> RateLimitBackend:
+    client = get_redis_client()
+    if client is not None:
+        return RedisRateLimitBackend(client)
+    return MemoryRateLimitBackend()
+
+
+def _too_many_requests(detail: str, retry_after: float) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=detail,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+async def enforce_limits(user_id: str, bucket: str) -> None:
+    """Raise ``429`` if ``user_id`` is over its daily LLM quota or out of ``bucket`` tokens."""
+    backend = get_rate_limit_backend()
+    try:
+        calls, tokens = await backend.get_usage(user_id, _utc_day())
+        if calls >= daily_call_quota() or tokens >= daily_token_quota():
+            raise _too_many_requests("Daily LLM quota exceeded.", _seconds_until_utc_midnight())
+        retry_after = await backend.take(f"{bucket}:{user_id}", get_bucket_configs()[bucket])
+    except RedisError as exc:
+        # Fail open: an unavailable limiter must not take the API down with it.
+        logger.warning("Rate limiter unavailable, allowing request: %s", exc)
+        return
+    if retry_after > 0:
+        raise _too_many_requests("Too many requests.", retry_after)
+
+
+async def record_llm_usage(calls: int, tokens: int) -> None:
+    """Charge LLM usage to the user bound to the current context, if any."""
+    user_id = llm_usage_user.get()
+    if user_id is None:
+        return
+    try:
+        await get_rate_limit_backend().add_usage(user_id, _utc_day(), calls, tokens)
+    except RedisError as exc:
+        logger.warning("Failed to record LLM usage for %s: %s", user_id, exc)
+
+
+def rate_limited(bucket: str) -> Callable[..., Awaitable[AuthenticatedUser]]:
+    """Build a dependency that authenticates the caller and applies ``bucket`` limits."""
+
+    async def _dependency(current_user: AuthenticatedUser = Depends(require_supabase_user)) -> AuthenticatedUser:
+        await enforce_limits(current_user.id, bucket)
+        return current_user
+
+    return _dependency
+
+
+limit_analysis_requests = rate_limited("analysis")
+limit_routine_requests = rate_limited("routine")
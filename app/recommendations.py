@@ -2,13 +2,44 @@
 
 from __future__ import annotations
 
+import asyncio
 import difflib
-from typing import Any, Dict
+import hashlib
+import os
+import time
+from functools import lru_cache
+from typing import Any, AsyncIterator, Dict, Iterator
 
-from .llm import get_structured_model
-from .prompts import build_routine_prompt_messages, product_links
-from .schemas import RoutineIntake, RoutinePlan
-from .storage import TaskRepository
+import jiter
+import orjson
+
+from . import metrics
+from .cache import TieredCache, build_tiered_cache
+from .deadlines import Deadline, DeadlineExceeded, run_within
+from .eta import ROUTINE_NARRATIVE_STEP, ROUTINE_STEP, get_latency_tracker
+from .executor import offload
+from .jobs import get_job_registry
+from .llm import get_json_stream_model, invoke_structured, record_usage
+from .prompts import (
+    PRODUCTS,
+    ROUTINE_NARRATIVE_SYSTEM_PROMPT,
+    ROUTINE_NARRATIVE_USER_PROMPT,
+    ROUTINE_REFERENCE_PROMPT,
+    ROUTINE_SYSTEM_PROMPT,
+    ROUTINE_USER_PROMPT,
+    build_routine_narrative_messages,
+    build_routine_prompt_messages,
+    product_links,
+)
+from .ratelimit import llm_usage_user
+from .routine_engine import ROUTINE_RULES_VERSION, apply_narrative, build_routine
+from .scheduler import Priority, get_llm_scheduler
+from .schemas import RoutineIntake, RoutineNarrative, RoutinePlan
+from .storage import TaskStore
+
+ROUTINE_INPUT_KEYS = ("global_profile", "issues")
+# Sections pushed to streaming clients, in the order the schema declares them.
+ROUTINE_STREAM_SECTIONS = ("routine.am", "routine.midday", "routine.pm", "reasons", "warnings", "lifestyle")
 
 
 def find_product_url(product_name: str) -> str:
@@ -51,27 +82,120 @@ def add_urls_to_routine(routine_json: Dict[str, Any]) -> Dict[str, Any]:
     return routine_json
 
 
-async def generate_routine_plan(
-    task_id: str,
-    analysis: Dict[str, Any],
+def _fingerprint(payload: Any) -> str:
+    return hashlib.sha256(orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+
+def routine_inputs(analysis: Dict[str, Any] | None) -> Dict[str, Any]:
+    """Keep only the analysis sections the routine prompt depends on."""
+    analysis = analysis or {}
+    return {key: analysis[key] for key in ROUTINE_INPUT_KEYS if key in analysis}
+
+
+@lru_cache
+def routine_cache_version() -> str:
+    """Fingerprint of everything besides the inputs that shapes a routine.
+
+    Editing the product catalog, the product links or the routine prompts (or
+    switching models) yields a new version, so stale plans are never served.
+    """
+    return _fingerprint(
+        {
+            "system_prompt": ROUTINE_SYSTEM_PROMPT,
+            "reference_prompt": ROUTINE_REFERENCE_PROMPT,
+            "user_prompt": ROUTINE_USER_PROMPT,
+            "narrative_prompts": (ROUTINE_NARRATIVE_SYSTEM_PROMPT, ROUTINE_NARRATIVE_USER_PROMPT),
+            "rules": ROUTINE_RULES_VERSION,
+            "products": PRODUCTS,
+            "product_links": product_links,
+            "model": os.getenv("OPENROUTER_MODEL"),
+        }
+    )[:16]
+
+
+def routine_cache_key(analysis: Dict[str, Any], intake_payload: Dict[str, Any], engine: str = "llm") -> str:
+    inputs: Dict[str, Any] = {"analysis": analysis, "intake": intake_payload}
+    if engine != "llm":
+        inputs["engine"] = engine
+    return f"{routine_cache_version()}:{_fingerprint(inputs)}"
+
+
+@lru_cache
+def get_routine_cache() -> TieredCache:
+    return build_tiered_cache(
+        "routine",
+        max_entries=int(os.getenv("ROUTINE_CACHE_MAX_ENTRIES", "1024")),
+        ttl_seconds=float(os.getenv("ROUTINE_CACHE_TTL_SECONDS", "86400")),
+    )
+
+
+def _routine_cache_enabled() -> bool:
+    return os.getenv("ROUTINE_CACHE_ENABLED", "1") != "0"
+
+
+def _routine_cache(engine: str) -> TieredCache | None:
+    # Rule-built plans are cheaper to rebuild than to fetch.
+    if engine == "rules" or not _routine_cache_enabled():
+        return None
+    return get_routine_cache()
+
+
+def engine_for_deadline(engine: str, deadline: Deadline | None) -> tuple[str, str | None]:
+    """Engine to run instead of ``engine`` so the routine fits ``deadline``, with the reason.
+
+    The full LLM plan falls back to the rule-built plan with LLM text, and
+    that to the rule-built plan alone, which takes milliseconds.
+    """
+    if deadline is None or engine == "rules":
+        return engine, None
+    step = ROUTINE_STEP if engine == "llm" else ROUTINE_NARRATIVE_STEP
+    if deadline.fits(step):
+        return engine, None
+    reason = f"deadline: the {engine} engine usually takes ~{deadline.estimate(step):.1f}s, {max(deadline.remaining(), 0.0):.1f}s left"
+    if engine == "llm" and deadline.fits(ROUTINE_NARRATIVE_STEP):
+        return "hybrid", reason
+    return "rules", reason
+
+
+def _mark_degraded(routine_payload: Dict[str, Any], requested: str, engine: str, reason: str) -> Dict[str, Any]:
+    metrics.increment("routine.deadline_downgrades")
+    return {**routine_payload, "degraded": {"requested_engine": requested, "engine": engine, "reason": reason}}
+
+
+async def _rule_based_routine(
+    analysis_inputs: Dict[str, Any],
     intake: RoutineIntake,
-    repository: TaskRepository,
-) -> None:
-    print(f"[generate_routine_plan] task_id={task_id} starting")
-    intake_payload = intake.model_dump()
-    messages = build_routine_prompt_messages(analysis or {}, intake_payload)
-    model = get_structured_model(RoutinePlan)
+    engine: str,
+    deadline: Deadline | None = None,
+) -> Dict[str, Any]:
+    """Build the plan with the rules engine; ``hybrid`` then has the LLM write its text."""
+    with metrics.timer("routine.rules_seconds"):
+        plan = await offload(build_routine, analysis_inputs, intake)
+    if engine == "hybrid":
+        messages = build_routine_narrative_messages(plan.model_dump(), analysis_inputs, intake.model_dump())
+        started = time.perf_counter()
+        try:
+            narrative = await run_within(deadline, invoke_structured(RoutineNarrative, messages, priority=Priority.INTERACTIVE))
+            get_latency_tracker().record(ROUTINE_NARRATIVE_STEP, time.perf_counter() - started)
+            plan = apply_narrative(plan, narrative, intake)
+        except DeadlineExceeded:
+            raise
+        except Exception as exc:  # noqa: BLE001
+            # The templated text is complete on its own, so the plan still ships.
+            print(f"[routine_engine] Narrative failed, keeping templated text: {type(exc).__name__}: {exc}")
+            metrics.increment("routine.narrative_failures")
+    return plan.model_dump()
 
-    try:
-        routine_plan = await model.ainvoke(messages)
-    except Exception as exc:  # noqa: BLE001
-        print(f"[generate_routine_plan] task_id={task_id} ERROR: {type(exc).__name__}: {exc}")
-        await repository.update_task(task_id, error_value=str(exc))
-        return
 
+async def _save_routine(
+    task_id: str,
+    intake_payload: Dict[str, Any],
+    routine_payload: Dict[str, Any],
+    repository: TaskStore,
+) -> Dict[str, Any] | None:
     try:
         # Add URLs to products using edit distance matching
-        routine_json_with_urls = add_urls_to_routine(routine_plan.model_dump())
+        routine_json_with_urls = await offload(add_urls_to_routine, routine_payload)
 
         await repository.save_routine_plan(
             task_id,
@@ -79,6 +203,213 @@ async def generate_routine_plan(
             routine_json=routine_json_with_urls,
         )
         print(f"[generate_routine_plan] task_id={task_id} saved routine with URLs")
+        return routine_json_with_urls
     except Exception as exc:  # noqa: BLE001
         print(f"[generate_routine_plan] task_id={task_id} ERROR saving routine: {exc}")
         await repository.update_task(task_id, error_value=str(exc))
+        return None
+
+
+async def generate_routine_plan(
+    task_id: str,
+    analysis: Dict[str, Any],
+    intake: RoutineIntake,
+    repository: TaskStore,
+    user_id: str | None = None,
+    engine: str = "llm",
+    deadline: Deadline | None = None,
+) -> None:
+    """Build and save the routine; with ``deadline`` a faster engine may stand in (see :func:`engine_for_deadline`)."""
+    print(f"[generate_routine_plan] task_id={task_id} starting, engine={engine}")
+    if user_id is not None:
+        llm_usage_user.set(user_id)
+    intake_payload = intake.model_dump()
+    analysis_inputs = routine_inputs(analysis)
+    cache = _routine_cache(engine)
+    cache_key = routine_cache_key(analysis_inputs, intake_payload, engine)
+
+    try:
+        routine_payload = await cache.get(cache_key) if cache is not None else None
+        if routine_payload is not None:
+            print(f"[generate_routine_plan] task_id={task_id} routine cache hit")
+        else:
+            started = time.perf_counter()
+            run_engine, degraded_reason = engine_for_deadline(engine, deadline)
+            try:
+                try:
+                    if run_engine == "llm":
+                        messages = build_routine_prompt_messages(analysis_inputs, intake_payload)
+                        plan = await run_within(deadline, invoke_structured(RoutinePlan, messages, priority=Priority.INTERACTIVE))
+                        routine_payload = plan.model_dump()
+                    else:
+                        routine_payload = await _rule_based_routine(analysis_inputs, intake, run_engine, deadline)
+                except DeadlineExceeded:
+                    degraded_reason = f"deadline: reached while the {run_engine} engine was running"
+                    run_engine = "rules"
+                    routine_payload = await _rule_based_routine(analysis_inputs, intake, run_engine)
+            except Exception as exc:  # noqa: BLE001
+                print(f"[generate_routine_plan] task_id={task_id} ERROR: {type(exc).__name__}: {exc}")
+                await repository.update_task(task_id, error_value=str(exc))
+                return
+            if run_engine == "llm":
+                get_latency_tracker().record(ROUTINE_STEP, time.perf_counter() - started)
+
+            if degraded_reason is not None:
+                # Not cached: the next request with more time gets the plan it asked for.
+                print(f"[generate_routine_plan] task_id={task_id} ran {run_engine} instead of {engine} ({degraded_reason})")
+                routine_payload = _mark_degraded(routine_payload, engine, run_engine, degraded_reason)
+            elif cache is not None:
+                await cache.set(cache_key, routine_payload)
+
+        await _save_routine(task_id, intake_payload, routine_payload, repository)
+    except asyncio.CancelledError:
+        reason = get_job_registry().cancel_reason(task_id, "routine")
+        print(f"[generate_routine_plan] task_id={task_id} Cancelled (reason={reason})")
+        # A superseding request is already on its way; its routine replaces this one.
+        if reason == "shutdown":
+            await repository.update_task(task_id, error_value="Server restarted before the routine was ready.")
+        elif reason != "superseded":
+            await repository.update_task(task_id, error_value="Routine generation was cancelled.")
+        raise
+
+
+def _parse_partial(buffer: bytearray) -> Dict[str, Any]:
+    start = buffer.find(b"{")
+    if start < 0:
+        return {}
+    try:
+        document = jiter.from_json(bytes(buffer[start:]), partial_mode=True)
+    except ValueError:
+        return {}
+    return document if isinstance(document, dict) else {}
+
+
+def _completed_sections(document: Dict[str, Any], finished: bool) -> Iterator[tuple[str, Any]]:
+    """Yield the stream sections of a (partial) routine document that are final.
+
+    In a partially parsed object every key except the last one is complete, since
+    the model has already moved on to a later key.
+    """
+    keys = list(document)
+    for index, key in enumerate(keys):
+        key_done = finished or index < len(keys) - 1
+        value = document[key]
+        if key == "routine" and isinstance(value, dict):
+            inner_keys = list(value)
+            for inner_index, inner_key in enumerate(inner_keys):
+                if key_done or inner_index < len(inner_keys) - 1:
+                    yield f"routine.{inner_key}", value[inner_key]
+        elif key_done:
+            yield key, value
+
+
+async def stream_routine_plan(
+    task_id: str,
+    analysis: Dict[str, Any],
+    intake: RoutineIntake,
+    repository: TaskStore,
+    user_id: str | None = None,
+    engine: str = "llm",
+    deadline: Deadline | None = None,
+) -> AsyncIterator[tuple[str, Dict[str, Any]]]:
+    """Generate a routine while yielding ``(event, data)`` pairs for each finished section.
+
+    Emits ``section`` events as soon as a routine section is complete, then a
+    ``complete`` event carrying the validated and persisted plan, or ``error``.
+    The rules and hybrid engines build the whole plan first and emit every
+    section at once. ``deadline`` only picks the engine here; sections already
+    sent cannot be taken back, so a running stream is not cut short.
+    """
+    print(f"[stream_routine_plan] task_id={task_id} starting, engine={engine}")
+    if user_id is not None:
+        llm_usage_user.set(user_id)
+    started = time.perf_counter()
+    emitted: set[str] = set()
+    intake_payload = intake.model_dump()
+    analysis_inputs = routine_inputs(analysis)
+    cache = _routine_cache(engine)
+    cache_key = routine_cache_key(analysis_inputs, intake_payload, engine)
+
+    def _section_events(document: Dict[str, Any], finished: bool) -> Iterator[tuple[str, Dict[str, Any]]]:
+        for name, value in _completed_sections(document, finished):
+            if name in emitted or name not in ROUTINE_STREAM_SECTIONS:
+                continue
+            if not emitted:
+                metrics.observe("routine_stream.time_to_first_section_seconds", time.perf_counter() - started)
+            emitted.add(name)
+            yield "section", {"section": name, "data": value}
+
+    routine_payload = await cache.get(cache_key) if cache is not None else None
+    run_engine, degraded_reason = engine_for_deadline(engine, deadline)
+    if routine_payload is not None:
+        print(f"[stream_routine_plan] task_id={task_id} routine cache hit")
+        degraded_reason = None
+    elif run_engine != "llm":
+        try:
+            routine_payload = await _rule_based_routine(analysis_inputs, intake, run_engine)
+        except Exception as exc:  # noqa: BLE001
+            print(f"[stream_routine_plan] task_id={task_id} ERROR: {type(exc).__name__}: {exc}")
+            await repository.update_task(task_id, error_value=str(exc))
+            yield "error", {"detail": str(exc)}
+            return
+        if degraded_reason is not None:
+            routine_payload = _mark_degraded(routine_payload, engine, run_engine, degraded_reason)
+        elif cache is not None:
+            await cache.set(cache_key, routine_payload)
+    else:
+        messages = build_routine_prompt_messages(analysis_inputs, intake_payload)
+        model = get_json_stream_model(RoutinePlan)
+        buffer = bytearray()
+        # Text chunks, then None when the model is done or the exception it raised.
+        chunks: asyncio.Queue[str | Exception | None] = asyncio.Queue()
+
+        async def _drain_model() -> None:
+            # The slot is held only while the model streams; a slow client reads from the queue.
+            try:
+                async with get_llm_scheduler().slot(Priority.INTERACTIVE):
+                    async for chunk in model.astream(messages):
+                        if chunk.usage_metadata:
+                            await record_usage(RoutinePlan.__name__, chunk.usage_metadata)
+                        text = chunk.content if isinstance(chunk.content, str) else ""
+                        if text:
+                            chunks.put_nowait(text)
+            except Exception as exc:  # noqa: BLE001
+                chunks.put_nowait(exc)
+            else:
+                chunks.put_nowait(None)
+
+        producer = asyncio.create_task(_drain_model())
+        try:
+            while (text := await chunks.get()) is not None:
+                if isinstance(text, Exception):
+                    raise text
+                buffer.extend(text.encode("utf-8"))
+                # Sections can only complete once a value or container closes.
+                if not any(marker in text for marker in ",]}"):
+                    continue
+                for event in _section_events(_parse_partial(buffer), finished=False):
+                    yield event
+            start = buffer.find(b"{")
+            routine_plan = RoutinePlan.model_validate(jiter.from_json(bytes(buffer[max(start, 0):])))
+        except Exception as exc:  # noqa: BLE001
+            print(f"[stream_routine_plan] task_id={task_id} ERROR: {type(exc).__name__}: {exc}")
+            await repository.update_task(task_id, error_value=str(exc))
+            yield "error", {"detail": str(exc)}
+            return
+        finally:
+            # A client that disconnects mid-stream stops the model call too.
+            producer.cancel()
+
+        routine_payload = routine_plan.model_dump()
+        if cache is not None:
+            await cache.set(cache_key, routine_payload)
+
+    for event in _section_events(routine_payload, finished=True):
+        yield event
+
+    routine_json = await _save_routine(task_id, intake_payload, routine_payload, repository)
+    metrics.observe("routine_stream.duration_seconds", time.perf_counter() - started)
+    if routine_json is None:
+        yield "error", {"detail": "Failed to save routine."}
+        return
+    yield "complete", {"task_id": task_id, "routine_json": routine_json}
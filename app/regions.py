@@ -0,0 +1,172 @@
+"""Per-step crops of the selfie, cut out along the client's ML Kit face geometry."""
+
+from __future__ import annotations
+
+import dataclasses
+import io
+import math
+import os
+from dataclasses import dataclass
+from typing import Dict, Optional, get_args
+
+from PIL import Image, ImageOps
+
+from .blobs import BlobRef
+from .schemas import FaceGeometry, IssueRegion
+
+REGION_NAMES: tuple[str, ...] = get_args(IssueRegion)
+# Tiles smaller than this on either side are too little to judge skin from.
+_MIN_TILE_SIDE = 32
+_TILE_MIME_TYPE = "image/jpeg"
+
+
+def region_tiles_enabled() -> bool:
+    return os.getenv("REGION_TILES", "1") != "0"
+
+
+@dataclass(frozen=True, slots=True)
+class TileSpec:
+    """Crop around the points of ``regions``, scaled down to at most ``max_side``.
+
+    ``padding`` is added on every side and ``extend_up`` above, both as
+    fractions of the face size, so single-point landmarks still get a window
+    and the forehead, which ML Kit does not outline, fits above the brows.
+    """
+
+    name: str
+    regions: tuple[str, ...]
+    max_side: int
+    padding: float = 0.1
+    extend_up: float = 0.0
+
+
+_EYEBROWS = ("LeftEyebrowTop", "LeftEyebrowBottom", "RightEyebrowTop", "RightEyebrowBottom")
+_FACE = TileSpec("face", ("FaceOval",), 768, padding=0.05)
+
+STEP_TILES: Dict[str, tuple[TileSpec, ...]] = {
+    "global_profile": (_FACE,),
+    "texture": (
+        TileSpec("t_zone", (*_EYEBROWS, "NoseBase"), 512, padding=0.05, extend_up=0.2),
+        TileSpec("left_cheek", ("LeftCheek",), 384, padding=0.2),
+        TileSpec("right_cheek", ("RightCheek",), 384, padding=0.2),
+    ),
+    "pigmentation": (_FACE,),
+    "acne": (_FACE,),
+    "aging": (
+        TileSpec("eyes", ("LeftEye", "RightEye", *_EYEBROWS), 640, padding=0.12),
+        # Forehead lines and nasolabial folds still need the whole face, just not sharply.
+        dataclasses.replace(_FACE, name="face_overview", max_side=384),
+    ),
+}
+
+
+@dataclass(frozen=True, slots=True)
+class Tile:
+    name: str
+    regions: tuple[str, ...]
+    data: bytes
+    mime_type: str
+    width: int
+    height: int
+
+
+@dataclass(frozen=True, slots=True)
+class VisionUsage:
+    """Estimated vision tokens a step sent, next to what the full image would have cost."""
+
+    tokens: int
+    full_image_tokens: int
+
+
+def estimate_image_tokens(width: int, height: int) -> int:
+    """Vision tokens for one image under the common high-detail tiling rule.
+
+    The image is fit into 2048x2048, its shorter side scaled down to 768, and
+    billed 170 tokens per 512 px tile plus 85. Providers differ in detail, so
+    this is for comparing payloads, not for billing.
+    """
+    if width <= 0 or height <= 0:
+        return 0
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    return 85 + 170 * math.ceil(width / 512) * math.ceil(height / 512)
+
+
+def _region_points(geometry: FaceGeometry, region: str, scale: tuple[float, float]) -> list[tuple[float, float]]:
+    points = list(geometry.contours.get(region, []))
+    if region in geometry.landmarks:
+        points.append(geometry.landmarks[region])
+    return [(x * scale[0], y * scale[1]) for x, y in points]
+
+
+def _bounds(points: list[tuple[float, float]]) -> tuple[float, float, float, float]:
+    xs, ys = [x for x, _ in points], [y for _, y in points]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def crop_step_tiles(image: BlobRef, geometry: FaceGeometry, step: str) -> Optional[list[Tile]]:
+    """Tiles for ``step``, or ``None`` when it should get the full image.
+
+    That is the case for steps without tiles, unreadable images and geometry
+    lacking a region a tile is built around. Pure CPU work; call it through
+    ``offload``.
+    """
+    specs = STEP_TILES.get(step)
+    if not specs:
+        return None
+    try:
+        with Image.open(image.path) as source:
+            # ML Kit runs on the upright frame.
+            upright = ImageOps.exif_transpose(source)
+    except (OSError, ValueError):
+        return None
+    width, height = upright.size
+    scale = (
+        width / geometry.image_width if geometry.image_width else 1.0,
+        height / geometry.image_height if geometry.image_height else 1.0,
+    )
+    points = {region: _region_points(geometry, region, scale) for region in REGION_NAMES}
+    everything = [point for region_points in points.values() for point in region_points]
+    if not everything:
+        return None
+    face_left, face_top, face_right, face_bottom = _bounds(points["FaceOval"] or everything)
+    face_size = max(face_right - face_left, face_bottom - face_top)
+
+    tiles: list[Tile] = []
+    for spec in specs:
+        spec_points = [point for region in spec.regions for point in points[region]]
+        if not spec_points:
+            return None
+        left, top, right, bottom = _bounds(spec_points)
+        pad = spec.padding * face_size
+        box = (
+            max(0, math.floor(left - pad)),
+            max(0, math.floor(top - pad - spec.extend_up * face_size)),
+            min(width, math.ceil(right + pad)),
+            min(height, math.ceil(bottom + pad)),
+        )
+        if box[2] - box[0] < _MIN_TILE_SIDE or box[3] - box[1] < _MIN_TILE_SIDE:
+            return None
+        crop = upright.crop(box).convert("RGB")
+        crop.thumbnail((spec.max_side, spec.max_side))
+        buffer = io.BytesIO()
+        crop.save(buffer, format="JPEG", quality=90)
+        visible = tuple(
+            region
+            for region in REGION_NAMES
+            if any(box[0] <= x <= box[2] and box[1] <= y <= box[3] for x, y in points[region])
+        )
+        tiles.append(Tile(spec.name, visible, buffer.getvalue(), _TILE_MIME_TYPE, crop.width, crop.height))
+    return tiles
+
+
+def full_image_tokens(image: BlobRef) -> int:
+    """:func:`estimate_image_tokens` of the upload as stored; 0 if it cannot be read."""
+    try:
+        with Image.open(image.path) as source:
+            width, height = source.size
+    except (OSError, ValueError):
+        return 0
+    return estimate_image_tokens(width, height)
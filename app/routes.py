@@ -3,22 +3,66 @@
 from __future__ import annotations
 
 import asyncio
-from typing import Any, Dict
-
-from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile
-
-from .auth import AuthenticatedUser, require_supabase_user
-from .llm import build_user_message, get_structured_model, load_prompt
-from .recommendations import generate_routine_plan
+import dataclasses
+import json
+import os
+import time
+from typing import Any, AsyncIterator, Dict, Literal
+
+from fastapi import APIRouter, Depends, File, Form, Header, HTTPException, Query, Request, Response, UploadFile
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import ValidationError
+
+from . import idempotency, metrics
+from .auth import AuthenticatedUser, require_admin_user, require_supabase_user
+from .blobs import BlobRef, get_blob_store, read_blob
+from .deadlines import Deadline
+from .encoding import negotiated_response
+from .eta import ProgressHint, get_latency_tracker
+from .executor import offload
+from .jobs import get_job_registry
+from .llm import build_user_message, cacheable_text_block, invoke_structured, load_prompt
+from .profiling import (
+    ProfilerBusy,
+    dump_tasks,
+    format_collapsed,
+    max_profile_seconds,
+    sample_cpu,
+    start_tracemalloc,
+    stop_tracemalloc,
+    top_allocation_diffs,
+    tracemalloc_status,
+)
+from .quality import QualityReport, assess_blob, assess_image, quality_gate_enabled
+from .ratelimit import enforce_limits, limit_analysis_requests, limit_routine_requests, llm_usage_user
+from .recommendations import generate_routine_plan, stream_routine_plan
+from .regions import region_tiles_enabled
+from .routine_engine import default_routine_engine
+from .scheduler import Priority
 from .schemas import (
     FaceAnalysisResult,
+    FaceGeometry,
+    ReanalysisResponse,
     RecommendationRequest,
     RecommendationResponse,
     TaskCreatedResponse,
+    TaskDeltaResponse,
     TaskStatusResponse,
+    TaskSummaryResponse,
+    TrendsResponse,
+    UpgradedFaceAnalysisResult,
 )
-from .storage import TaskRepository, get_task_repository
-from .workflow import run_upgraded_workflow
+from .storage import (
+    SUMMARY_INCLUDABLE,
+    TERMINAL_TASK_STATUSES,
+    TaskStore,
+    TrendStore,
+    get_task_repository,
+    get_trend_repository,
+    task_delta,
+)
+from .trends import rebuild_from_history, record_completed_analysis
+from .workflow import ISSUE_STEP_NAMES, SINGLE_CALL_STEP, rerun_issue_steps, run_upgraded_workflow, stale_steps
 
 router = APIRouter()
 
@@ -30,139 +74,507 @@ async def read_root() -> dict[str, str]:
 
 @router.get("/health", tags=["health"])
 async def health_check() -> dict[str, str]:
+    # Uvicorn serves nothing until the lifespan's warm-up has finished, so answering at all means ready.
     return {"status": "ok"}
 
 
+@router.get("/metrics", tags=["health"])
+async def read_metrics() -> dict[str, Any]:
+    return metrics.snapshot()
+
+
+def _reject_if_unusable(report: QualityReport) -> None:
+    if report.passed:
+        return
+    metrics.increment(f"quality.rejected.{report.reason}")
+    print(f"[quality] Rejected upload: reason={report.reason}, measurements={report.measurements}")
+    raise HTTPException(status_code=422, detail=report.to_detail())
+
+
 @router.post("/analyze", response_model=FaceAnalysisResult, tags=["analysis"])
 async def analyze_face(image: UploadFile = File(...)) -> FaceAnalysisResult:
     if not image.content_type or not image.content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="Provide a valid image file.")
 
+    image_bytes = await image.read()
+    if quality_gate_enabled():
+        with metrics.timer("quality.check_seconds"):
+            _reject_if_unusable(await offload(assess_image, image_bytes))
+
     payload = [
-        {"role": "system", "content": load_prompt()},
-        {"role": "user", "content": build_user_message(await image.read(), image.content_type)},
+        {"role": "system", "content": [cacheable_text_block(load_prompt())]},
+        {"role": "user", "content": await offload(build_user_message, image_bytes, image.content_type)},
     ]
-    structured_model = get_structured_model()
-    result = await structured_model.ainvoke(payload)
+    result = await invoke_structured(FaceAnalysisResult, payload)
     print(result)
     return result
 
 
 async def _process_task(
     task_id: str,
-    image_bytes: bytes,
-    mime_type: str,
+    image: BlobRef,
     real_age: int | None,
-    repository: TaskRepository,
+    repository: TaskStore,
+    user_id: str | None = None,
+    geometry: FaceGeometry | None = None,
+    deadline: Deadline | None = None,
 ) -> None:
-    print(f"[_process_task] Starting task_id={task_id}, mime_type={mime_type}, real_age={real_age}, image_size={len(image_bytes)} bytes")
+    print(f"[_process_task] Starting task_id={task_id}, mime_type={image.mime_type}, real_age={real_age}, image_size={image.size} bytes")
+    if user_id is not None:
+        llm_usage_user.set(user_id)
 
     progress_tasks: set[asyncio.Task[Any]] = set()
+    latest_snapshot: Dict[str, Any] = {}
+    step_started = time.monotonic()
 
     async def _set_progress(status: str, snapshot: Dict[str, Any]) -> None:
         print(f"[_process_task] task_id={task_id} Progress update: status={status}")
         await repository.update_task(task_id, status_value=status, result_value=snapshot)
 
     def _progress(status: str, snapshot: Dict[str, Any]) -> None:
+        nonlocal step_started
+        now = time.monotonic()
+        # Concurrent steps overlap, so the gaps between their updates are not their durations.
+        if snapshot.get("execution_mode") != "parallel":
+            get_latency_tracker().record_progress(status, now - step_started)
+        step_started = now
+        latest_snapshot.clear()
+        latest_snapshot.update(snapshot)
         task = asyncio.create_task(_set_progress(status, snapshot))
         progress_tasks.add(task)
 
         def _cleanup(t: asyncio.Task[Any]) -> None:
             progress_tasks.discard(t)
-            if t.exception():  # noqa: PERF203 - logs help debugging
+            if not t.cancelled() and t.exception():  # noqa: PERF203 - logs help debugging
                 print(f"[_process_task] task_id={task_id} Progress task error: {t.exception()}")
 
         task.add_done_callback(_cleanup)
 
-    print(f"[_process_task] task_id={task_id} Setting status to 'processing'")
-    await repository.update_task(task_id, status_value="processing")
+    async def _store_image() -> None:
+        # Kept so individual steps can be rerun later; the analysis does not depend on it.
+        try:
+            image_bytes = await asyncio.to_thread(read_blob, image)
+            await repository.save_task_image(task_id, user_id=user_id, image_bytes=image_bytes, mime_type=image.mime_type)
+        except Exception as exc:  # noqa: BLE001
+            print(f"[_process_task] task_id={task_id} Could not store image: {exc}")
+
+    # Tracked apart from the progress writes: completion does not wait for the upload.
+    image_upload: asyncio.Task[None] | None = None
+    if user_id is not None and _store_images_enabled():
+        image_upload = asyncio.create_task(_store_image())
+
+    async def _discard_image() -> None:
+        # Only completed analyses are rerun step by step; nothing else needs the selfie.
+        if image_upload is None:
+            return
+        image_upload.cancel()
+        await asyncio.gather(image_upload, return_exceptions=True)
+        try:
+            await repository.delete_task_image(task_id, user_id=user_id)
+        except Exception as exc:  # noqa: BLE001
+            print(f"[_process_task] task_id={task_id} Could not delete image: {exc}")
+
     try:
-        print(f"[_process_task] task_id={task_id} Running upgraded workflow")
-        final = await run_upgraded_workflow(
-            image_bytes,
-            mime_type,
-            real_age=real_age,
-            progress_callback=_progress,
-        )
-        print(f"[_process_task] task_id={task_id} Workflow completed successfully")
+        print(f"[_process_task] task_id={task_id} Setting status to 'processing'")
+        await repository.update_task(task_id, status_value="processing")
+        step_started = time.monotonic()
+        try:
+            print(f"[_process_task] task_id={task_id} Running upgraded workflow")
+            final = await run_upgraded_workflow(
+                image,
+                real_age=real_age,
+                progress_callback=_progress,
+                geometry=geometry,
+                deadline=deadline,
+            )
+            print(f"[_process_task] task_id={task_id} Workflow completed successfully")
+            if final.execution_mode == "single_call":
+                get_latency_tracker().record(SINGLE_CALL_STEP.name, time.monotonic() - step_started)
+        except Exception as exc:  # noqa: BLE001
+            print(f"[_process_task] task_id={task_id} ERROR: {type(exc).__name__}: {str(exc)}")
+            await repository.update_task(task_id, status_value="failed", error_value=str(exc))
+            await _discard_image()
+            return
+
+        if progress_tasks:
+            print(f"[_process_task] task_id={task_id} Waiting for {len(progress_tasks)} progress tasks to finish")
+            await asyncio.gather(*progress_tasks, return_exceptions=True)
+
+        print(f"[_process_task] task_id={task_id} Saving final result to database")
+        final_payload = await offload(final.model_dump)
+        await repository.update_task(task_id, status_value="completed", result_value=final_payload, error_value=None)
+        print(f"[_process_task] task_id={task_id} Task completed and saved")
+        if user_id is not None:
+            await record_completed_analysis(user_id, task_id, final_payload)
+    except asyncio.CancelledError:
+        reason = get_job_registry().cancel_reason(task_id, "analysis")
+        print(f"[_process_task] task_id={task_id} Cancelled (reason={reason})")
+        # Stale progress writes must not land after the cancelled status.
+        for task in progress_tasks:
+            task.cancel()
+        await asyncio.gather(*progress_tasks, return_exceptions=True)
+        await _discard_image()
+        if reason == "shutdown":
+            await repository.update_task(
+                task_id,
+                status_value="interrupted",
+                result_value=latest_snapshot or None,
+                error_value="Server restarted before the analysis finished.",
+            )
+        else:
+            await repository.update_task(
+                task_id,
+                status_value="cancelled",
+                error_value="Superseded by a newer analysis." if reason == "superseded" else None,
+            )
+        raise
+    finally:
+        if image_upload is not None:
+            # The upload reads the blob, so it stays pinned until then.
+            await asyncio.gather(image_upload, return_exceptions=True)
+        get_blob_store().release(image)
+
+
+async def _reanalyze_task(
+    task_id: str,
+    user_id: str,
+    previous: UpgradedFaceAnalysisResult,
+    steps: list[str],
+    real_age: int | None,
+    repository: TaskStore,
+) -> None:
+    print(f"[_reanalyze_task] Starting task_id={task_id}, steps={steps}")
+    llm_usage_user.set(user_id)
+    previous_payload = previous.model_dump()
+    image_ref: BlobRef | None = None
+    try:
+        image = await repository.load_task_image(task_id, user_id=user_id)
+        if image is None:
+            await repository.update_task(
+                task_id,
+                status_value="completed",
+                result_value=previous_payload,
+                error_value="Original image is no longer available.",
+            )
+            return
+        image_ref = await asyncio.to_thread(get_blob_store().put, image.data, image.mime_type)
+        del image
+        await repository.update_task(task_id, status_value="reanalyzing")
+        # Reruns are bulk work; they must not slow down users waiting on a first analysis.
+        merged = await rerun_issue_steps(image_ref, previous, steps, real_age=real_age, priority=Priority.BATCH)
+        final_payload = await offload(merged.model_dump)
+        await repository.update_task(task_id, status_value="completed", result_value=final_payload, error_value=None)
+        print(f"[_reanalyze_task] task_id={task_id} Reanalysis saved")
+        await record_completed_analysis(user_id, task_id, final_payload, previous=previous_payload)
+    except asyncio.CancelledError:
+        # The earlier result is still valid, so a cancelled rerun just restores it.
+        await repository.update_task(task_id, status_value="completed", result_value=previous_payload)
+        raise
     except Exception as exc:  # noqa: BLE001
-        print(f"[_process_task] task_id={task_id} ERROR: {type(exc).__name__}: {str(exc)}")
-        await repository.update_task(task_id, status_value="failed", error_value=str(exc))
-        return
+        print(f"[_reanalyze_task] task_id={task_id} ERROR: {type(exc).__name__}: {str(exc)}")
+        await repository.update_task(
+            task_id,
+            status_value="completed",
+            result_value=previous_payload,
+            error_value=f"Reanalysis failed: {exc}",
+        )
+    finally:
+        if image_ref is not None:
+            get_blob_store().release(image_ref)
 
-    if progress_tasks:
-        print(f"[_process_task] task_id={task_id} Waiting for {len(progress_tasks)} progress tasks to finish")
-        await asyncio.gather(*progress_tasks, return_exceptions=True)
 
-    print(f"[_process_task] task_id={task_id} Saving final result to database")
-    await repository.update_task(task_id, status_value="completed", result_value=final.model_dump(), error_value=None)
-    print(f"[_process_task] task_id={task_id} Task completed and saved")
+def _supersede_enabled() -> bool:
+    return os.getenv("SUPERSEDE_PREVIOUS_ANALYSES", "1") != "0"
+
+
+def _store_images_enabled() -> bool:
+    return os.getenv("STORE_TASK_IMAGES", "1") != "0"
 
 
 @router.post("/start-task", response_model=TaskCreatedResponse, tags=["analysis"])
 async def start_task(
+    response: Response,
     image: UploadFile = File(...),
     real_age: int | None = Form(None),
+    face_geometry: str | None = Form(None),
+    latency_budget_seconds: float | None = Form(None, gt=0),
+    idempotency_key: str | None = Header(None, alias="Idempotency-Key", max_length=255),
     current_user: AuthenticatedUser = Depends(require_supabase_user),
-    repository: TaskRepository = Depends(get_task_repository),
+    repository: TaskStore = Depends(get_task_repository),
 ) -> TaskCreatedResponse:
     print(f"[/start-task] Received request from user_id={current_user.id}, real_age={real_age}, image_type={image.content_type}")
+    # Counted from arrival, so the upload and quality check come out of the budget too.
+    deadline = Deadline.from_budget(latency_budget_seconds, get_latency_tracker().expected)
 
     if not image.content_type or not image.content_type.startswith("image/"):
         print(f"[/start-task] ERROR: Invalid image type: {image.content_type}")
         raise HTTPException(status_code=400, detail="Provide a valid image file.")
 
-    image_bytes = await image.read()
-    print(f"[/start-task] Image read: {len(image_bytes)} bytes")
+    geometry: FaceGeometry | None = None
+    if face_geometry and region_tiles_enabled():
+        try:
+            geometry = FaceGeometry.model_validate_json(face_geometry)
+        except ValidationError as exc:
+            print(f"[/start-task] ERROR: Invalid face_geometry: {exc.error_count()} errors")
+            raise HTTPException(status_code=422, detail=exc.errors(include_url=False, include_context=False)) from exc
+
+    # Spool the upload into the blob store; the workflow only carries the reference.
+    # Blob I/O stays on a thread: the store's bookkeeping lives in this process.
+    image_ref = await asyncio.to_thread(get_blob_store().put_stream, image.file, image.content_type)
+    print(f"[/start-task] Image stored: {image_ref.size} bytes, digest={image_ref.digest[:12]}")
+    if idempotency_key:
+        # The budget is left out: a retry may well send what is left of it.
+        fingerprint = idempotency.request_fingerprint(image_ref.digest, real_age, face_geometry)
+        try:
+            replay = await idempotency.begin("start-task", current_user.id, idempotency_key, fingerprint)
+        except BaseException:
+            get_blob_store().release(image_ref)
+            raise
+        if replay is not None:
+            print(f"[/start-task] Replaying task_id={replay['task_id']} for a repeated Idempotency-Key")
+            get_blob_store().release(image_ref)
+            response.headers["Idempotent-Replayed"] = "true"
+            return TaskCreatedResponse.model_validate(replay)
 
-    task_record = await repository.create_task(user_id=current_user.id, real_age=real_age)
+    try:
+        try:
+            # Charged only here, so a replayed retry costs no rate-limit tokens.
+            await enforce_limits(current_user.id, "analysis")
+            if quality_gate_enabled():
+                # Milliseconds of local checks instead of five LLM calls on an unusable photo.
+                with metrics.timer("quality.check_seconds"):
+                    _reject_if_unusable(await offload(assess_blob, image_ref))
+        except BaseException:
+            get_blob_store().release(image_ref)
+            raise
+
+        registry = get_job_registry()
+        if _supersede_enabled():
+            for job in registry.for_user(current_user.id, "analysis"):
+                print(f"[/start-task] Superseding running task_id={job.task_id}")
+                registry.cancel(job, "superseded")
+
+        try:
+            task_record = await repository.create_task(user_id=current_user.id, real_age=real_age)
+        except BaseException:
+            get_blob_store().release(image_ref)
+            raise
+    except BaseException:
+        if idempotency_key:
+            await idempotency.abandon("start-task", current_user.id, idempotency_key)
+        raise
     print(f"[/start-task] Task created: task_id={task_record.id}")
 
-    asyncio.create_task(_process_task(task_record.id, image_bytes, image.content_type, real_age, repository))
+    registry.start(
+        task_record.id,
+        current_user.id,
+        "analysis",
+        _process_task(
+            task_record.id,
+            image_ref,
+            real_age,
+            repository,
+            user_id=current_user.id,
+            geometry=geometry,
+            deadline=deadline,
+        ),
+    )
     print(f"[/start-task] Background processing started for task_id={task_record.id}")
 
-    return TaskCreatedResponse(task_id=task_record.id)
+    created = TaskCreatedResponse(task_id=task_record.id)
+    if idempotency_key:
+        await idempotency.complete("start-task", current_user.id, idempotency_key, fingerprint, created.model_dump())
+    return created
 
 
-@router.get("/tasks", response_model=list[TaskStatusResponse], tags=["analysis"])
+@router.get("/tasks", response_model=list[TaskSummaryResponse], tags=["analysis"])
 async def list_tasks(
+    request: Request,
     current_user: AuthenticatedUser = Depends(require_supabase_user),
-    repository: TaskRepository = Depends(get_task_repository),
-    limit: int = 10,
-) -> list[TaskStatusResponse]:
-    tasks = await repository.list_tasks(current_user.id, limit=limit)    
-    print(tasks[-1])
-    return [
-        TaskStatusResponse(
+    repository: TaskStore = Depends(get_task_repository),
+    limit: int = Query(10, ge=1, le=100),
+    cursor: str | None = None,
+    include: str | None = Query(None, description="Comma-separated heavy fields to add: result, routine_json."),
+) -> Response:
+    include_fields = [field.strip() for field in (include or "").split(",") if field.strip()]
+    unknown = [field for field in include_fields if field not in SUMMARY_INCLUDABLE]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unsupported include fields: {', '.join(unknown)}")
+
+    try:
+        page = await repository.list_task_summaries(
+            current_user.id,
+            limit=limit,
+            cursor=cursor,
+            include=include_fields,
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+    headers = {"X-Next-Cursor": page.next_cursor} if page.next_cursor is not None else None
+    items = [
+        TaskSummaryResponse(
             task_id=task.id,
             status=task.status,
-            result=task.result,
+            created_at=task.created_at,
             error=task.error,
+            scores=task.scores,
+            skin_type=task.skin_type,
+            skin_age=task.skin_age,
+            result=task.result,
             routine_json=task.routine_json,
         )
-        for task in tasks
+        for task in page.items
     ]
+    return negotiated_response(request, items, headers=headers)
 
 
-@router.get("/tasks/{task_id}", response_model=TaskStatusResponse, tags=["analysis"])
+@router.get("/users/me/trends", response_model=TrendsResponse, tags=["analysis"])
+async def read_trends(
+    request: Request,
+    current_user: AuthenticatedUser = Depends(require_supabase_user),
+    repository: TaskStore = Depends(get_task_repository),
+    trends: TrendStore = Depends(get_trend_repository),
+) -> Response:
+    rollup = await trends.get_rollup(current_user.id)
+    if rollup is None:
+        # First request for a user whose history predates rollups: build it once.
+        rebuilt = await rebuild_from_history(current_user.id, repository)
+        if rebuilt is not None:
+            rollup = await trends.update_rollup(current_user.id, lambda existing: existing or rebuilt)
+    return negotiated_response(request, TrendsResponse.model_validate(rollup or {}))
+
+
+def _progress_fields(hint: ProgressHint | None) -> Dict[str, Any]:
+    if hint is None:
+        return {}
+    return {
+        "current_step": hint.current_step,
+        "eta_seconds": hint.eta_seconds,
+        "estimated_completion_at": hint.estimated_completion_at,
+    }
+
+
+@router.get("/tasks/{task_id}", response_model=TaskStatusResponse | TaskDeltaResponse, tags=["analysis"])
 async def get_task(
     task_id: str,
+    request: Request,
+    since: int | None = Query(None, ge=0, description="Return only the sections changed after this version."),
     current_user: AuthenticatedUser = Depends(require_supabase_user),
-    repository: TaskRepository = Depends(get_task_repository),
-) -> TaskStatusResponse:
+    repository: TaskStore = Depends(get_task_repository),
+) -> Response:
     task = await repository.get_task(task_id, user_id=current_user.id)
     if task is None:
         raise HTTPException(status_code=404, detail="Task not found.")
     if task.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Unauthorized")
-    print(f"[get_task] Retrieved task_id={task.id} for user_id={current_user.id}, {task}")
+    print(f"[get_task] Retrieved task_id={task.id} for user_id={current_user.id}, status={task.status}, version={task.version}")
+    routine_job = get_job_registry().get(task.id, "routine")
+    hint = get_latency_tracker().hint(task, time.monotonic() - routine_job.started_at if routine_job is not None else None)
+    headers = {"Retry-After": str(hint.retry_after)} if hint is not None else None
+    progress = _progress_fields(hint)
+    if since is not None:
+        changes = task_delta(task, since)
+        if changes is not None:
+            return negotiated_response(
+                request,
+                TaskDeltaResponse(task_id=task.id, status=task.status, version=task.version, changes=changes, **progress),
+                headers=headers,
+            )
+        # The change log no longer reaches back to ``since``; fall back to the full snapshot.
+    return negotiated_response(
+        request,
+        TaskStatusResponse(
+            task_id=task.id,
+            status=task.status,
+            result=task.result,
+            error=task.error,
+            routine_json=task.routine_json,
+            version=task.version,
+            **progress,
+        ),
+        headers=headers,
+    )
+
+
+@router.delete("/tasks/{task_id}", response_model=TaskStatusResponse, tags=["analysis"])
+async def cancel_task(
+    task_id: str,
+    current_user: AuthenticatedUser = Depends(require_supabase_user),
+    repository: TaskStore = Depends(get_task_repository),
+) -> TaskStatusResponse:
+    task = await repository.get_task(task_id, user_id=current_user.id)
+    if task is None:
+        raise HTTPException(status_code=404, detail="Task not found.")
+
+    registry = get_job_registry()
+    jobs = registry.for_task(task_id)
+    if jobs:
+        print(f"[cancel_task] Cancelling {len(jobs)} running job(s) for task_id={task_id}")
+        await registry.cancel_and_wait(jobs, "user")
+    elif task.status in TERMINAL_TASK_STATUSES:
+        raise HTTPException(status_code=409, detail="Task already finished.")
+    else:
+        # Nothing runs here (e.g. the worker restarted); just close the record.
+        await repository.update_task(task_id, status_value="cancelled")
+
+    task = await repository.get_task(task_id, user_id=current_user.id) or task
     return TaskStatusResponse(
         task_id=task.id,
         status=task.status,
         result=task.result,
         error=task.error,
         routine_json=task.routine_json,
+        version=task.version,
+    )
+
+
+@router.post(
+    "/tasks/{task_id}/reanalyze",
+    response_model=ReanalysisResponse,
+    status_code=202,
+    tags=["analysis"],
+)
+async def reanalyze_task(
+    task_id: str,
+    steps: str | None = Query(None, description="Comma-separated steps to rerun; defaults to the stale ones."),
+    current_user: AuthenticatedUser = Depends(limit_analysis_requests),
+    repository: TaskStore = Depends(get_task_repository),
+) -> ReanalysisResponse:
+    task = await repository.get_task(task_id, user_id=current_user.id)
+    if task is None:
+        raise HTTPException(status_code=404, detail="Task not found.")
+    if task.status != "completed" or task.result is None:
+        raise HTTPException(status_code=409, detail="Only completed analyses can be rerun.")
+
+    if steps is not None:
+        selected = [step.strip() for step in steps.split(",") if step.strip()]
+        unknown = [step for step in selected if step not in ISSUE_STEP_NAMES]
+        if unknown or not selected:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unsupported steps: {', '.join(unknown) or '(none)'}. Choose from {', '.join(ISSUE_STEP_NAMES)}.",
+            )
+    else:
+        selected = stale_steps(task.result)
+    if not selected:
+        raise HTTPException(status_code=409, detail="All steps are already up to date.")
+
+    registry = get_job_registry()
+    if registry.for_task(task_id):
+        raise HTTPException(status_code=409, detail="Task is still being processed.")
+    try:
+        previous = UpgradedFaceAnalysisResult.model_validate(task.result)
+    except ValueError as exc:
+        raise HTTPException(status_code=409, detail="Stored result cannot be rerun step by step.") from exc
+
+    registry.start(
+        task_id,
+        current_user.id,
+        "reanalysis",
+        _reanalyze_task(task_id, current_user.id, previous, selected, task.real_age, repository),
     )
+    return ReanalysisResponse(task_id=task_id, steps=selected, poll_path=f"/tasks/{task_id}")
 
 
 @router.post(
@@ -173,8 +585,10 @@ async def get_task(
 )
 async def generate_recommendation(
     payload: RecommendationRequest,
+    response: Response,
+    idempotency_key: str | None = Header(None, alias="Idempotency-Key", max_length=255),
     current_user: AuthenticatedUser = Depends(require_supabase_user),
-    repository: TaskRepository = Depends(get_task_repository),
+    repository: TaskStore = Depends(get_task_repository),
 ) -> RecommendationResponse:
     task = await repository.get_task(payload.task_id, user_id=current_user.id)
     if task is None:
@@ -182,13 +596,140 @@ async def generate_recommendation(
     if task.result is None:
         raise HTTPException(status_code=400, detail="Analysis not ready.")
 
-    asyncio.create_task(
-        generate_routine_plan(
+    if idempotency_key:
+        fingerprint = idempotency.request_fingerprint(payload.model_dump(mode="json", exclude={"latency_budget_seconds"}))
+        replay = await idempotency.begin("recommend", current_user.id, idempotency_key, fingerprint)
+        if replay is not None:
+            response.headers["Idempotent-Replayed"] = "true"
+            return RecommendationResponse.model_validate(replay)
+
+    try:
+        # After the replay check, like /start-task.
+        await enforce_limits(current_user.id, "routine")
+        registry = get_job_registry()
+        previous_job = registry.get(payload.task_id, "routine")
+        if previous_job is not None:
+            print(f"[generate_recommendation] Superseding the running routine for task_id={payload.task_id}")
+            await registry.cancel_and_wait([previous_job], "superseded")
+        registry.start(
+            payload.task_id,
+            current_user.id,
+            "routine",
+            generate_routine_plan(
+                payload.task_id,
+                task.result,
+                payload.intake,
+                repository,
+                user_id=current_user.id,
+                engine=payload.engine or default_routine_engine(),
+                deadline=Deadline.from_budget(payload.latency_budget_seconds, get_latency_tracker().expected),
+            ),
+        )
+    except RuntimeError as exc:
+        # The superseded routine did not stop in time; let the client retry.
+        if idempotency_key:
+            await idempotency.abandon("recommend", current_user.id, idempotency_key)
+        raise HTTPException(status_code=409, detail="A routine is still being generated for this task.") from exc
+    except BaseException:
+        if idempotency_key:
+            await idempotency.abandon("recommend", current_user.id, idempotency_key)
+        raise
+
+    accepted = RecommendationResponse(task_id=payload.task_id, poll_path=f"/tasks/{payload.task_id}")
+    if idempotency_key:
+        await idempotency.complete("recommend", current_user.id, idempotency_key, fingerprint, accepted.model_dump())
+    return accepted
+
+
+@router.post("/recommend/stream", tags=["recommendations"])
+async def stream_recommendation(
+    payload: RecommendationRequest,
+    current_user: AuthenticatedUser = Depends(limit_routine_requests),
+    repository: TaskStore = Depends(get_task_repository),
+) -> StreamingResponse:
+    task = await repository.get_task(payload.task_id, user_id=current_user.id)
+    if task is None:
+        raise HTTPException(status_code=404, detail="Task not found.")
+    if task.result is None:
+        raise HTTPException(status_code=400, detail="Analysis not ready.")
+
+    deadline = Deadline.from_budget(payload.latency_budget_seconds, get_latency_tracker().expected)
+
+    async def _events() -> AsyncIterator[str]:
+        async for event, data in stream_routine_plan(
             payload.task_id,
             task.result,
             payload.intake,
             repository,
-        )
+            user_id=current_user.id,
+            engine=payload.engine or default_routine_engine(),
+            deadline=deadline,
+        ):
+            yield f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(
+        _events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
-    return RecommendationResponse(task_id=payload.task_id, poll_path=f"/tasks/{payload.task_id}")
+
+@router.post("/admin/debug/profile", response_class=PlainTextResponse, tags=["admin"])
+async def profile_cpu(
+    seconds: float = Query(10, gt=0),
+    interval_ms: float = Query(5, ge=1, le=1000),
+    current_user: AuthenticatedUser = Depends(require_admin_user),
+) -> PlainTextResponse:
+    """Sample this worker's threads for ``seconds`` and return collapsed stacks for a flamegraph."""
+    if seconds > max_profile_seconds():
+        raise HTTPException(status_code=422, detail=f"Profile at most {max_profile_seconds():g} seconds.")
+    print(f"[/admin/debug/profile] user_id={current_user.id} profiling for {seconds:g}s")
+    try:
+        stacks = await asyncio.to_thread(sample_cpu, seconds, interval_ms / 1000)
+    except ProfilerBusy as exc:
+        raise HTTPException(status_code=409, detail=str(exc)) from exc
+    return PlainTextResponse(
+        format_collapsed(stacks),
+        headers={"Content-Disposition": 'attachment; filename="profile.collapsed"'},
+    )
+
+
+@router.post("/admin/debug/tracemalloc/start", tags=["admin"])
+async def tracemalloc_start(
+    frames: int = Query(10, ge=1, le=100),
+    current_user: AuthenticatedUser = Depends(require_admin_user),
+) -> dict[str, Any]:
+    print(f"[/admin/debug/tracemalloc] user_id={current_user.id} starting with frames={frames}")
+    return await asyncio.to_thread(start_tracemalloc, frames)
+
+
+@router.post("/admin/debug/tracemalloc/stop", tags=["admin"])
+async def tracemalloc_stop(current_user: AuthenticatedUser = Depends(require_admin_user)) -> dict[str, Any]:
+    print(f"[/admin/debug/tracemalloc] user_id={current_user.id} stopping")
+    return stop_tracemalloc()
+
+
+@router.get("/admin/debug/tracemalloc/top", tags=["admin"])
+async def tracemalloc_top(
+    limit: int = Query(25, ge=1, le=500),
+    group_by: Literal["lineno", "filename", "traceback"] = Query("lineno"),
+    reset: bool = Query(False),
+    _: AuthenticatedUser = Depends(require_admin_user),
+) -> dict[str, Any]:
+    """Allocation growth since tracing started, or since the last call with ``reset``."""
+    try:
+        diffs = await asyncio.to_thread(top_allocation_diffs, limit, group_by, reset)
+    except RuntimeError as exc:
+        raise HTTPException(status_code=409, detail=str(exc)) from exc
+    return {**tracemalloc_status(), "top": diffs}
+
+
+@router.get("/admin/debug/tasks", tags=["admin"])
+async def list_asyncio_tasks(
+    stack_limit: int = Query(20, ge=1, le=200),
+    _: AuthenticatedUser = Depends(require_admin_user),
+) -> dict[str, Any]:
+    """Every live asyncio task with the await chain it is suspended in; registry jobs show their age."""
+    job_started = {job.task: job.started_at for job in get_job_registry().running()}
+    tasks = dump_tasks(job_started, stack_limit)
+    return {"count": len(tasks), "tasks": [dataclasses.asdict(task) for task in tasks]}
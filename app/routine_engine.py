@@ -0,0 +1,389 @@
+"""Deterministic routine builder: steps and products from the analysis, the intake and the catalog.
+
+Applies the same sequencing, safety and selection rules the routine prompt
+describes (``ROUTINE_REFERENCE_PROMPT``) in plain code, so a complete
+:class:`RoutinePlan` takes milliseconds and the same inputs always give the
+same plan. Explanatory text is templated; the hybrid engine has the LLM
+rewrite it (see :mod:`app.recommendations`).
+"""
+
+from __future__ import annotations
+
+import os
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, Iterable, Optional
+
+from .prompts import PRODUCTS
+from .schemas import (
+    PrioritizedConcern,
+    RoutineInstruction,
+    RoutineIntake,
+    RoutineLifestyle,
+    RoutineLifestyleDiet,
+    RoutineNarrative,
+    RoutinePlan,
+    RoutineProduct,
+    RoutineReasons,
+    RoutineSections,
+    RoutineStep,
+)
+
+ROUTINE_ENGINES = ("rules", "llm", "hybrid")
+# Bump when a rule changes, so cached plans built by the old rules are not served.
+ROUTINE_RULES_VERSION = "2"
+
+_BRANDS = (
+    "La Roche-Posay", "iS Clinical", "CeraVe", "Cetaphil", "The Inkey List", "The INKEY List", "First Aid Beauty",
+    "SkinCeuticals", "Neutrogena", "Kiehl's", "EltaMD", "Isdin", "Supergoop!", "The Ordinary", "Paula's Choice",
+    "Differin", "Naturium", "Charlotte Tilbury", "RoC", "Medik8", "Summer Fridays", "Tatcha",
+)
+_TIERS = {"Budget": "budget", "Mid-Range": "mid", "Premium": "premium"}
+_TIER_PREFERENCE = {
+    "budget": {"budget": 1.0, "mid": 0.0, "premium": -2.0},
+    "mid": {"budget": 0.5, "mid": 1.0, "premium": -1.0},
+    "premium": {"budget": 0.0, "mid": 0.5, "premium": 1.0},
+    "no_pref": {"budget": 0.5, "mid": 0.5, "premium": 0.0},
+}
+_PRODUCTS_PER_STEP = 2
+
+# Concern -> (score, inverted) and the catalog TargetProblem terms that treat it.
+_CONCERN_SCORES = {
+    "acne": ("acne", False),
+    "pigmentation": ("pigmentation", False),
+    "redness": ("sensitivity_redness", False),
+    "wrinkles": ("wrinkles", False),
+    "oily_shine": ("oily_shine", False),
+    "dryness": ("hydration", True),
+}
+_CONCERN_TARGETS = {
+    "acne": ("Acne",),
+    "pigmentation": ("Hyperpigmentation", "Melasma", "Freckles", "PIE"),
+    "redness": ("Redness",),
+    "wrinkles": ("Wrinkles",),
+    "oily_shine": ("Oily",),
+    "dryness": ("Dryness", "Dehydrated"),
+}
+_SKIN_TYPE_PROFILES = {
+    "dry": "Dry_Skin",
+    "oily": "Oily_Skin",
+    "combination": "Combination_Skin",
+    "normal": "Normal_Skin",
+}
+_RETINOIDS = ("Retin", "Adapalene")
+_STRONG_ACTIVES = (*_RETINOIDS, "Salicylic Acid 2%", "L-Ascorbic Acid 15%")
+# Actives applied in the morning; everything else goes in the evening.
+_MORNING_ACTIVES = ("Ascorbic", "Vitamin C", "Hyaluronic")
+
+_INSTRUCTIONS = {
+    "cleanser": RoutineInstruction(how="Massage onto damp skin for 30-60 seconds, then rinse.", frequency="daily", timing="{period}"),
+    "active": RoutineInstruction(
+        how="Apply a pea-sized amount to dry skin.",
+        frequency="every other day for 2 weeks, then daily if tolerated",
+        timing="{period}, after cleansing",
+    ),
+    "moisturizer": RoutineInstruction(how="Apply a thin layer over the face.", frequency="daily", timing="{period}, after serums"),
+    "sunscreen": RoutineInstruction(
+        how="Apply two finger lengths to face and neck 15 minutes before sun exposure.",
+        frequency="daily",
+        timing="morning, last step",
+    ),
+    "refresh": RoutineInstruction(
+        how="Blot excess oil, then reapply sunscreen.",
+        frequency="every 2 hours outdoors",
+        timing="midday",
+    ),
+    "other": RoutineInstruction(how="Pat a rice-grain amount around the orbital bone.", frequency="daily", timing="{period}"),
+}
+
+
+def default_routine_engine() -> str:
+    engine = os.getenv("ROUTINE_ENGINE", "llm")
+    if engine not in ROUTINE_ENGINES:
+        raise ValueError(f"Unknown ROUTINE_ENGINE {engine!r}; expected one of {', '.join(ROUTINE_ENGINES)}.")
+    return engine
+
+
+@dataclass(frozen=True, slots=True)
+class CatalogProduct:
+    name: str
+    brand: str
+    tier: str
+    category: str
+    targets: tuple[str, ...]
+    profiles: tuple[str, ...]
+    actives: str
+    rating: float
+
+    @property
+    def id(self) -> str:
+        return re.sub(r"[^a-z0-9]+", "-", self.name.lower()).strip("-")
+
+    def treats(self, terms: Iterable[str]) -> bool:
+        return any(term.lower() in target.lower() for term in terms for target in self.targets)
+
+    def contains(self, terms: Iterable[str]) -> bool:
+        return any(term.lower() in self.actives.lower() for term in terms)
+
+
+def _split(cell: str) -> tuple[str, ...]:
+    return tuple(part.strip() for part in cell.split(",") if part.strip() and part.strip() != "N/A")
+
+
+@lru_cache
+def load_catalog() -> tuple[CatalogProduct, ...]:
+    """The product table of the routine prompt, parsed once."""
+    products = []
+    for line in PRODUCTS.splitlines():
+        cells = [cell.strip().replace("\\", "") for cell in line.strip().strip("|").split("|")]
+        if len(cells) != 10 or cells[1] not in _TIERS:
+            continue
+        name, tier, _, rating, _, category, targets, _, profiles, actives = cells
+        brand = next((brand for brand in _BRANDS if name.startswith(brand)), name.split()[0])
+        products.append(
+            CatalogProduct(
+                name=name,
+                brand=brand,
+                tier=_TIERS[tier],
+                category=category,
+                targets=_split(targets),
+                profiles=_split(profiles),
+                actives="" if actives == "N/A" else actives,
+                rating=float(rating.split("/")[0]),
+            )
+        )
+    return tuple(products)
+
+
+@dataclass(frozen=True, slots=True)
+class _Concern:
+    key: str
+    severity: str
+    score: str
+    value: int
+
+
+def _severity(value: int) -> Optional[str]:
+    if value >= 75:
+        return "severe"
+    if value >= 55:
+        return "moderate"
+    if value >= 35:
+        return "mild"
+    return None
+
+
+def _concerns(scores: Dict[str, Any]) -> list[_Concern]:
+    """Concerns worth treating, most severe first."""
+    found = []
+    for key, (score, inverted) in _CONCERN_SCORES.items():
+        if not isinstance(scores.get(score), (int, float)):
+            continue
+        value = int(100 - scores[score] if inverted else scores[score])
+        severity = _severity(value)
+        if severity is not None:
+            found.append(_Concern(key, severity, f"100-{score}" if inverted else score, value))
+    return sorted(found, key=lambda concern: -concern.value)
+
+
+class _Selector:
+    """Ranks catalog products for one user: concerns, skin profile, budget and exclusions."""
+
+    def __init__(self, intake: RoutineIntake, concerns: list[_Concern], profiles: set[str]) -> None:
+        self._intake = intake
+        self._weights = {concern.key: 2.0 if index == 0 else 1.0 for index, concern in enumerate(concerns)}
+        self._profiles = profiles
+        self._tiers = _TIER_PREFERENCE[intake.budget_preference]
+        self._excluded: list[str] = [allergy for allergy in intake.allergies if allergy.strip()]
+
+    def allowed(self, product: CatalogProduct) -> bool:
+        intake = self._intake
+        if intake.pregnancy != "no" and product.contains((*_RETINOIDS, "Hydroquinone")):
+            return False
+        if intake.sensitivity == "high" and product.contains(_STRONG_ACTIVES):
+            return False
+        if "Experienced_Retinol" in product.profiles and not any("retin" in active.lower() for active in intake.current_actives):
+            return False
+        if "High_Risk" in product.profiles:
+            return False  # The moles entry repeats a sunscreen listed on its own.
+        haystack = f"{product.name} {product.actives}".lower()
+        return not any(term.lower() in haystack for term in self._excluded)
+
+    def rank(self, category: str, targets: Iterable[str] = (), prefer: Iterable[str] = ()) -> list[CatalogProduct]:
+        targets, prefer = tuple(targets), tuple(prefer)
+
+        def _score(product: CatalogProduct) -> float:
+            score = sum(weight for key, weight in self._weights.items() if product.treats(_CONCERN_TARGETS[key]))
+            score += 2.0 * product.treats(targets)
+            score += 0.5 * len(self._profiles.intersection(product.profiles))
+            score += 1.0 * product.contains(prefer)
+            return score + self._tiers[product.tier] + product.rating / 10
+
+        candidates = [product for product in load_catalog() if product.category == category and self.allowed(product)]
+        return sorted(candidates, key=lambda product: (-_score(product), product.name))
+
+    def why(self, product: CatalogProduct) -> str:
+        treats = [key.replace("_", " ") for key in self._weights if product.treats(_CONCERN_TARGETS[key])]
+        reason = f"Targets {' and '.join(treats)}" if treats else f"Suits {', '.join(product.profiles[:2]).replace('_', ' ').lower()}"
+        return f"{reason}{f' with {product.actives}' if product.actives else ''}."
+
+
+def _step(kind: str, period: str, products: list[CatalogProduct], selector: _Selector) -> Optional[RoutineStep]:
+    if not products:
+        return None
+    instructions = _INSTRUCTIONS[kind].model_copy()
+    instructions.timing = instructions.timing.format(period=period)
+    return RoutineStep(
+        type=kind,
+        instructions=instructions,
+        products=[
+            RoutineProduct(id=product.id, brand=product.brand, name=product.name, tier=product.tier, why=selector.why(product))
+            for product in products[:_PRODUCTS_PER_STEP]
+        ],
+    )
+
+
+def _lifestyle(concerns: list[_Concern]) -> RoutineLifestyle:
+    keys = {concern.key for concern in concerns}
+    increase = ["vegetables and fruit", "water through the day"]
+    limit = ["smoking"]
+    if "acne" in keys or "oily_shine" in keys:
+        increase.append("oily fish or other omega-3 sources")
+        limit.extend(["sugary drinks and refined carbs", "dairy if breakouts follow it"])
+    if "dryness" in keys:
+        increase.append("healthy fats such as nuts and olive oil")
+        limit.append("very hot showers")
+    if "redness" in keys:
+        limit.extend(["alcohol", "very spicy food if it triggers flushing"])
+    return RoutineLifestyle(
+        sleep="Aim for 7-9 hours on a regular schedule.",
+        stress="Build in a short daily wind-down, such as a walk or breathing exercises.",
+        sun="Wear sunscreen daily and reapply every 2 hours outdoors; seek shade at midday."
+        + (" Sun exposure darkens existing spots." if "pigmentation" in keys else ""),
+        habits="Avoid picking or touching the face; clean your phone screen regularly.",
+        routine_hygiene="Change pillowcases weekly and introduce one new product at a time.",
+        diet=RoutineLifestyleDiet(increase=increase, limit=limit, supplements=[]),
+    )
+
+
+def build_routine(analysis: Dict[str, Any], intake: RoutineIntake) -> RoutinePlan:
+    """Build a complete routine for an analysis result; pure and CPU-only."""
+    profile = analysis.get("global_profile") or {}
+    scores = profile.get("scores") or {}
+    issues = analysis.get("issues") or {}
+    concerns = _concerns(scores)
+    severe = [concern for concern in concerns if concern.severity == "severe" and concern.key in ("acne", "redness")]
+    moles = [issue for issue in issues.get("moles_or_nevi") or [] if issue.get("intensity", 0) >= 0.7]
+
+    profiles = {"All_Profiles"}
+    skin_type = (profile.get("skin_type") or {}).get("label")
+    if skin_type in _SKIN_TYPE_PROFILES:
+        profiles.add(_SKIN_TYPE_PROFILES[skin_type])
+    if intake.sensitivity == "high" or any(concern.key == "redness" for concern in concerns):
+        profiles.update(("Sensitive_Skin", "Rosacea"))
+    if any(concern.key == "acne" for concern in concerns):
+        profiles.add("Acne_Prone")
+    selector = _Selector(intake, concerns, profiles)
+    concern_keys = {concern.key for concern in concerns}
+
+    warnings = ["Patch test each new product on the jaw for 2-3 days before using it on the whole face."]
+    active: Optional[CatalogProduct] = None
+    active_period = "pm"
+    if intake.rx_topical == "yes":
+        warnings.append("You use a prescription topical, so no over-the-counter active was added; follow your prescriber.")
+    elif severe or moles:
+        warnings.append("Some findings look significant; see a dermatologist before starting over-the-counter actives.")
+    else:
+        current = [item.lower().replace("_", " ") for item in intake.current_actives if item.strip()]
+        for concern in concerns:
+            options = selector.rank("Serum", targets=_CONCERN_TARGETS[concern.key])
+            options = [product for product in options if product.treats(_CONCERN_TARGETS[concern.key])]
+            if current:
+                # One potent active at a time: only continue with what the user already uses.
+                options = [product for product in options if any(item in product.actives.lower() for item in current)]
+            if options:
+                active = options[0]
+                active_period = "am" if active.contains(_MORNING_ACTIVES) else "pm"
+                break
+        if current and active is None:
+            warnings.append("Keep your current actives as they are; no new one was added to avoid stacking irritants.")
+    if intake.pregnancy != "no":
+        warnings.append("Retinoids and hydroquinone were left out because of pregnancy or unknown pregnancy status.")
+    if moles:
+        warnings.append("Have a dermatologist check the marked moles, and protect them from the sun daily.")
+    if intake.allergies:
+        warnings.append("Allergies were matched against product names and key actives only; check full ingredient lists.")
+
+    oily = bool(concern_keys & {"acne", "oily_shine"})
+    cleansers = selector.rank("Cleanser", targets=("Acne", "Oily") if oily else ("Dryness",))
+    moisturizers = selector.rank("Moisturizer", targets=("Oily",) if oily else ("Dryness",))
+    mineral = intake.sensitivity == "high" or "pigmentation" in concern_keys or intake.fitzpatrick in ("III-IV", "V-VI")
+    sunscreens = selector.rank("Sunscreen", prefer=("Zinc Oxide",) if mineral else ())
+
+    am = [_step("cleanser", "morning", cleansers, selector)]
+    pm = [_step("cleanser", "evening", cleansers, selector)]
+    if active is not None:
+        (am if active_period == "am" else pm).append(_step("active", "morning" if active_period == "am" else "evening", [active], selector))
+    am.extend([_step("moisturizer", "morning", moisturizers, selector), _step("sunscreen", "morning", sunscreens, selector)])
+    pm.append(_step("moisturizer", "evening", moisturizers, selector))
+    if scores.get("dark_circles", 0) >= 55 or "wrinkles" in concern_keys:
+        eye_targets = ("Dark Circles",) if scores.get("dark_circles", 0) >= 55 else ("Wrinkles",)
+        eye_creams = [product for product in selector.rank("Eye Cream", targets=eye_targets) if product.treats(eye_targets)]
+        pm.append(_step("other", "evening", eye_creams, selector))
+    midday = None
+    if oily or "pigmentation" in concern_keys:
+        midday = [step for step in (_step("refresh", "midday", sunscreens, selector),) if step is not None]
+
+    if concerns:
+        notes = f"Focus on {concerns[0].key.replace('_', ' ')} first; give each change 6-8 weeks before judging it."
+    else:
+        notes = "No concern stands out, so the routine keeps the skin barrier healthy and protected."
+    return RoutinePlan(
+        routine=RoutineSections(
+            am=[step for step in am if step is not None],
+            midday=midday or None,
+            pm=[step for step in pm if step is not None],
+        ),
+        reasons=RoutineReasons(
+            prioritized_concerns=[
+                PrioritizedConcern(key=concern.key, severity=concern.severity, why=f"{concern.score} score is {concern.value}/100.")
+                for concern in concerns[:2]
+            ],
+            notes=notes,
+        ),
+        warnings=warnings,
+        lifestyle=_lifestyle(concerns),
+    )
+
+
+def _safe_lifestyle(lifestyle: RoutineLifestyle, intake: RoutineIntake) -> RoutineLifestyle:
+    """Hold LLM-written lifestyle advice to the same pregnancy and allergy rules as the products."""
+    safe = lifestyle.model_copy(deep=True)
+    if intake.pregnancy != "no":
+        # Nothing vets supplements for pregnancy; the rule-built text never lists any.
+        safe.diet.supplements = []
+    excluded = [allergy.strip().lower() for allergy in intake.allergies if allergy.strip()]
+    if excluded:
+        safe.diet.increase = [item for item in safe.diet.increase if not any(term in item.lower() for term in excluded)]
+        safe.diet.supplements = [item for item in safe.diet.supplements if not any(term in item.lower() for term in excluded)]
+    return safe
+
+
+def apply_narrative(plan: RoutinePlan, narrative: RoutineNarrative, intake: RoutineIntake) -> RoutinePlan:
+    """Swap the templated text of ``plan`` for the LLM's; entries it did not cover keep theirs.
+
+    The LLM's lifestyle advice is filtered against ``intake`` first, like the products were.
+    """
+    merged = plan.model_copy(deep=True)
+    product_why = {item.key: item.text for item in narrative.product_why if item.text.strip()}
+    concern_why = {item.key: item.text for item in narrative.concern_why if item.text.strip()}
+    for steps in (merged.routine.am, merged.routine.midday or [], merged.routine.pm):
+        for step in steps:
+            for product in step.products:
+                product.why = product_why.get(product.name, product.why)
+    for concern in merged.reasons.prioritized_concerns:
+        concern.why = concern_why.get(concern.key, concern.why)
+    merged.reasons.notes = narrative.notes.strip() or merged.reasons.notes
+    merged.lifestyle = _safe_lifestyle(narrative.lifestyle, intake)
+    return merged
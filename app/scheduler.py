@@ -0,0 +1,123 @@
+"""Fair-share scheduling of the global pool of concurrent LLM calls."""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from functools import lru_cache
+from typing import AsyncIterator, Dict, Optional
+
+from . import metrics
+from .ratelimit import llm_usage_user
+
+
+class Priority(IntEnum):
+    """Lower values are served first."""
+
+    INTERACTIVE = 0  # the user is watching: routine generation, first workflow step
+    BACKGROUND = 1  # later workflow steps
+    BATCH = 2  # bulk re-analysis and other offline work
+
+
+# Priority applied to LLM calls that do not pass one explicitly.
+llm_priority: ContextVar[Priority] = ContextVar("llm_priority", default=Priority.BACKGROUND)
+
+_ANONYMOUS = "anonymous"
+
+
+class FairScheduler:
+    """Grants ``slots`` concurrent LLM calls, strictly by priority class and
+    round-robin across users within a class, so one heavy user cannot crowd out
+    everyone else queued at the same priority.
+    """
+
+    def __init__(self, slots: int) -> None:
+        self._slots = slots
+        self._available = slots
+        self._queues: Dict[Priority, OrderedDict[str, deque[asyncio.Future[None]]]] = {
+            priority: OrderedDict() for priority in Priority
+        }
+        self._depths: Dict[Priority, int] = {priority: 0 for priority in Priority}
+
+    @property
+    def in_use(self) -> int:
+        return self._slots - self._available
+
+    def queue_depth(self, priority: Priority) -> int:
+        return self._depths[priority]
+
+    def _publish(self) -> None:
+        metrics.set_gauge("scheduler.slots_in_use", self.in_use)
+        for priority, depth in self._depths.items():
+            metrics.set_gauge(f"scheduler.queue_depth.{priority.name.lower()}", depth)
+
+    async def acquire(self, priority: Priority, user_id: str) -> None:
+        started = time.perf_counter()
+        if self._available > 0 and not any(self._depths.values()):
+            self._available -= 1
+        else:
+            future: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+            self._queues[priority].setdefault(user_id, deque()).append(future)
+            self._depths[priority] += 1
+            self._publish()
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # The slot was handed over just as we were cancelled; pass it on.
+                    self.release()
+                else:
+                    self._discard(priority, user_id, future)
+                raise
+        metrics.observe(f"scheduler.wait_seconds.{priority.name.lower()}", time.perf_counter() - started)
+        self._publish()
+
+    def _discard(self, priority: Priority, user_id: str, future: asyncio.Future[None]) -> None:
+        waiters = self._queues[priority].get(user_id)
+        if waiters is None or future not in waiters:
+            return
+        waiters.remove(future)
+        self._depths[priority] -= 1
+        if not waiters:
+            del self._queues[priority][user_id]
+        self._publish()
+
+    def release(self) -> None:
+        for priority in Priority:
+            users = self._queues[priority]
+            while users:
+                user_id, waiters = next(iter(users.items()))
+                future = waiters.popleft()
+                self._depths[priority] -= 1
+                if waiters:
+                    users.move_to_end(user_id)
+                else:
+                    del users[user_id]
+                if not future.done():
+                    # Hand the slot straight to the next waiter.
+                    future.set_result(None)
+                    return
+        self._available += 1
+        self._publish()
+
+    @asynccontextmanager
+    async def slot(self, priority: Optional[Priority] = None, user_id: Optional[str] = None) -> AsyncIterator[None]:
+        """Hold one LLM slot; priority and user default to the current context."""
+        await self.acquire(
+            llm_priority.get() if priority is None else priority,
+            user_id or llm_usage_user.get() or _ANONYMOUS,
+        )
+        try:
+            yield
+        finally:
+            self.release()
+
+
+@lru_cache
+def get_llm_scheduler() -> FairScheduler:
+    return FairScheduler(int(os.getenv("LLM_MAX_CONCURRENCY", "16")))
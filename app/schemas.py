@@ -68,6 +68,15 @@ IssueRegion = Literal[
 ]
 
 
+class FaceGeometry(BaseModel):
+    """ML Kit face landmarks and contours, in pixels of the image they were detected on."""
+
+    image_width: Optional[int] = Field(None, ge=1, description="Width of the frame ML Kit ran on, if not the upload itself.")
+    image_height: Optional[int] = Field(None, ge=1, description="Height of the frame ML Kit ran on, if not the upload itself.")
+    landmarks: Dict[IssueRegion, tuple[float, float]] = Field(default_factory=dict, description="Landmark position per region.")
+    contours: Dict[IssueRegion, list[tuple[float, float]]] = Field(default_factory=dict, description="Contour points per region.")
+
+
 class IssueItem(BaseModel):
     region: IssueRegion = Field(..., description="ML Kit region identifier where the issue is located.")
     intensity: float = Field(..., ge=0.0, le=1.0, description="Severity between 0 and 1.")
@@ -188,9 +197,34 @@ class AgingIssuesResult(BaseModel):
     issues: AgingIssues
 
 
+class CombinedAnalysisResult(BaseModel):
+    global_profile: GlobalProfile
+    issues: IssuesCollection
+
+
 class UpgradedFaceAnalysisResult(BaseModel):
     global_profile: GlobalProfile
     issues: IssuesCollection
+    step_versions: Dict[str, str] = Field(
+        default_factory=dict,
+        description="Prompt version each step's output was produced with.",
+    )
+    skipped_steps: Dict[str, str] = Field(
+        default_factory=dict,
+        description="Issue steps not run because step 1 found nothing relevant or they would miss the deadline, with the reason.",
+    )
+    downgraded_steps: Dict[str, str] = Field(
+        default_factory=dict,
+        description="Issue steps run on the fast model, with the reason.",
+    )
+    cancelled_steps: Dict[str, str] = Field(
+        default_factory=dict,
+        description="Issue steps cancelled when the client's deadline passed, with the reason.",
+    )
+    execution_mode: Literal["sequential", "parallel", "single_call"] = Field(
+        "sequential",
+        description="Whether the issue steps ran one after another, concurrently, or as one combined call to fit a deadline.",
+    )
 
 
 class TaskCreatedResponse(BaseModel):
@@ -203,6 +237,72 @@ class TaskStatusResponse(BaseModel):
     result: Optional[Dict[str, Any]] = None
     error: Optional[str] = None
     routine_json: Optional[Dict[str, Any]] = None
+    version: int = 0
+    current_step: Optional[str] = None
+    eta_seconds: Optional[float] = None
+    estimated_completion_at: Optional[str] = None
+
+
+class TaskDeltaResponse(BaseModel):
+    task_id: str
+    status: str
+    version: int
+    changes: Dict[str, Any] = Field(
+        default_factory=dict,
+        description="Changed sections since the requested version, keyed like 'global_profile' or 'issues.acne_active'.",
+    )
+    current_step: Optional[str] = None
+    eta_seconds: Optional[float] = None
+    estimated_completion_at: Optional[str] = None
+
+
+class TaskSummaryResponse(BaseModel):
+    task_id: str
+    status: str
+    created_at: str
+    error: Optional[str] = None
+    scores: Optional[Dict[str, Any]] = None
+    skin_type: Optional[str] = None
+    skin_age: Optional[int] = None
+    result: Optional[Dict[str, Any]] = None
+    routine_json: Optional[Dict[str, Any]] = None
+
+
+class TrendPoint(BaseModel):
+    task_id: str
+    at: str
+    value: float
+
+
+class MetricTrend(BaseModel):
+    count: int
+    mean: float
+    ema: float = Field(..., description="Exponential moving average, weighted towards recent analyses.")
+    moving_average: float = Field(..., description="Mean of the last few analyses.")
+    latest: float
+    delta: Optional[float] = Field(None, description="Change since the previous analysis.")
+    series: list[TrendPoint] = Field(default_factory=list)
+
+
+class TrendsResponse(BaseModel):
+    task_count: int = 0
+    last_task_id: Optional[str] = None
+    last_at: Optional[str] = None
+    metrics: Dict[str, MetricTrend] = Field(
+        default_factory=dict,
+        description="Per score (plus skin_age) statistics, keyed like ScoreBreakdown.",
+    )
+    regions: Dict[str, Dict[str, int]] = Field(
+        default_factory=dict,
+        description="Issue counts per region and category across all analyses.",
+    )
+    latest_regions: Dict[str, Dict[str, int]] = Field(default_factory=dict)
+
+
+class ReanalysisResponse(BaseModel):
+    task_id: str
+    steps: list[str]
+    poll_path: str
 
 
 class RoutineIntake(BaseModel):
@@ -219,6 +319,12 @@ class RoutineIntake(BaseModel):
 class RecommendationRequest(BaseModel):
     task_id: str
     intake: RoutineIntake
+    engine: Optional[Literal["rules", "llm", "hybrid"]] = Field(
+        None, description="How the routine is built; defaults to ROUTINE_ENGINE."
+    )
+    latency_budget_seconds: Optional[float] = Field(
+        None, gt=0, description="Seconds the client will wait; a faster engine is used if the requested one would not fit."
+    )
 
 
 class RecommendationResponse(BaseModel):
@@ -289,3 +395,17 @@ class RoutinePlan(BaseModel):
     reasons: RoutineReasons
     warnings: list[str]
     lifestyle: RoutineLifestyle
+
+
+class NarrativeText(BaseModel):
+    key: str = Field(..., description="Product name or concern key the text belongs to.")
+    text: str
+
+
+class RoutineNarrative(BaseModel):
+    """Explanations for a rule-built routine; its products and steps stay as they are."""
+
+    product_why: list[NarrativeText]
+    concern_why: list[NarrativeText]
+    notes: str
+    lifestyle: RoutineLifestyle
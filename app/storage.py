@@ -2,17 +2,29 @@
 
 from __future__ import annotations
 
+import base64
+import hashlib
+import json
 import logging
 import os
+import time
+import uuid
+from collections import OrderedDict
 from dataclasses import dataclass
-from typing import Any, Dict, Optional
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, Optional, Protocol, cast
 
 import httpx
+import orjson
 from fastapi import HTTPException, status
 
+from .executor import offload
+
 logger = logging.getLogger(__name__)
 
 
+@lru_cache
 def _get_supabase_rest_config() -> tuple[str, str]:
     supabase_url = os.getenv("SUPABASE_URL")
     service_role_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
@@ -28,6 +40,97 @@ def _unauthorized() -> HTTPException:
     return HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized")
 
 
+# Columns fetched for history listings. Headline values are pulled out of the
+# ``result`` jsonb with PostgREST JSON paths so the blobs never leave the database.
+SUMMARY_COLUMNS = (
+    "id",
+    "user_id",
+    "status",
+    "error",
+    "created_at",
+    "scores:result->global_profile->scores",
+    "skin_type:result->global_profile->skin_type->>label",
+    "skin_age:result->global_profile->skin_age->>estimated_age",
+)
+SUMMARY_INCLUDABLE = ("result", "routine_json")
+# Statuses after which no background work writes to the task again.
+TERMINAL_TASK_STATUSES = frozenset({"completed", "failed", "cancelled", "interrupted"})
+
+
+# Sections whose changes are tracked per version. Result sections are its top-level
+# keys, with ``issues`` split per category so one finished step is one small delta.
+TASK_FIELD_SECTIONS = ("status", "error", "routine_json")
+CHANGE_LOG_LIMIT = int(os.getenv("TASK_CHANGE_LOG_LIMIT", "50"))
+_VERSIONED_WRITE_ATTEMPTS = 5
+_REVISION_COLUMNS = ("version", "section_hashes", "change_log")
+
+
+def task_sections(fields: Dict[str, Any]) -> Dict[str, Any]:
+    """Split task column values into the sections that deltas are made of."""
+    sections = {key: fields[key] for key in TASK_FIELD_SECTIONS if key in fields}
+    result = fields.get("result")
+    if isinstance(result, dict):
+        for key, value in result.items():
+            if key == "issues" and isinstance(value, dict):
+                sections.update({f"issues.{name}": items for name, items in value.items()})
+            else:
+                sections[key] = value
+    return sections
+
+
+def section_hashes(fields: Dict[str, Any]) -> Dict[str, str]:
+    return {
+        name: hashlib.sha256(orjson.dumps(value, option=orjson.OPT_SORT_KEYS)).hexdigest()[:16]
+        for name, value in task_sections(fields).items()
+    }
+
+
+def versioned_update(row: Dict[str, Any], data: Dict[str, Any]) -> Dict[str, Any]:
+    """Return ``data`` plus the version bookkeeping for applying it on top of ``row``.
+
+    ``row`` needs the ``version``, ``section_hashes`` and ``change_log`` columns;
+    the version only moves when some section actually changed.
+    """
+    version = int(row.get("version") or 0)
+    hashes: Dict[str, str] = dict(row.get("section_hashes") or {})
+    new_hashes = section_hashes(data)
+    removed: set[str] = set()
+    if "result" in data:
+        # Result sections missing from the new result were removed.
+        removed = {name for name in hashes if name not in TASK_FIELD_SECTIONS and name not in new_hashes}
+    changed = sorted(removed | {name for name, digest in new_hashes.items() if hashes.get(name) != digest})
+    payload = dict(data)
+    if changed:
+        log = list(row.get("change_log") or [])
+        log.append({"version": version + 1, "sections": changed, "at": round(time.time(), 3)})
+        for name in removed:
+            del hashes[name]
+        hashes.update(new_hashes)
+        payload.update(version=version + 1, change_log=log[-CHANGE_LOG_LIMIT:], section_hashes=hashes)
+    return payload
+
+
+def encode_cursor(created_at: str, task_id: str) -> str:
+    """Encode a keyset position as an opaque URL-safe token."""
+    raw = json.dumps([created_at, task_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[str, str]:
+    """Decode a token produced by :func:`encode_cursor`; raises ``ValueError`` if malformed.
+
+    Cursors come from the client, and every backend puts their values into a
+    query, so the id must be a UUID and ``created_at`` an ISO 8601 timestamp.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, task_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        datetime.fromisoformat(created_at)
+        return created_at, str(uuid.UUID(task_id))
+    except Exception as exc:  # noqa: BLE001
+        raise ValueError("Invalid cursor.") from exc
+
+
 @dataclass(slots=True)
 class TaskRecord:
     id: str
@@ -37,13 +140,197 @@ class TaskRecord:
     error: Optional[str]
     intake: Optional[Dict[str, Any]] = None
     routine_json: Optional[Dict[str, Any]] = None
+    real_age: Optional[int] = None
+    version: int = 0
+    change_log: Optional[list[Dict[str, Any]]] = None
+
+
+@dataclass(slots=True)
+class StoredImage:
+    data: bytes
+    mime_type: str
+
+
+@dataclass(slots=True)
+class TaskSummaryRecord:
+    id: str
+    user_id: str
+    status: str
+    created_at: str
+    error: Optional[str] = None
+    scores: Optional[Dict[str, Any]] = None
+    skin_type: Optional[str] = None
+    skin_age: Optional[int] = None
+    result: Optional[Dict[str, Any]] = None
+    routine_json: Optional[Dict[str, Any]] = None
 
 
-class TaskRepository:
-    """Light-weight wrapper around Supabase's PostgREST endpoint."""
+@dataclass(slots=True)
+class TaskSummaryPage:
+    items: list[TaskSummaryRecord]
+    next_cursor: Optional[str] = None
 
-    def __init__(self, table_name: str = "skin_analysis_tasks") -> None:
+
+def task_delta(task: TaskRecord, since: int) -> Optional[Dict[str, Any]]:
+    """Sections changed after version ``since``, or ``None`` if the log no longer reaches back that far.
+
+    Sections that no longer exist map to ``None``.
+    """
+    if since >= task.version:
+        return {}
+    entries = task.change_log or []
+    if not entries or entries[0]["version"] > since + 1:
+        return None
+    changed = {name for entry in entries if entry["version"] > since for name in entry["sections"]}
+    current = task_sections({"status": task.status, "error": task.error, "routine_json": task.routine_json, "result": task.result})
+    return {name: current.get(name) for name in sorted(changed)}
+
+
+def new_task_payload(user_id: str, real_age: int | None) -> Dict[str, Any]:
+    payload: Dict[str, Any] = {
+        "user_id": user_id,
+        "status": "queued",
+        "result": None,
+        "error": None,
+        "real_age": real_age,
+        "intake": None,
+        "routine_json": None,
+        "version": 1,
+        "change_log": [],
+    }
+    payload["section_hashes"] = section_hashes(payload)
+    return payload
+
+
+def update_payload(
+    status_value: str | None,
+    result_value: Dict[str, Any] | None,
+    error_value: str | None,
+    routine_json_value: Dict[str, Any] | None,
+) -> Dict[str, Any]:
+    data: Dict[str, Any] = {}
+    if status_value is not None:
+        data["status"] = status_value
+    if result_value is not None:
+        data["result"] = result_value
+    if error_value is not None:
+        data["error"] = error_value
+    if routine_json_value is not None:
+        data["routine_json"] = routine_json_value
+    return data
+
+
+def task_record_from_row(row: Dict[str, Any]) -> TaskRecord:
+    return TaskRecord(
+        id=str(row["id"]),
+        user_id=str(row["user_id"]),
+        status=row.get("status", "queued"),
+        result=row.get("result"),
+        error=row.get("error"),
+        intake=row.get("intake"),
+        routine_json=row.get("routine_json"),
+        real_age=row.get("real_age"),
+        version=int(row.get("version") or 0),
+        change_log=row.get("change_log"),
+    )
+
+
+def summary_record_from_row(row: Dict[str, Any]) -> TaskSummaryRecord:
+    skin_age = row.get("skin_age")
+    return TaskSummaryRecord(
+        id=str(row["id"]),
+        user_id=str(row["user_id"]),
+        status=row.get("status", "queued"),
+        created_at=str(row["created_at"]),
+        error=row.get("error"),
+        scores=row.get("scores"),
+        skin_type=row.get("skin_type"),
+        skin_age=int(skin_age) if skin_age is not None else None,
+        result=row.get("result"),
+        routine_json=row.get("routine_json"),
+    )
+
+
+class TaskStore(Protocol):
+    """What the routes and jobs need from task persistence; see ``get_task_repository``."""
+
+    async def create_task(self, *, user_id: str, real_age: int | None = None) -> TaskRecord: ...
+
+    async def create_task_row(self, *, user_id: str, real_age: int | None = None) -> Dict[str, Any]: ...
+
+    async def update_task(
+        self,
+        task_id: str,
+        *,
+        status_value: str | None = None,
+        result_value: Dict[str, Any] | None = None,
+        error_value: str | None = None,
+        routine_json_value: Dict[str, Any] | None = None,
+    ) -> TaskRecord | None: ...
+
+    async def save_routine_plan(self, task_id: str, *, intake: Dict[str, Any], routine_json: Dict[str, Any]) -> TaskRecord | None: ...
+
+    async def get_task(self, task_id: str, *, user_id: str | None = None) -> TaskRecord | None: ...
+
+    async def get_task_row(self, task_id: str, *, user_id: str | None = None) -> Dict[str, Any] | None: ...
+
+    async def write_task_snapshot(self, task_id: str, fields: Dict[str, Any]) -> None:
+        """Store a full task state produced elsewhere, unless the row already holds a newer version."""
+
+    async def list_tasks(self, user_id: str, limit: int = 10) -> list[TaskRecord]: ...
+
+    async def list_task_summaries(
+        self,
+        user_id: str,
+        *,
+        limit: int = 10,
+        cursor: str | None = None,
+        include: Iterable[str] = (),
+    ) -> TaskSummaryPage: ...
+
+    async def save_task_image(self, task_id: str, *, user_id: str, image_bytes: bytes, mime_type: str) -> None: ...
+
+    async def load_task_image(self, task_id: str, *, user_id: str) -> StoredImage | None: ...
+
+    async def delete_task_image(self, task_id: str, *, user_id: str) -> None: ...
+
+    async def aclose(self) -> None: ...
+
+
+class TrendStore(Protocol):
+    """Per-user trend rollups; see ``get_trend_repository``."""
+
+    async def get_rollup(self, user_id: str) -> Dict[str, Any] | None: ...
+
+    async def update_rollup(
+        self,
+        user_id: str,
+        apply: Callable[[Dict[str, Any] | None], Dict[str, Any]],
+    ) -> Dict[str, Any]:
+        """Replace the rollup with ``apply(current)`` without losing a concurrent update."""
+
+    async def aclose(self) -> None: ...
+
+
+class _PostgrestTable:
+    """Shared plumbing for PostgREST tables: one pooled HTTP client per repository."""
+
+    def __init__(self, table_name: str) -> None:
         self._table_name = table_name
+        self._client: httpx.AsyncClient | None = None
+
+    def _http(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=10,
+                limits=httpx.Limits(max_connections=int(os.getenv("SUPABASE_MAX_CONNECTIONS", "50"))),
+            )
+        return self._client
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
 
     def _table_url(self) -> str:
         supabase_url, _ = _get_supabase_rest_config()
@@ -58,17 +345,30 @@ class TaskRepository:
             "Prefer": "return=representation",
         }
 
+
+class TaskRepository(_PostgrestTable):
+    """Task store backed by Supabase's PostgREST endpoint."""
+
+    def __init__(self, table_name: str = "skin_analysis_tasks") -> None:
+        super().__init__(table_name)
+        # Last revision seen per task, so a versioned write needs no read first.
+        self._revisions: OrderedDict[str, Dict[str, Any]] = OrderedDict()
+        self._revision_cache_size = int(os.getenv("TASK_REVISION_CACHE_SIZE", "4096"))
+
+    def _remember_revision(self, row: Dict[str, Any]) -> None:
+        if "id" not in row or any(column not in row for column in _REVISION_COLUMNS):
+            return
+        task_id = str(row["id"])
+        self._revisions[task_id] = {column: row[column] for column in _REVISION_COLUMNS}
+        self._revisions.move_to_end(task_id)
+        while len(self._revisions) > self._revision_cache_size:
+            self._revisions.popitem(last=False)
+
     async def create_task(self, *, user_id: str, real_age: int | None = None) -> TaskRecord:
-        payload: Dict[str, Any] = {
-            "user_id": user_id,
-            "status": "queued",
-            "result": None,
-            "error": None,
-            "real_age": real_age,
-            "intake": None,
-            "routine_json": None,
-        }
-        return await self._insert(payload)
+        return task_record_from_row(await self.create_task_row(user_id=user_id, real_age=real_age))
+
+    async def create_task_row(self, *, user_id: str, real_age: int | None = None) -> Dict[str, Any]:
+        return await self._insert_row(new_task_payload(user_id, real_age))
 
     async def update_task(
         self,
@@ -79,26 +379,21 @@ class TaskRepository:
         error_value: str | None = None,
         routine_json_value: Dict[str, Any] | None = None,
     ) -> TaskRecord | None:
-        data: Dict[str, Any] = {}
-        if status_value is not None:
-            data["status"] = status_value
-        if result_value is not None:
-            data["result"] = result_value
-        if error_value is not None:
-            data["error"] = error_value
-        if routine_json_value is not None:
-            data["routine_json"] = routine_json_value
+        data = update_payload(status_value, result_value, error_value, routine_json_value)
         if not data:
             return None
-        return await self._patch(task_id, data)
+        return await self._versioned_patch(task_id, data)
 
     async def get_task(self, task_id: str, *, user_id: str | None = None) -> TaskRecord | None:
+        row = await self.get_task_row(task_id, user_id=user_id)
+        return task_record_from_row(row) if row is not None else None
+
+    async def get_task_row(self, task_id: str, *, user_id: str | None = None) -> Dict[str, Any] | None:
         params = {"id": f"eq.{task_id}", "limit": "1"}
         if user_id is not None:
             params["user_id"] = f"eq.{user_id}"
         url = self._table_url()
-        async with httpx.AsyncClient(timeout=10) as client:
-            response = await client.get(url, headers=self._headers(), params=params)
+        response = await self._http().get(url, headers=self._headers(), params=params)
         if response.status_code == status.HTTP_401_UNAUTHORIZED:
             raise _unauthorized()
         if response.status_code >= 400:
@@ -108,9 +403,21 @@ class TaskRepository:
                 detail="Failed to fetch task status.",
             )
         records = response.json()
-        if not records:
-            return None
-        return self._from_row(records[0])
+        if records:
+            self._remember_revision(records[0])
+        return records[0] if records else None
+
+    async def write_task_snapshot(self, task_id: str, fields: Dict[str, Any]) -> None:
+        """Store a full task state produced elsewhere, unless the row already holds a newer version."""
+        self._revisions.pop(task_id, None)
+        url = f"{self._table_url()}?id=eq.{task_id}&version=lt.{int(fields['version'])}"
+        headers = {**self._headers(), "Prefer": "return=minimal"}
+        response = await self._http().patch(url, headers=headers, json=fields)
+        if response.status_code == status.HTTP_401_UNAUTHORIZED:
+            raise _unauthorized()
+        if response.status_code >= 400:
+            logger.error("Failed to write snapshot of task %s: %s - %s", task_id, response.status_code, response.text)
+            raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail="Database operation failed.")
 
     async def list_tasks(self, user_id: str, limit: int = 10) -> list[TaskRecord]:
         params = {
@@ -119,42 +426,156 @@ class TaskRepository:
             "limit": str(limit),
         }
         url = self._table_url()
-        async with httpx.AsyncClient(timeout=10) as client:
-            response = await client.get(url, headers=self._headers(), params=params)
+        response = await self._http().get(url, headers=self._headers(), params=params)
         if response.status_code == status.HTTP_401_UNAUTHORIZED:
             raise _unauthorized()
         if response.status_code >= 400:
             logger.error("Failed to list tasks for %s: %s - %s", user_id, response.status_code, response.text)
             raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail="Failed to list tasks.")
-        return [self._from_row(row) for row in response.json()]
+        return [task_record_from_row(row) for row in response.json()]
 
-    async def _insert(self, payload: Dict[str, Any]) -> TaskRecord:
+    async def list_task_summaries(
+        self,
+        user_id: str,
+        *,
+        limit: int = 10,
+        cursor: str | None = None,
+        include: Iterable[str] = (),
+    ) -> TaskSummaryPage:
+        """Return a page of lightweight task rows ordered newest first.
+
+        Pagination is keyset based on ``(created_at, id)`` so deep pages cost the
+        same as the first one. Heavy jsonb columns are only selected when listed
+        in ``include``.
+        """
+        columns = list(SUMMARY_COLUMNS)
+        columns.extend(column for column in SUMMARY_INCLUDABLE if column in set(include))
+        params = {
+            "select": ",".join(columns),
+            "user_id": f"eq.{user_id}",
+            "order": "created_at.desc,id.desc",
+            # One extra row tells us whether another page exists.
+            "limit": str(limit + 1),
+        }
+        if cursor is not None:
+            created_at, task_id = decode_cursor(cursor)
+            params["or"] = (
+                f'(created_at.lt."{created_at}",'
+                f'and(created_at.eq."{created_at}",id.lt."{task_id}"))'
+            )
         url = self._table_url()
-        async with httpx.AsyncClient(timeout=10) as client:
-            response = await client.post(url, headers=self._headers(), json=payload)
-        return self._handle_mutation_response(response)
-
-    async def _patch(self, task_id: str, payload: Dict[str, Any]) -> TaskRecord | None:
-        url = f"{self._table_url()}?id=eq.{task_id}"
-        async with httpx.AsyncClient(timeout=10) as client:
-            response = await client.patch(url, headers=self._headers(), json=payload)
-        if response.status_code == status.HTTP_204_NO_CONTENT:
-            return None
-        return self._handle_mutation_response(response)
+        response = await self._http().get(url, headers=self._headers(), params=params)
+        if response.status_code == status.HTTP_401_UNAUTHORIZED:
+            raise _unauthorized()
+        if response.status_code >= 400:
+            logger.error("Failed to list task summaries for %s: %s - %s", user_id, response.status_code, response.text)
+            raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail="Failed to list tasks.")
+        rows = response.json()
+        items = [summary_record_from_row(row) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit and items:
+            next_cursor = encode_cursor(items[-1].created_at, items[-1].id)
+        return TaskSummaryPage(items=items, next_cursor=next_cursor)
+
+    async def _insert_row(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        url = self._table_url()
+        response = await self._http().post(url, headers=self._headers(), json=payload)
+        row = self._mutation_row(response)
+        self._remember_revision(row)
+        return row
+
+    async def _versioned_patch(self, task_id: str, data: Dict[str, Any]) -> TaskRecord | None:
+        """Apply ``data`` and, if any section changed, bump the task version.
+
+        The write is conditional on the last version this repository saw, so
+        it is one round trip. If another writer got there first, the PATCH
+        matches nothing; only then is the revision read again and the write retried.
+        """
+        revision = self._revisions.get(task_id)
+        for _ in range(_VERSIONED_WRITE_ATTEMPTS):
+            if revision is None:
+                revision = await self._get_revision(task_id)
+                if revision is None:
+                    return None
+            version = int(revision.get("version") or 0)
+            payload = await offload(versioned_update, revision, data)
+            url = f"{self._table_url()}?id=eq.{task_id}&version=eq.{version}"
+            response = await self._http().patch(url, headers=self._headers(), json=payload)
+            if response.status_code == status.HTTP_200_OK and response.json() == []:
+                # Stale revision, or the task is gone: re-read before retrying.
+                self._revisions.pop(task_id, None)
+                revision = None
+                continue
+            if response.status_code == status.HTTP_204_NO_CONTENT:
+                return None
+            row = self._mutation_row(response)
+            self._remember_revision(row)
+            return task_record_from_row(row)
+        logger.error("Gave up updating task %s after %d conflicting writes", task_id, _VERSIONED_WRITE_ATTEMPTS)
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Task is being updated concurrently.")
+
+    async def _get_revision(self, task_id: str) -> Dict[str, Any] | None:
+        params = {"id": f"eq.{task_id}", "select": "version,section_hashes,change_log", "limit": "1"}
+        response = await self._http().get(self._table_url(), headers=self._headers(), params=params)
+        if response.status_code == status.HTTP_401_UNAUTHORIZED:
+            raise _unauthorized()
+        if response.status_code >= 400:
+            logger.error("Failed to fetch revision of task %s: %s - %s", task_id, response.status_code, response.text)
+            raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail="Database operation failed.")
+        records = response.json()
+        return records[0] if records else None
 
     async def save_routine_plan(self, task_id: str, *, intake: Dict[str, Any], routine_json: Dict[str, Any]) -> TaskRecord | None:
         payload: Dict[str, Any] = {
             "intake": intake,
             "routine_json": routine_json,
         }
-        return await self._patch(task_id, payload)
+        return await self._versioned_patch(task_id, payload)
+
+    def _image_url(self, task_id: str, user_id: str) -> str:
+        supabase_url, _ = _get_supabase_rest_config()
+        bucket = os.getenv("SUPABASE_IMAGE_BUCKET", "task-images")
+        return f"{supabase_url}/storage/v1/object/{bucket}/{user_id}/{task_id}"
+
+    async def save_task_image(self, task_id: str, *, user_id: str, image_bytes: bytes, mime_type: str) -> None:
+        """Keep the uploaded selfie in Supabase Storage so single steps can be rerun later."""
+        _, service_role_key = _get_supabase_rest_config()
+        headers = {
+            "apikey": service_role_key,
+            "Authorization": f"Bearer {service_role_key}",
+            "Content-Type": mime_type,
+            "x-upsert": "true",
+        }
+        response = await self._http().post(self._image_url(task_id, user_id), headers=headers, content=image_bytes, timeout=30)
+        if response.status_code not in (status.HTTP_200_OK, status.HTTP_201_CREATED):
+            logger.error("Failed to store image for task %s: %s - %s", task_id, response.status_code, response.text)
+            raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail="Image storage failed.")
+
+    async def load_task_image(self, task_id: str, *, user_id: str) -> StoredImage | None:
+        _, service_role_key = _get_supabase_rest_config()
+        headers = {"apikey": service_role_key, "Authorization": f"Bearer {service_role_key}"}
+        response = await self._http().get(self._image_url(task_id, user_id), headers=headers, timeout=30)
+        if response.status_code in (status.HTTP_400_BAD_REQUEST, status.HTTP_404_NOT_FOUND):
+            return None
+        if response.status_code != status.HTTP_200_OK:
+            logger.error("Failed to load image for task %s: %s - %s", task_id, response.status_code, response.text)
+            raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail="Image storage failed.")
+        return StoredImage(data=response.content, mime_type=response.headers.get("content-type", "image/jpeg"))
 
-    def _handle_mutation_response(self, response: httpx.Response) -> TaskRecord:
+    async def delete_task_image(self, task_id: str, *, user_id: str) -> None:
+        _, service_role_key = _get_supabase_rest_config()
+        headers = {"apikey": service_role_key, "Authorization": f"Bearer {service_role_key}"}
+        response = await self._http().delete(self._image_url(task_id, user_id), headers=headers, timeout=30)
+        if response.status_code not in (status.HTTP_200_OK, status.HTTP_400_BAD_REQUEST, status.HTTP_404_NOT_FOUND):
+            logger.error("Failed to delete image for task %s: %s - %s", task_id, response.status_code, response.text)
+            raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail="Image storage failed.")
+
+    def _mutation_row(self, response: httpx.Response) -> Dict[str, Any]:
         if response.status_code in (status.HTTP_200_OK, status.HTTP_201_CREATED):
             payload = response.json()
             if isinstance(payload, list):
                 payload = payload[0]
-            return self._from_row(payload)
+            return payload
         if response.status_code == status.HTTP_401_UNAUTHORIZED:
             raise _unauthorized()
         logger.error(
@@ -165,21 +586,93 @@ class TaskRepository:
         )
         raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail="Database operation failed.")
 
-    @staticmethod
-    def _from_row(row: Dict[str, Any]) -> TaskRecord:
-        return TaskRecord(
-            id=str(row["id"]),
-            user_id=str(row["user_id"]),
-            status=row.get("status", "queued"),
-            result=row.get("result"),
-            error=row.get("error"),
-            intake=row.get("intake"),
-            routine_json=row.get("routine_json"),
-        )
 
+class TrendRepository(_PostgrestTable):
+    """Per-user trend rollups kept in one small ``user_trends`` row each."""
+
+    def __init__(self, table_name: str = "user_trends") -> None:
+        super().__init__(table_name)
+
+    def _check(self, response: httpx.Response, user_id: str) -> None:
+        if response.status_code == status.HTTP_401_UNAUTHORIZED:
+            raise _unauthorized()
+        if response.status_code >= 400:
+            logger.error("Trend rollup request for %s failed: %s - %s", user_id, response.status_code, response.text)
+            raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail="Database operation failed.")
+
+    async def _get_row(self, user_id: str) -> Dict[str, Any] | None:
+        params = {"user_id": f"eq.{user_id}", "select": "rollup,revision", "limit": "1"}
+        response = await self._http().get(self._table_url(), headers=self._headers(), params=params)
+        self._check(response, user_id)
+        records = response.json()
+        return records[0] if records else None
+
+    async def get_rollup(self, user_id: str) -> Dict[str, Any] | None:
+        row = await self._get_row(user_id)
+        return row["rollup"] if row is not None else None
+
+    async def update_rollup(
+        self,
+        user_id: str,
+        apply: Callable[[Dict[str, Any] | None], Dict[str, Any]],
+    ) -> Dict[str, Any]:
+        """Read-modify-write the rollup, conditional on the revision read, retrying on conflict."""
+        for _ in range(_VERSIONED_WRITE_ATTEMPTS):
+            row = await self._get_row(user_id)
+            if row is None:
+                rollup = apply(None)
+                headers = {**self._headers(), "Prefer": "return=representation,resolution=ignore-duplicates"}
+                payload = {"user_id": user_id, "rollup": rollup, "revision": 1}
+                response = await self._http().post(self._table_url(), headers=headers, json=payload)
+            else:
+                rollup = apply(row["rollup"])
+                url = f"{self._table_url()}?user_id=eq.{user_id}&revision=eq.{row['revision']}"
+                payload = {"rollup": rollup, "revision": int(row["revision"]) + 1}
+                response = await self._http().patch(url, headers=self._headers(), json=payload)
+            self._check(response, user_id)
+            if response.json():
+                return rollup
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Trends are being updated concurrently.")
+
+
+@lru_cache
+def _backend_store() -> TaskStore:
+    """The store chosen by ``TASK_STORAGE_BACKEND``; the direct backends hold trends too."""
+    backend = os.getenv("TASK_STORAGE_BACKEND", "postgrest")
+    # Imported here because these modules build on this one.
+    if backend == "postgres":
+        from .storage_postgres import PostgresTaskRepository
+
+        return PostgresTaskRepository()
+    if backend == "sqlite":
+        from .storage_sqlite import SQLiteTaskRepository
+
+        return SQLiteTaskRepository(os.getenv("SQLITE_PATH", ":memory:"))
+    if backend == "postgrest":
+        return TaskRepository()
+    raise ValueError(f"Unknown TASK_STORAGE_BACKEND: {backend}")
+
+
+@lru_cache
+def get_task_repository() -> TaskStore:
+    """Task store chosen by ``TASK_STORAGE_BACKEND``, behind the state tier if one is configured.
+
+    ``postgrest`` (default) goes through Supabase's REST API, ``postgres``
+    connects to ``DATABASE_URL`` directly and ``sqlite`` keeps tasks in the
+    embedded database at ``SQLITE_PATH`` (in memory by default).
+    """
+    from .task_state import with_state_tier
+
+    return with_state_tier(_backend_store())
 
-_repository = TaskRepository()
 
+@lru_cache
+def get_trend_repository() -> TrendStore:
+    """Trend rollups in the same database as the tasks.
 
-def get_task_repository() -> TaskRepository:
-    return _repository
+    ``postgres`` and ``sqlite`` keep them in a ``user_trends`` table reached
+    through the task store's own pool or connection; ``postgrest`` goes
+    through the REST API.
+    """
+    store = _backend_store()
+    return TrendRepository() if isinstance(store, TaskRepository) else cast(TrendStore, store)
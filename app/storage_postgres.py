@@ -0,0 +1,306 @@
+"""Task store that talks to Postgres directly over a pooled asyncpg connection."""
+
+from __future__ import annotations
+
+import asyncio
+import os
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable
+
+import orjson
+from fastapi import HTTPException, status
+
+from .executor import offload
+from .storage import (
+    SUMMARY_INCLUDABLE,
+    StoredImage,
+    TaskRecord,
+    TaskSummaryPage,
+    decode_cursor,
+    encode_cursor,
+    new_task_payload,
+    summary_record_from_row,
+    task_record_from_row,
+    update_payload,
+    versioned_update,
+)
+
+_TABLE = "skin_analysis_tasks"
+# Every column the application writes; guards the names interpolated into SQL.
+_WRITABLE_COLUMNS = frozenset(
+    {"user_id", "status", "result", "error", "real_age", "intake", "routine_json", "version", "change_log", "section_hashes"}
+)
+
+_SUMMARY_SELECT = """
+select id, user_id, status, error, created_at,
+       result->'global_profile'->'scores' as scores,
+       result->'global_profile'->'skin_type'->>'label' as skin_type,
+       result->'global_profile'->'skin_age'->>'estimated_age' as skin_age
+"""
+
+_IMAGES_DDL = """
+create table if not exists task_images (
+    task_id uuid primary key references skin_analysis_tasks (id) on delete cascade,
+    user_id uuid not null,
+    mime_type text not null,
+    data bytea not null
+)
+"""
+
+# Only for databases set up without docs/schema.md; Supabase's table has the same columns.
+_TRENDS_DDL = """
+create table if not exists user_trends (
+    user_id uuid primary key,
+    rollup jsonb not null,
+    revision integer not null default 1,
+    updated_at timestamptz not null default now()
+)
+"""
+
+
+def _database_url() -> str:
+    url = os.getenv("DATABASE_URL")
+    if not url:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Postgres database URL is not configured.",
+        )
+    return url
+
+
+def _row(record: Any) -> Dict[str, Any]:
+    row = dict(record)
+    for column in ("id", "user_id"):
+        if row.get(column) is not None:
+            row[column] = str(row[column])
+    for column in ("created_at", "updated_at"):
+        if isinstance(row.get(column), datetime):
+            row[column] = row[column].isoformat()
+    return row
+
+
+def _assignments(payload: Dict[str, Any], first_param: int) -> tuple[str, list[Any]]:
+    unknown = set(payload) - _WRITABLE_COLUMNS
+    if unknown:
+        raise ValueError(f"Unknown task columns: {sorted(unknown)}")
+    columns = sorted(payload)
+    sql = ", ".join(f"{column} = ${index}" for index, column in enumerate(columns, start=first_param))
+    return sql, [payload[column] for column in columns]
+
+
+async def _init_connection(connection: Any) -> None:
+    # jsonb <-> Python values with orjson, so callers pass plain dicts and lists.
+    await connection.set_type_codec(
+        "jsonb",
+        encoder=lambda value: orjson.dumps(value).decode(),
+        decoder=orjson.loads,
+        schema="pg_catalog",
+    )
+
+
+class PostgresTaskRepository:
+    """Task store on the Supabase Postgres database, bypassing PostgREST.
+
+    asyncpg prepares and caches every statement per connection; set
+    ``POSTGRES_STATEMENT_CACHE_SIZE=0`` when connecting through a pooler in
+    transaction mode, which cannot keep prepared statements. Versioned
+    updates lock the row with ``select ... for update`` instead of retrying
+    conditional writes.
+    """
+
+    def __init__(self, dsn: str | None = None) -> None:
+        self._dsn = dsn
+        self._pool: Any = None
+        self._pool_lock = asyncio.Lock()
+
+    async def _get_pool(self) -> Any:
+        if self._pool is None:
+            async with self._pool_lock:
+                if self._pool is None:
+                    import asyncpg
+
+                    self._pool = await asyncpg.create_pool(
+                        self._dsn or _database_url(),
+                        min_size=int(os.getenv("POSTGRES_POOL_MIN_SIZE", "1")),
+                        max_size=int(os.getenv("POSTGRES_POOL_MAX_SIZE", "20")),
+                        statement_cache_size=int(os.getenv("POSTGRES_STATEMENT_CACHE_SIZE", "100")),
+                        init=_init_connection,
+                    )
+                    async with self._pool.acquire() as connection:
+                        await connection.execute(_IMAGES_DDL)
+                        await connection.execute(_TRENDS_DDL)
+        return self._pool
+
+    async def create_task(self, *, user_id: str, real_age: int | None = None) -> TaskRecord:
+        return task_record_from_row(await self.create_task_row(user_id=user_id, real_age=real_age))
+
+    async def create_task_row(self, *, user_id: str, real_age: int | None = None) -> Dict[str, Any]:
+        payload = new_task_payload(user_id, real_age)
+        columns = sorted(payload)
+        placeholders = ", ".join(f"${index}" for index in range(1, len(columns) + 1))
+        pool = await self._get_pool()
+        record = await pool.fetchrow(
+            f"insert into {_TABLE} ({', '.join(columns)}) values ({placeholders}) returning *",
+            *(payload[column] for column in columns),
+        )
+        return _row(record)
+
+    async def update_task(
+        self,
+        task_id: str,
+        *,
+        status_value: str | None = None,
+        result_value: Dict[str, Any] | None = None,
+        error_value: str | None = None,
+        routine_json_value: Dict[str, Any] | None = None,
+    ) -> TaskRecord | None:
+        data = update_payload(status_value, result_value, error_value, routine_json_value)
+        if not data:
+            return None
+        return await self._versioned_update(task_id, data)
+
+    async def save_routine_plan(self, task_id: str, *, intake: Dict[str, Any], routine_json: Dict[str, Any]) -> TaskRecord | None:
+        return await self._versioned_update(task_id, {"intake": intake, "routine_json": routine_json})
+
+    async def _versioned_update(self, task_id: str, data: Dict[str, Any]) -> TaskRecord | None:
+        pool = await self._get_pool()
+        async with pool.acquire() as connection:
+            async with connection.transaction():
+                revision = await connection.fetchrow(
+                    f"select version, section_hashes, change_log from {_TABLE} where id = $1 for update",
+                    task_id,
+                )
+                if revision is None:
+                    return None
+                payload = await offload(versioned_update, dict(revision), data)
+                assignments, values = _assignments(payload, first_param=2)
+                record = await connection.fetchrow(
+                    f"update {_TABLE} set {assignments} where id = $1 returning *",
+                    task_id,
+                    *values,
+                )
+        return task_record_from_row(_row(record))
+
+    async def get_task(self, task_id: str, *, user_id: str | None = None) -> TaskRecord | None:
+        row = await self.get_task_row(task_id, user_id=user_id)
+        return task_record_from_row(row) if row is not None else None
+
+    async def get_task_row(self, task_id: str, *, user_id: str | None = None) -> Dict[str, Any] | None:
+        pool = await self._get_pool()
+        if user_id is None:
+            record = await pool.fetchrow(f"select * from {_TABLE} where id = $1", task_id)
+        else:
+            record = await pool.fetchrow(f"select * from {_TABLE} where id = $1 and user_id = $2", task_id, user_id)
+        return _row(record) if record is not None else None
+
+    async def write_task_snapshot(self, task_id: str, fields: Dict[str, Any]) -> None:
+        assignments, values = _assignments(fields, first_param=3)
+        pool = await self._get_pool()
+        await pool.execute(
+            f"update {_TABLE} set {assignments} where id = $1 and version < $2",
+            task_id,
+            int(fields["version"]),
+            *values,
+        )
+
+    async def list_tasks(self, user_id: str, limit: int = 10) -> list[TaskRecord]:
+        pool = await self._get_pool()
+        records = await pool.fetch(
+            f"select * from {_TABLE} where user_id = $1 order by created_at desc, id desc limit $2",
+            user_id,
+            limit,
+        )
+        return [task_record_from_row(_row(record)) for record in records]
+
+    async def list_task_summaries(
+        self,
+        user_id: str,
+        *,
+        limit: int = 10,
+        cursor: str | None = None,
+        include: Iterable[str] = (),
+    ) -> TaskSummaryPage:
+        columns = [column for column in SUMMARY_INCLUDABLE if column in set(include)]
+        sql = _SUMMARY_SELECT + "".join(f", {column}" for column in columns) + f" from {_TABLE} where user_id = $1"
+        # One extra row tells us whether another page exists.
+        params: list[Any] = [user_id, limit + 1]
+        if cursor is not None:
+            created_at, task_id = decode_cursor(cursor)
+            sql += " and (created_at, id) < ($3, $4::uuid)"
+            params.extend([datetime.fromisoformat(created_at), task_id])
+        sql += " order by created_at desc, id desc limit $2"
+        pool = await self._get_pool()
+        records = await pool.fetch(sql, *params)
+        items = [summary_record_from_row(_row(record)) for record in records[:limit]]
+        next_cursor = None
+        if len(records) > limit and items:
+            next_cursor = encode_cursor(items[-1].created_at, items[-1].id)
+        return TaskSummaryPage(items=items, next_cursor=next_cursor)
+
+    async def save_task_image(self, task_id: str, *, user_id: str, image_bytes: bytes, mime_type: str) -> None:
+        pool = await self._get_pool()
+        await pool.execute(
+            """
+            insert into task_images (task_id, user_id, mime_type, data) values ($1, $2, $3, $4)
+            on conflict (task_id) do update set mime_type = excluded.mime_type, data = excluded.data
+            """,
+            task_id,
+            user_id,
+            mime_type,
+            image_bytes,
+        )
+
+    async def load_task_image(self, task_id: str, *, user_id: str) -> StoredImage | None:
+        pool = await self._get_pool()
+        record = await pool.fetchrow(
+            "select mime_type, data from task_images where task_id = $1 and user_id = $2", task_id, user_id
+        )
+        return StoredImage(data=bytes(record["data"]), mime_type=record["mime_type"]) if record is not None else None
+
+    async def delete_task_image(self, task_id: str, *, user_id: str) -> None:
+        pool = await self._get_pool()
+        await pool.execute("delete from task_images where task_id = $1 and user_id = $2", task_id, user_id)
+
+    async def get_rollup(self, user_id: str) -> Dict[str, Any] | None:
+        pool = await self._get_pool()
+        return await pool.fetchval("select rollup from user_trends where user_id = $1", user_id)
+
+    async def update_rollup(
+        self,
+        user_id: str,
+        apply: Callable[[Dict[str, Any] | None], Dict[str, Any]],
+    ) -> Dict[str, Any]:
+        """Read-modify-write the rollup with the row locked.
+
+        A first rollup that loses the insert race to another writer is redone
+        on the second pass, which finds and locks that writer's row.
+        """
+        pool = await self._get_pool()
+        for _ in range(2):
+            async with pool.acquire() as connection:
+                async with connection.transaction():
+                    current = await connection.fetchrow(
+                        "select rollup from user_trends where user_id = $1 for update", user_id
+                    )
+                    if current is not None:
+                        rollup = apply(current["rollup"])
+                        await connection.execute(
+                            "update user_trends set rollup = $2, revision = revision + 1 where user_id = $1",
+                            user_id,
+                            rollup,
+                        )
+                        return rollup
+                    rollup = apply(None)
+                    inserted = await connection.fetchval(
+                        "insert into user_trends (user_id, rollup) values ($1, $2) on conflict (user_id) do nothing returning user_id",
+                        user_id,
+                        rollup,
+                    )
+                    if inserted is not None:
+                        return rollup
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Trends are being updated concurrently.")
+
+    async def aclose(self) -> None:
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
@@ -0,0 +1,284 @@
+"""Embedded SQLite task store for tests, the offline load harness and single-node deployments."""
+
+from __future__ import annotations
+
+import asyncio
+import sqlite3
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, Optional
+
+import orjson
+
+from .storage import (
+    SUMMARY_INCLUDABLE,
+    StoredImage,
+    TaskRecord,
+    TaskSummaryPage,
+    decode_cursor,
+    encode_cursor,
+    new_task_payload,
+    summary_record_from_row,
+    task_record_from_row,
+    update_payload,
+    versioned_update,
+)
+
+_JSON_COLUMNS = ("result", "intake", "routine_json", "change_log", "section_hashes")
+
+_SCHEMA = """
+create table if not exists skin_analysis_tasks (
+    id text primary key,
+    user_id text not null,
+    status text not null default 'queued',
+    result text,
+    error text,
+    real_age integer,
+    intake text,
+    routine_json text,
+    version integer not null default 0,
+    change_log text not null default '[]',
+    section_hashes text not null default '{}',
+    created_at text not null,
+    updated_at text not null
+);
+create index if not exists skin_analysis_tasks_user_created
+    on skin_analysis_tasks (user_id, created_at desc, id desc);
+create table if not exists task_images (
+    task_id text primary key,
+    user_id text not null,
+    mime_type text not null,
+    data blob not null
+);
+create table if not exists user_trends (
+    user_id text primary key,
+    rollup text not null,
+    revision integer not null default 1,
+    updated_at text not null
+);
+"""
+
+_SUMMARY_SELECT = """
+select id, user_id, status, error, created_at,
+       json_extract(result, '$.global_profile.scores') as scores,
+       json_extract(result, '$.global_profile.skin_type.label') as skin_type,
+       json_extract(result, '$.global_profile.skin_age.estimated_age') as skin_age
+"""
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _encode(column: str, value: Any) -> Any:
+    return orjson.dumps(value).decode() if column in _JSON_COLUMNS and value is not None else value
+
+
+def _decode_row(row: sqlite3.Row) -> Dict[str, Any]:
+    decoded = dict(row)
+    for column in (*_JSON_COLUMNS, "scores"):
+        if decoded.get(column) is not None:
+            decoded[column] = orjson.loads(decoded[column])
+    return decoded
+
+
+class SQLiteTaskRepository:
+    """Task store in a single SQLite database (``:memory:`` by default).
+
+    One connection serves every call; statements run on a worker thread,
+    serialized by a lock, so the event loop never waits on disk.
+    """
+
+    def __init__(self, path: str = ":memory:") -> None:
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.row_factory = sqlite3.Row
+        if path != ":memory:":
+            self._connection.execute("pragma journal_mode=wal")
+            self._connection.execute("pragma synchronous=normal")
+        self._connection.executescript(_SCHEMA)
+        self._lock = asyncio.Lock()
+
+    async def _run(self, fn: Any, *args: Any) -> Any:
+        async with self._lock:
+            return await asyncio.to_thread(fn, *args)
+
+    def _fetch_row(self, task_id: str, user_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        sql = "select * from skin_analysis_tasks where id = ?"
+        params: list[Any] = [task_id]
+        if user_id is not None:
+            sql += " and user_id = ?"
+            params.append(user_id)
+        row = self._connection.execute(sql, params).fetchone()
+        return _decode_row(row) if row is not None else None
+
+    def _insert(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        now = _now()
+        row = {**payload, "id": str(uuid.uuid4()), "created_at": now, "updated_at": now}
+        columns = list(row)
+        self._connection.execute(
+            f"insert into skin_analysis_tasks ({', '.join(columns)}) values ({', '.join('?' for _ in columns)})",
+            [_encode(column, row[column]) for column in columns],
+        )
+        return self._fetch_row(row["id"]) or row
+
+    def _update(self, task_id: str, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        self._connection.execute("begin immediate")
+        try:
+            current = self._connection.execute(
+                "select version, section_hashes, change_log from skin_analysis_tasks where id = ?", (task_id,)
+            ).fetchone()
+            if current is None:
+                self._connection.execute("rollback")
+                return None
+            payload = {**versioned_update(_decode_row(current), data), "updated_at": _now()}
+            assignments = ", ".join(f"{column} = ?" for column in payload)
+            self._connection.execute(
+                f"update skin_analysis_tasks set {assignments} where id = ?",
+                [*(_encode(column, value) for column, value in payload.items()), task_id],
+            )
+            self._connection.execute("commit")
+        except BaseException:
+            self._connection.execute("rollback")
+            raise
+        return self._fetch_row(task_id)
+
+    def _write_snapshot(self, task_id: str, fields: Dict[str, Any]) -> None:
+        payload = {**fields, "updated_at": _now()}
+        assignments = ", ".join(f"{column} = ?" for column in payload)
+        self._connection.execute(
+            f"update skin_analysis_tasks set {assignments} where id = ? and version < ?",
+            [*(_encode(column, value) for column, value in payload.items()), task_id, int(fields["version"])],
+        )
+
+    def _list(self, user_id: str, limit: int) -> list[Dict[str, Any]]:
+        rows = self._connection.execute(
+            "select * from skin_analysis_tasks where user_id = ? order by created_at desc, id desc limit ?",
+            (user_id, limit),
+        ).fetchall()
+        return [_decode_row(row) for row in rows]
+
+    def _list_summaries(self, user_id: str, limit: int, cursor: Optional[str], include: list[str]) -> list[Dict[str, Any]]:
+        sql = _SUMMARY_SELECT + "".join(f", {column}" for column in include) + " from skin_analysis_tasks where user_id = ?"
+        params: list[Any] = [user_id]
+        if cursor is not None:
+            created_at, task_id = decode_cursor(cursor)
+            sql += " and (created_at < ? or (created_at = ? and id < ?))"
+            params.extend([created_at, created_at, task_id])
+        sql += " order by created_at desc, id desc limit ?"
+        params.append(limit + 1)
+        return [_decode_row(row) for row in self._connection.execute(sql, params).fetchall()]
+
+    async def create_task(self, *, user_id: str, real_age: int | None = None) -> TaskRecord:
+        return task_record_from_row(await self.create_task_row(user_id=user_id, real_age=real_age))
+
+    async def create_task_row(self, *, user_id: str, real_age: int | None = None) -> Dict[str, Any]:
+        return await self._run(self._insert, new_task_payload(user_id, real_age))
+
+    async def update_task(
+        self,
+        task_id: str,
+        *,
+        status_value: str | None = None,
+        result_value: Dict[str, Any] | None = None,
+        error_value: str | None = None,
+        routine_json_value: Dict[str, Any] | None = None,
+    ) -> TaskRecord | None:
+        data = update_payload(status_value, result_value, error_value, routine_json_value)
+        if not data:
+            return None
+        row = await self._run(self._update, task_id, data)
+        return task_record_from_row(row) if row is not None else None
+
+    async def save_routine_plan(self, task_id: str, *, intake: Dict[str, Any], routine_json: Dict[str, Any]) -> TaskRecord | None:
+        row = await self._run(self._update, task_id, {"intake": intake, "routine_json": routine_json})
+        return task_record_from_row(row) if row is not None else None
+
+    async def get_task(self, task_id: str, *, user_id: str | None = None) -> TaskRecord | None:
+        row = await self.get_task_row(task_id, user_id=user_id)
+        return task_record_from_row(row) if row is not None else None
+
+    async def get_task_row(self, task_id: str, *, user_id: str | None = None) -> Dict[str, Any] | None:
+        return await self._run(self._fetch_row, task_id, user_id)
+
+    async def write_task_snapshot(self, task_id: str, fields: Dict[str, Any]) -> None:
+        await self._run(self._write_snapshot, task_id, fields)
+
+    async def list_tasks(self, user_id: str, limit: int = 10) -> list[TaskRecord]:
+        return [task_record_from_row(row) for row in await self._run(self._list, user_id, limit)]
+
+    async def list_task_summaries(
+        self,
+        user_id: str,
+        *,
+        limit: int = 10,
+        cursor: str | None = None,
+        include: Iterable[str] = (),
+    ) -> TaskSummaryPage:
+        columns = [column for column in SUMMARY_INCLUDABLE if column in set(include)]
+        rows = await self._run(self._list_summaries, user_id, limit, cursor, columns)
+        items = [summary_record_from_row(row) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit and items:
+            next_cursor = encode_cursor(items[-1].created_at, items[-1].id)
+        return TaskSummaryPage(items=items, next_cursor=next_cursor)
+
+    def _save_image(self, task_id: str, user_id: str, image_bytes: bytes, mime_type: str) -> None:
+        self._connection.execute(
+            "insert or replace into task_images (task_id, user_id, mime_type, data) values (?, ?, ?, ?)",
+            (task_id, user_id, mime_type, image_bytes),
+        )
+
+    def _load_image(self, task_id: str, user_id: str) -> Optional[StoredImage]:
+        row = self._connection.execute(
+            "select mime_type, data from task_images where task_id = ? and user_id = ?", (task_id, user_id)
+        ).fetchone()
+        return StoredImage(data=bytes(row["data"]), mime_type=row["mime_type"]) if row is not None else None
+
+    def _delete_image(self, task_id: str, user_id: str) -> None:
+        self._connection.execute("delete from task_images where task_id = ? and user_id = ?", (task_id, user_id))
+
+    async def save_task_image(self, task_id: str, *, user_id: str, image_bytes: bytes, mime_type: str) -> None:
+        await self._run(self._save_image, task_id, user_id, image_bytes, mime_type)
+
+    async def load_task_image(self, task_id: str, *, user_id: str) -> StoredImage | None:
+        return await self._run(self._load_image, task_id, user_id)
+
+    async def delete_task_image(self, task_id: str, *, user_id: str) -> None:
+        await self._run(self._delete_image, task_id, user_id)
+
+    def _fetch_rollup(self, user_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connection.execute("select rollup from user_trends where user_id = ?", (user_id,)).fetchone()
+        return orjson.loads(row["rollup"]) if row is not None else None
+
+    def _update_rollup(self, user_id: str, apply: Callable[[Optional[Dict[str, Any]]], Dict[str, Any]]) -> Dict[str, Any]:
+        self._connection.execute("begin immediate")
+        try:
+            rollup = apply(self._fetch_rollup(user_id))
+            self._connection.execute(
+                """
+                insert into user_trends (user_id, rollup, revision, updated_at) values (?, ?, 1, ?)
+                on conflict (user_id) do update
+                set rollup = excluded.rollup, revision = user_trends.revision + 1, updated_at = excluded.updated_at
+                """,
+                (user_id, orjson.dumps(rollup).decode(), _now()),
+            )
+            self._connection.execute("commit")
+        except BaseException:
+            self._connection.execute("rollback")
+            raise
+        return rollup
+
+    async def get_rollup(self, user_id: str) -> Dict[str, Any] | None:
+        return await self._run(self._fetch_rollup, user_id)
+
+    async def update_rollup(
+        self,
+        user_id: str,
+        apply: Callable[[Dict[str, Any] | None], Dict[str, Any]],
+    ) -> Dict[str, Any]:
+        """Read-modify-write the rollup in one transaction; the lock keeps writers in turn."""
+        return await self._run(self._update_rollup, user_id, apply)
+
+    async def aclose(self) -> None:
+        async with self._lock:
+            self._connection.close()
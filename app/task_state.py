@@ -0,0 +1,339 @@
+"""Fast task-state tier that serves polls and absorbs progress writes in front of Supabase."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Protocol
+
+import orjson
+from redis import asyncio as redis_asyncio
+from redis.exceptions import RedisError, WatchError
+
+from . import metrics
+from .cache import get_redis_client
+from .storage import (
+    TERMINAL_TASK_STATUSES,
+    StoredImage,
+    TaskRecord,
+    TaskStore,
+    TaskSummaryPage,
+    task_record_from_row,
+    update_payload,
+    versioned_update,
+)
+
+logger = logging.getLogger(__name__)
+
+# Columns written back to Supabase; together they are the task's full mutable state.
+SNAPSHOT_COLUMNS = ("status", "result", "error", "intake", "routine_json", "version", "change_log", "section_hashes")
+
+Row = Dict[str, Any]
+
+# Optimistic Redis transactions retried before a contended update goes to the store instead.
+_UPDATE_ATTEMPTS = 10
+
+
+class TaskStateBackend(Protocol):
+    async def get(self, task_id: str) -> Optional[Row]: ...
+
+    async def add(self, task_id: str, row: Row) -> None:
+        """Store ``row`` unless the task is already cached."""
+
+    async def set(self, task_id: str, row: Row) -> None: ...
+
+    async def update(self, task_id: str, apply: Callable[[Row], Row]) -> Optional[Row]:
+        """Atomically replace the cached row with ``apply(row)``; ``None`` if not cached."""
+
+    async def delete(self, task_id: str) -> None: ...
+
+
+class MemoryTaskStateBackend:
+    """Process-local rows; only suitable for a single worker."""
+
+    def __init__(self, max_entries: int = 10_000, ttl_seconds: float = 3600) -> None:
+        self._max_entries = max_entries
+        self._ttl_seconds = ttl_seconds
+        self._rows: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+
+    async def get(self, task_id: str) -> Optional[Row]:
+        entry = self._rows.get(task_id)
+        if entry is None:
+            return None
+        expires_at, payload = entry
+        if expires_at <= time.monotonic():
+            del self._rows[task_id]
+            return None
+        self._rows.move_to_end(task_id)
+        return orjson.loads(payload)
+
+    async def add(self, task_id: str, row: Row) -> None:
+        if await self.get(task_id) is None:
+            await self.set(task_id, row)
+
+    async def set(self, task_id: str, row: Row) -> None:
+        self._rows[task_id] = (time.monotonic() + self._ttl_seconds, orjson.dumps(row))
+        self._rows.move_to_end(task_id)
+        while len(self._rows) > self._max_entries:
+            self._rows.popitem(last=False)
+
+    async def update(self, task_id: str, apply: Callable[[Row], Row]) -> Optional[Row]:
+        # No await between the read and the write, so this is atomic on the loop.
+        row = await self.get(task_id)
+        if row is None:
+            return None
+        updated = apply(row)
+        await self.set(task_id, updated)
+        return updated
+
+    async def delete(self, task_id: str) -> None:
+        self._rows.pop(task_id, None)
+
+
+class RedisTaskStateBackend:
+    """Rows shared by every worker through Redis, updated with optimistic transactions."""
+
+    def __init__(self, client: redis_asyncio.Redis, prefix: str = "task_state", ttl_seconds: float = 3600) -> None:
+        self._client = client
+        self._prefix = prefix
+        self._ttl_seconds = int(ttl_seconds)
+
+    def _key(self, task_id: str) -> str:
+        return f"{self._prefix}:{task_id}"
+
+    async def get(self, task_id: str) -> Optional[Row]:
+        payload = await self._client.get(self._key(task_id))
+        return orjson.loads(payload) if payload is not None else None
+
+    async def add(self, task_id: str, row: Row) -> None:
+        await self._client.set(self._key(task_id), orjson.dumps(row), ex=self._ttl_seconds, nx=True)
+
+    async def set(self, task_id: str, row: Row) -> None:
+        await self._client.set(self._key(task_id), orjson.dumps(row), ex=self._ttl_seconds)
+
+    async def update(self, task_id: str, apply: Callable[[Row], Row]) -> Optional[Row]:
+        key = self._key(task_id)
+        async with self._client.pipeline(transaction=True) as pipe:
+            for _ in range(_UPDATE_ATTEMPTS):
+                try:
+                    await pipe.watch(key)
+                    payload = await pipe.get(key)
+                    if payload is None:
+                        await pipe.reset()
+                        return None
+                    updated = apply(orjson.loads(payload))
+                    pipe.multi()
+                    pipe.set(key, orjson.dumps(updated), ex=self._ttl_seconds)
+                    await pipe.execute()
+                    return updated
+                except WatchError:
+                    continue
+        raise WatchError(f"Task {task_id} changed during {_UPDATE_ATTEMPTS} update attempts")
+
+    async def delete(self, task_id: str) -> None:
+        await self._client.delete(self._key(task_id))
+
+
+def _is_milestone(data: Row) -> bool:
+    return data.get("status") in TERMINAL_TASK_STATUSES or "routine_json" in data
+
+
+class WriteBehindTaskRepository:
+    """Task store whose reads and progress writes are served by a fast state tier.
+
+    Creation is written through to the durable ``store`` synchronously (it
+    assigns the id). Other updates land in the tier only; milestones (terminal
+    statuses and routine saves) are then copied to the store in the
+    background, retrying with backoff. One flusher per task always writes the
+    latest snapshot, and the write is skipped if the store already holds a
+    newer version, so snapshots never land out of order. If the tier is
+    unavailable every call goes to the store directly.
+    """
+
+    def __init__(self, store: TaskStore, backend: TaskStateBackend, flush_attempts: int = 5) -> None:
+        self._store = store
+        self._backend = backend
+        self._flush_attempts = flush_attempts
+        self._pending: Dict[str, Row] = {}
+        self._flushers: Dict[str, asyncio.Task[None]] = {}
+
+    async def create_task(self, *, user_id: str, real_age: int | None = None) -> TaskRecord:
+        return task_record_from_row(await self.create_task_row(user_id=user_id, real_age=real_age))
+
+    async def create_task_row(self, *, user_id: str, real_age: int | None = None) -> Row:
+        row = await self._store.create_task_row(user_id=user_id, real_age=real_age)
+        try:
+            await self._backend.set(str(row["id"]), row)
+        except RedisError as exc:
+            logger.warning("Task state tier unavailable, not caching new task: %s", exc)
+        return row
+
+    async def get_task(self, task_id: str, *, user_id: str | None = None) -> TaskRecord | None:
+        row = await self.get_task_row(task_id, user_id=user_id)
+        return task_record_from_row(row) if row is not None else None
+
+    async def get_task_row(self, task_id: str, *, user_id: str | None = None) -> Row | None:
+        row = await self._cached_row(task_id)
+        if row is None:
+            metrics.increment("task_state.misses")
+            row = await self._store.get_task_row(task_id)
+            if row is None:
+                return None
+            try:
+                await self._backend.add(task_id, row)
+            except RedisError as exc:
+                logger.warning("Task state tier unavailable, not caching task %s: %s", task_id, exc)
+        else:
+            metrics.increment("task_state.hits")
+        if user_id is not None and str(row["user_id"]) != user_id:
+            return None
+        return row
+
+    async def write_task_snapshot(self, task_id: str, fields: Row) -> None:
+        await self._store.write_task_snapshot(task_id, fields)
+
+    async def list_tasks(self, user_id: str, limit: int = 10) -> list[TaskRecord]:
+        return await self._store.list_tasks(user_id, limit)
+
+    async def list_task_summaries(self, user_id: str, **kwargs: Any) -> TaskSummaryPage:
+        page = await self._store.list_task_summaries(user_id, **kwargs)
+        # Progress of running tasks has not been written back yet.
+        for item in page.items:
+            if item.status not in TERMINAL_TASK_STATUSES:
+                row = await self._cached_row(item.id)
+                if row is not None:
+                    item.status = row.get("status", item.status)
+                    item.error = row.get("error")
+        return page
+
+    async def save_task_image(self, task_id: str, *, user_id: str, image_bytes: bytes, mime_type: str) -> None:
+        await self._store.save_task_image(task_id, user_id=user_id, image_bytes=image_bytes, mime_type=mime_type)
+
+    async def load_task_image(self, task_id: str, *, user_id: str) -> StoredImage | None:
+        return await self._store.load_task_image(task_id, user_id=user_id)
+
+    async def delete_task_image(self, task_id: str, *, user_id: str) -> None:
+        await self._store.delete_task_image(task_id, user_id=user_id)
+
+    async def update_task(
+        self,
+        task_id: str,
+        *,
+        status_value: str | None = None,
+        result_value: Dict[str, Any] | None = None,
+        error_value: str | None = None,
+        routine_json_value: Dict[str, Any] | None = None,
+    ) -> TaskRecord | None:
+        data = update_payload(status_value, result_value, error_value, routine_json_value)
+        if not data:
+            return None
+        return await self._apply(
+            task_id,
+            data,
+            lambda: self._store.update_task(
+                task_id,
+                status_value=status_value,
+                result_value=result_value,
+                error_value=error_value,
+                routine_json_value=routine_json_value,
+            ),
+        )
+
+    async def save_routine_plan(self, task_id: str, *, intake: Dict[str, Any], routine_json: Dict[str, Any]) -> TaskRecord | None:
+        return await self._apply(
+            task_id,
+            {"intake": intake, "routine_json": routine_json},
+            lambda: self._store.save_routine_plan(task_id, intake=intake, routine_json=routine_json),
+        )
+
+    async def _cached_row(self, task_id: str) -> Optional[Row]:
+        try:
+            return await self._backend.get(task_id)
+        except RedisError as exc:
+            logger.warning("Task state tier unavailable, reading task %s from the store: %s", task_id, exc)
+            return None
+
+    async def _apply(
+        self,
+        task_id: str,
+        data: Row,
+        write_through: Callable[[], Awaitable[TaskRecord | None]],
+    ) -> TaskRecord | None:
+        def _merge(row: Row) -> Row:
+            return {**row, **versioned_update(row, data)}
+
+        try:
+            row = await self._backend.update(task_id, _merge)
+            if row is None:
+                fetched = await self._store.get_task_row(task_id)
+                if fetched is None:
+                    return None
+                await self._backend.add(task_id, fetched)
+                row = await self._backend.update(task_id, _merge)
+        except WatchError as exc:
+            # Too contended to update in place: write to the store and stop serving the cached row.
+            logger.warning("Task %s stayed contended in the state tier, writing through: %s", task_id, exc)
+            metrics.increment("task_state.contended_writes")
+            try:
+                await self._backend.delete(task_id)
+            except RedisError:
+                pass
+            return await write_through()
+        except RedisError as exc:
+            logger.warning("Task state tier unavailable, writing task %s through: %s", task_id, exc)
+            return await write_through()
+        if row is None:
+            return await write_through()
+        if _is_milestone(data):
+            self._schedule_flush(task_id, row)
+        return task_record_from_row(row)
+
+    def _schedule_flush(self, task_id: str, row: Row) -> None:
+        self._pending[task_id] = {column: row.get(column) for column in SNAPSHOT_COLUMNS}
+        if task_id not in self._flushers:
+            self._flushers[task_id] = asyncio.create_task(self._flush(task_id), name=f"flush:{task_id}")
+
+    async def _flush(self, task_id: str) -> None:
+        try:
+            while task_id in self._pending:
+                snapshot: Row = {}
+                for attempt in range(self._flush_attempts):
+                    # Always send the newest snapshot, even mid-retry.
+                    snapshot = self._pending.pop(task_id, snapshot)
+                    try:
+                        await self._store.write_task_snapshot(task_id, snapshot)
+                        metrics.increment("task_state.flushes")
+                        break
+                    except Exception as exc:  # noqa: BLE001
+                        logger.warning("Flushing task %s failed (attempt %d): %s", task_id, attempt + 1, exc)
+                        await asyncio.sleep(min(30.0, 0.5 * 2**attempt))
+                else:
+                    metrics.increment("task_state.flush_failures")
+                    logger.error("Giving up flushing task %s version %s to the store", task_id, snapshot.get("version"))
+        finally:
+            self._flushers.pop(task_id, None)
+
+    async def drain(self, timeout: float = 10) -> None:
+        """Wait for pending write-backs, e.g. before the worker exits."""
+        flushers = list(self._flushers.values())
+        if flushers:
+            await asyncio.wait(flushers, timeout=timeout)
+
+    async def aclose(self) -> None:
+        await self.drain()
+        await self._store.aclose()
+
+
+def with_state_tier(store: TaskStore) -> TaskStore:
+    """Put the state tier chosen by ``TASK_STATE_BACKEND`` (``redis``, ``memory`` or ``off``) in front of ``store``."""
+    client = get_redis_client()
+    kind = os.getenv("TASK_STATE_BACKEND", "redis" if client is not None else "off")
+    ttl_seconds = float(os.getenv("TASK_STATE_TTL_SECONDS", "3600"))
+    if kind == "redis" and client is not None:
+        return WriteBehindTaskRepository(store, RedisTaskStateBackend(client, ttl_seconds=ttl_seconds))
+    if kind == "memory":
+        return WriteBehindTaskRepository(store, MemoryTaskStateBackend(ttl_seconds=ttl_seconds))
+    return store
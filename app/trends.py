@@ -0,0 +1,202 @@
+"""Per-user trend rollups, folded in one completed analysis at a time."""
+
+from __future__ import annotations
+
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Optional
+
+from .storage import TaskStore, TrendStore, get_trend_repository
+
+logger = logging.getLogger(__name__)
+
+Rollup = Dict[str, Any]
+
+_REBUILD_PAGE_SIZE = 100
+
+
+def _series_length() -> int:
+    return int(os.getenv("TREND_SERIES_LENGTH", "30"))
+
+
+def _window() -> int:
+    return int(os.getenv("TREND_WINDOW", "5"))
+
+
+def _ema_alpha() -> float:
+    return float(os.getenv("TREND_EMA_ALPHA", "0.3"))
+
+
+def empty_rollup() -> Rollup:
+    return {"task_count": 0, "last_task_id": None, "last_at": None, "recent_task_ids": [], "metrics": {}, "regions": {}, "latest_regions": {}}
+
+
+def _fold_metric(stats: Optional[Dict[str, Any]], value: float, task_id: str, at: str) -> Dict[str, Any]:
+    stats = dict(stats or {"count": 0, "sum": 0.0, "ema": None, "series": []})
+    series = (list(stats["series"]) + [{"task_id": task_id, "at": at, "value": value}])[-_series_length():]
+    window = [point["value"] for point in series[-_window():]]
+    previous = stats["series"][-1]["value"] if stats["series"] else None
+    ema = value if stats["ema"] is None else _ema_alpha() * value + (1 - _ema_alpha()) * stats["ema"]
+    count = stats["count"] + 1
+    total = stats["sum"] + value
+    return {
+        "count": count,
+        "sum": total,
+        "mean": round(total / count, 2),
+        "ema": round(ema, 2),
+        "moving_average": round(sum(window) / len(window), 2),
+        "latest": value,
+        "delta": round(value - previous, 2) if previous is not None else None,
+        "series": series,
+    }
+
+
+def _region_counts(issues: Dict[str, Any]) -> Dict[str, Dict[str, int]]:
+    counts: Dict[str, Dict[str, int]] = {}
+    for category, items in issues.items():
+        for item in items or []:
+            region = item.get("region") if isinstance(item, dict) else None
+            if region:
+                by_category = counts.setdefault(region, {})
+                by_category[category] = by_category.get(category, 0) + 1
+    return counts
+
+
+def _task_inputs(result: Dict[str, Any]) -> tuple[Dict[str, float], Dict[str, Dict[str, int]]]:
+    """The metric values and issue region counts one analysis contributes."""
+    profile = result.get("global_profile") or {}
+    values: Dict[str, float] = {
+        name: float(score) for name, score in (profile.get("scores") or {}).items() if isinstance(score, (int, float))
+    }
+    skin_age = (profile.get("skin_age") or {}).get("estimated_age")
+    if isinstance(skin_age, (int, float)):
+        values["skin_age"] = float(skin_age)
+    return values, _region_counts(result.get("issues") or {})
+
+
+def _fold(
+    rollup: Rollup,
+    task_id: str,
+    at: str,
+    values: Dict[str, float],
+    latest_regions: Dict[str, Dict[str, int]],
+) -> Rollup:
+    metric_stats = dict(rollup["metrics"])
+    for name, value in values.items():
+        metric_stats[name] = _fold_metric(metric_stats.get(name), value, task_id, at)
+
+    regions = {region: dict(counts) for region, counts in rollup["regions"].items()}
+    for region, counts in latest_regions.items():
+        totals = regions.setdefault(region, {})
+        for category, count in counts.items():
+            totals[category] = totals.get(category, 0) + count
+
+    return {
+        "task_count": rollup["task_count"] + 1,
+        "last_task_id": task_id,
+        "last_at": at,
+        "recent_task_ids": (rollup["recent_task_ids"] + [task_id])[-_series_length():],
+        "metrics": metric_stats,
+        "regions": regions,
+        "latest_regions": latest_regions,
+    }
+
+
+def apply_result(rollup: Optional[Rollup], task_id: str, result: Dict[str, Any], at: Optional[str] = None) -> Rollup:
+    """Fold one completed analysis into ``rollup``. Folding the same task twice is a no-op."""
+    rollup = dict(rollup or empty_rollup())
+    if task_id in rollup["recent_task_ids"]:
+        return rollup
+    values, latest_regions = _task_inputs(result)
+    return _fold(rollup, task_id, at or datetime.now(timezone.utc).isoformat(), values, latest_regions)
+
+
+def replace_result(rollup: Optional[Rollup], task_id: str, previous: Dict[str, Any], result: Dict[str, Any]) -> Rollup:
+    """Swap the region counts ``previous`` added to ``rollup`` for those of ``result``.
+
+    For reruns of issue steps: they keep the step-1 profile, so the score
+    statistics already hold the right values.
+    """
+    rollup = dict(rollup or empty_rollup())
+    regions = {region: dict(counts) for region, counts in rollup["regions"].items()}
+    for region, counts in _region_counts(previous.get("issues") or {}).items():
+        totals = regions.get(region, {})
+        for category, count in counts.items():
+            remaining = totals.get(category, 0) - count
+            if remaining > 0:
+                totals[category] = remaining
+            else:
+                totals.pop(category, None)
+        if not totals:
+            regions.pop(region, None)
+    latest_regions = _region_counts(result.get("issues") or {})
+    for region, counts in latest_regions.items():
+        totals = regions.setdefault(region, {})
+        for category, count in counts.items():
+            totals[category] = totals.get(category, 0) + count
+    if rollup["last_task_id"] == task_id:
+        rollup["latest_regions"] = latest_regions
+    rollup["regions"] = regions
+    return rollup
+
+
+def rebuild_rollup(results: Iterable[tuple[str, str, Dict[str, Any]]]) -> Rollup:
+    """Fold ``(task_id, created_at, result)`` tuples, oldest first, into a fresh rollup."""
+    rollup = empty_rollup()
+    for task_id, at, result in results:
+        rollup = apply_result(rollup, task_id, result, at=at)
+    return rollup
+
+
+async def rebuild_from_history(user_id: str, repository: TaskStore) -> Optional[Rollup]:
+    """Fold every completed analysis of ``user_id`` into a fresh rollup; ``None`` if there are none.
+
+    Counts, sums and region totals cover the whole history. Only the series
+    are capped, as when folding live. History is paged through the task
+    summaries, and each task is reduced to its scores and region counts at
+    once, so full results are never all held together.
+    """
+    inputs: list[tuple[str, str, Dict[str, float], Dict[str, Dict[str, int]]]] = []
+    cursor: Optional[str] = None
+    while True:
+        page = await repository.list_task_summaries(user_id, limit=_REBUILD_PAGE_SIZE, cursor=cursor, include=["result"])
+        for task in page.items:
+            if task.status == "completed" and task.result:
+                inputs.append((task.id, task.created_at, *_task_inputs(task.result)))
+        cursor = page.next_cursor
+        if cursor is None:
+            break
+    if not inputs:
+        return None
+    rollup = empty_rollup()
+    # Pages come newest first.
+    for task_id, at, values, latest_regions in reversed(inputs):
+        rollup = _fold(rollup, task_id, at, values, latest_regions)
+    return rollup
+
+
+async def record_completed_analysis(
+    user_id: str,
+    task_id: str,
+    result: Dict[str, Any],
+    repository: Optional[TrendStore] = None,
+    *,
+    previous: Optional[Dict[str, Any]] = None,
+) -> None:
+    """Fold a freshly completed analysis into the user's rollup; failures are logged, not raised.
+
+    For a rerun, pass its ``previous`` result to swap what the task contributed.
+    Users without a rollup are skipped: a rollup started here would hold only
+    this task, so their first trends request builds it from the whole history.
+    """
+    repository = repository or get_trend_repository()
+    try:
+        if await repository.get_rollup(user_id) is None:
+            return
+        if previous is not None:
+            await repository.update_rollup(user_id, lambda rollup: replace_result(rollup, task_id, previous, result))
+        else:
+            await repository.update_rollup(user_id, lambda rollup: apply_result(rollup, task_id, result))
+    except Exception as exc:  # noqa: BLE001
+        logger.warning("Failed to update trends for user %s: %s", user_id, exc)
@@ -2,23 +2,47 @@
 
 from __future__ import annotations
 
-from typing import Any, Callable, Dict, Optional, Type
+import asyncio
+import dataclasses
+import hashlib
+import json
+import math
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, Literal, Optional, Type
 
 from pydantic import BaseModel
 
-from .llm import build_multistep_user_message, get_structured_model
+from . import metrics
+from .blobs import BlobRef, open_blob
+from .deadlines import Deadline, DeadlineExceeded, fast_model_factor, run_within
+from .executor import offload
+from .llm import (
+    build_multistep_user_message,
+    build_tiled_user_message,
+    cacheable_text_block,
+    fast_model_name,
+    invoke_structured,
+)
+from .regions import VisionUsage, crop_step_tiles, estimate_image_tokens, full_image_tokens
+from .scheduler import Priority
 from .schemas import (
     AcneRednessIssuesResult,
     AgingIssuesResult,
+    CombinedAnalysisResult,
+    FaceGeometry,
     GlobalProfile,
     GlobalProfileResult,
     IssuesCollection,
     PigmentationIssuesResult,
+    ScoreBreakdown,
     TextureIssuesResult,
     UpgradedFaceAnalysisResult,
 )
 
 ProgressCallback = Optional[Callable[[str, Dict[str, Any]], None]]
+ExecutionMode = Literal["sequential", "parallel", "single_call"]
 
 STEP_SYSTEM_PROMPT = (
     "You are a meticulous esthetician. Always reply with valid JSON that matches the"
@@ -105,29 +129,257 @@ Return JSON:
 }
 """
 
+# Used instead of the five steps when even step 1 plus the quickest issue step would
+# miss the client's deadline.
+SINGLE_CALL_PROMPT = (
+    "TASK:\nDo all five parts below in one reply. Return a single JSON object with the"
+    ' "global_profile" of part 1 and one "issues" object holding every key of parts 2-5.\n\n'
+    + "\n".join(
+        f"PART {number}:\n{prompt}"
+        for number, prompt in enumerate((STEP1_PROMPT, STEP2_PROMPT, STEP3_PROMPT, STEP4_PROMPT, STEP5_PROMPT), start=1)
+    )
+)
+
+@dataclass(frozen=True, slots=True)
+class WorkflowStep:
+    name: str
+    schema: Type[BaseModel]
+    prompt: str
+    status: str
+
+    @property
+    def issue_fields(self) -> tuple[str, ...]:
+        issues_model = self.schema.model_fields["issues"].annotation
+        return tuple(issues_model.model_fields) if issues_model is not None else ()
+
+    @property
+    def version(self) -> str:
+        """Short fingerprint of everything that shapes this step's output."""
+        source = "\n".join((STEP_SYSTEM_PROMPT, self.prompt, self.schema.__name__))
+        return hashlib.sha256(source.encode("utf-8")).hexdigest()[:12]
+
+
+GLOBAL_PROFILE_STEP = WorkflowStep("global_profile", GlobalProfileResult, STEP1_PROMPT, "global_profile_complete")
+ISSUE_STEPS: tuple[WorkflowStep, ...] = (
+    WorkflowStep("texture", TextureIssuesResult, STEP2_PROMPT, "texture_complete"),
+    WorkflowStep("pigmentation", PigmentationIssuesResult, STEP3_PROMPT, "pigmentation_complete"),
+    WorkflowStep("acne", AcneRednessIssuesResult, STEP4_PROMPT, "acne_complete"),
+    WorkflowStep("aging", AgingIssuesResult, STEP5_PROMPT, "aging_complete"),
+)
+ISSUE_STEP_NAMES = tuple(step.name for step in ISSUE_STEPS)
+SINGLE_CALL_STEP = WorkflowStep("single_call", CombinedAnalysisResult, SINGLE_CALL_PROMPT, "single_call_complete")
+STEP_VERSIONS: Dict[str, str] = {step.name: step.version for step in (GLOBAL_PROFILE_STEP, *ISSUE_STEPS)}
+# Parallel steps finish in any order, so their progress writes share one status.
+ISSUES_RUNNING_STATUS = "issues_running"
+
+
+@dataclass(frozen=True, slots=True)
+class GatingRule:
+    """When an issue step can be skipped or run on the fast model, judged on step 1's scores.
+
+    The step's signal is the highest of its relevant scores, using
+    ``100 - score`` for ``inverted`` ones where higher means healthier.
+    """
+
+    scores: tuple[str, ...]
+    inverted: tuple[str, ...] = ()
+    skip_below: float = 10
+    downgrade_below: float = 25
+
+    def signal(self, scores: ScoreBreakdown) -> tuple[str, int]:
+        values = [(name, getattr(scores, name)) for name in self.scores]
+        values.extend((f"100-{name}", 100 - getattr(scores, name)) for name in self.inverted)
+        return max(values, key=lambda item: item[1])
+
+
+DEFAULT_GATING_RULES: Dict[str, GatingRule] = {
+    "texture": GatingRule(("oily_shine", "pores", "blackheads", "roughness"), inverted=("hydration",)),
+    # Moles and freckles have no score of their own, so this step is never skipped.
+    "pigmentation": GatingRule(("pigmentation",), skip_below=0),
+    "acne": GatingRule(("acne", "sensitivity_redness")),
+    "aging": GatingRule(("wrinkles", "dark_circles")),
+}
+
+
+@dataclass(frozen=True, slots=True)
+class StepGate:
+    action: Literal["run", "downgrade", "skip"]
+    reason: Optional[str] = None
+
+
+def gating_rules() -> Dict[str, GatingRule]:
+    """Default rules, with thresholds overridden per step by ``STEP_GATING_THRESHOLDS`` (JSON)."""
+    overrides = json.loads(os.getenv("STEP_GATING_THRESHOLDS") or "{}")
+    return {name: dataclasses.replace(rule, **overrides.get(name, {})) for name, rule in DEFAULT_GATING_RULES.items()}
+
+
+def gate_issue_steps(profile: GlobalProfile) -> Dict[str, StepGate]:
+    """Decide per issue step whether to run, downgrade or skip it; ``STEP_GATING=0`` runs everything."""
+    if os.getenv("STEP_GATING", "1") == "0":
+        return {step.name: StepGate("run") for step in ISSUE_STEPS}
+    rules = gating_rules()
+    gates: Dict[str, StepGate] = {}
+    for step in ISSUE_STEPS:
+        rule = rules.get(step.name)
+        if rule is None:
+            gates[step.name] = StepGate("run")
+            continue
+        score, value = rule.signal(profile.scores)
+        if value < rule.skip_below:
+            gates[step.name] = StepGate("skip", f"highest relevant score {score}={value} < {rule.skip_below:g}")
+        elif value < rule.downgrade_below and fast_model_name() is not None:
+            gates[step.name] = StepGate("downgrade", f"highest relevant score {score}={value} < {rule.downgrade_below:g}")
+        else:
+            gates[step.name] = StepGate("run")
+    return gates
+
+
+def _max_parallel_steps() -> int:
+    return max(1, int(os.getenv("DEADLINE_MAX_PARALLEL_STEPS", "2")))
+
+
+def use_single_call(deadline: Deadline) -> bool:
+    """Whether one combined call fits ``deadline`` where step 1 plus the quickest issue step would not."""
+    factor = fast_model_factor() if fast_model_name() is not None else 1.0
+    quickest = min(deadline.estimate(name) for name in ISSUE_STEP_NAMES) * factor
+    two_calls = deadline.estimate(GLOBAL_PROFILE_STEP.name) + quickest
+    return two_calls > deadline.remaining() and deadline.fits(SINGLE_CALL_STEP.name)
+
+
+def step_priorities(profile: GlobalProfile) -> Dict[str, float]:
+    """Gating signal per issue step; under a deadline the lowest ones give way first."""
+    rules = gating_rules()
+    return {
+        step.name: rule.signal(profile.scores)[1] if (rule := rules.get(step.name)) is not None else math.inf
+        for step in ISSUE_STEPS
+    }
+
+
+def plan_for_deadline(
+    gates: Dict[str, StepGate],
+    priorities: Dict[str, float],
+    deadline: Deadline,
+) -> tuple[ExecutionMode, Dict[str, StepGate]]:
+    """Fit the gated issue steps into the time left before ``deadline``.
+
+    Steps run one after another when their usual durations add up to less
+    than what is left. Otherwise up to ``DEADLINE_MAX_PARALLEL_STEPS`` run at
+    once; steps that cannot finish in time even alone are skipped, and then,
+    lowest ``priorities`` first, steps move to the fast model and finally are
+    skipped until the rest fits.
+    """
+    remaining = deadline.remaining()
+    factor = fast_model_factor()
+    slots = _max_parallel_steps()
+    planned = dict(gates)
+
+    def _costs() -> Dict[str, float]:
+        return {
+            name: deadline.estimate(name) * (factor if gate.action == "downgrade" else 1.0)
+            for name, gate in planned.items()
+            if gate.action != "skip"
+        }
+
+    def _reason(costs: Dict[str, float]) -> str:
+        return f"deadline: ~{sum(costs.values()):.1f}s of steps, {max(remaining, 0.0):.1f}s left"
+
+    costs = _costs()
+    if sum(costs.values()) <= remaining:
+        return "sequential", gates
+
+    def _fits() -> bool:
+        costs = _costs()
+        return not costs or max(max(costs.values()), sum(costs.values()) / slots) <= remaining
+
+    fast_model = fast_model_name() is not None
+    for name, cost in costs.items():
+        alone = deadline.estimate(name) * (factor if fast_model else 1.0)
+        if alone > remaining:
+            planned[name] = StepGate("skip", f"deadline: ~{alone:.1f}s alone, {max(remaining, 0.0):.1f}s left")
+    lowest_first = sorted((name for name in costs if planned[name].action != "skip"), key=lambda name: priorities[name])
+    actions = (("downgrade",) if fast_model else ()) + ("skip",)
+    for action in actions:
+        for name in lowest_first:
+            if _fits():
+                return "parallel", planned
+            if planned[name].action in ("run", "downgrade") and planned[name].action != action:
+                planned[name] = StepGate(action, _reason(_costs()))
+    return "parallel", planned
+
+
+def _build_step_content(
+    image: BlobRef,
+    instructions: str,
+    previous_results: Optional[Dict[str, Any]] = None,
+    real_age: Optional[int] = None,
+    step_name: Optional[str] = None,
+    geometry: Optional[FaceGeometry] = None,
+) -> tuple[list[Dict[str, Any]], VisionUsage]:
+    baseline = full_image_tokens(image)
+    tiles = crop_step_tiles(image, geometry, step_name) if geometry is not None and step_name is not None else None
+    tile_tokens = sum(estimate_image_tokens(tile.width, tile.height) for tile in tiles or ())
+    # Several crops of a small upload can cost more than the upload itself; at equal
+    # cost the crops still win, as they carry the regions at a higher resolution.
+    if tiles and tile_tokens <= baseline:
+        content = build_tiled_user_message(
+            [(tile.name, tile.regions, tile.data, tile.mime_type) for tile in tiles],
+            instructions,
+            previous_results=previous_results,
+            real_age=real_age,
+        )
+        return content, VisionUsage(tile_tokens, baseline)
+    # The base64 copy only lives for the duration of one step's request.
+    with open_blob(image) as data:
+        content = build_multistep_user_message(
+            data,
+            image.mime_type,
+            instructions,
+            previous_results=previous_results,
+            real_age=real_age,
+        )
+    return content, VisionUsage(baseline, baseline)
+
+
+def _record_vision_usage(step_name: Optional[str], usage: VisionUsage) -> None:
+    prefixes = ("vision", f"vision.{step_name}") if step_name else ("vision",)
+    for prefix in prefixes:
+        metrics.increment(f"{prefix}.tokens", usage.tokens)
+        metrics.increment(f"{prefix}.full_image_tokens", usage.full_image_tokens)
+    baseline = metrics.get_counter("vision.full_image_tokens")
+    if baseline:
+        metrics.set_gauge("vision.tokens_saved_fraction", 1 - metrics.get_counter("vision.tokens") / baseline)
+
+
 async def _invoke_step(
     schema: Type[BaseModel],
     instructions: str,
-    image_bytes: bytes,
-    mime_type: str,
+    image: BlobRef,
     previous_results: Optional[Dict[str, Any]] = None,
     real_age: Optional[int] = None,
+    priority: Priority = Priority.BACKGROUND,
+    model_name: Optional[str] = None,
+    step_name: Optional[str] = None,
+    geometry: Optional[FaceGeometry] = None,
 ):
-    model = get_structured_model(schema)
-    payload = [
-        {"role": "system", "content": STEP_SYSTEM_PROMPT},
-        {
-            "role": "user",
-            "content": build_multistep_user_message(
-                image_bytes,
-                mime_type,
-                instructions,
-                previous_results=previous_results,
-                real_age=real_age,
-            ),
-        },
-    ]
-    return await model.ainvoke(payload)
+    async def _messages() -> list[Dict[str, Any]]:
+        # Cropping, base64-encoding the image and dumping previous results is CPU-heavy.
+        content, usage = await offload(
+            _build_step_content,
+            image,
+            instructions,
+            previous_results=previous_results,
+            real_age=real_age,
+            step_name=step_name,
+            geometry=geometry,
+        )
+        _record_vision_usage(step_name, usage)
+        return [
+            {"role": "system", "content": [cacheable_text_block(STEP_SYSTEM_PROMPT)]},
+            {"role": "user", "content": content},
+        ]
+
+    # Built only once an LLM slot is free, so queued steps hold no encoded image.
+    return await invoke_structured(schema, _messages, priority=priority, model_name=model_name)
 
 
 def _build_previous_results(global_profile: Optional[GlobalProfile], issues: IssuesCollection) -> Optional[Dict[str, Any]]:
@@ -140,60 +392,244 @@ def _build_previous_results(global_profile: Optional[GlobalProfile], issues: Iss
     return payload or None
 
 
-def _serialize_state(global_profile: Optional[GlobalProfile], issues: IssuesCollection) -> Dict[str, Any]:
+def _serialize_state(
+    global_profile: Optional[GlobalProfile],
+    issues: IssuesCollection,
+    gating: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
     state: Dict[str, Any] = {"issues": issues.model_dump()}
     if global_profile is not None:
         state["global_profile"] = global_profile.model_dump()
+    state.update(gating or {})
     return state
 
 
-def _notify(progress_callback: ProgressCallback, status: str, global_profile: Optional[GlobalProfile], issues: IssuesCollection) -> None:
+async def _notify(
+    progress_callback: ProgressCallback,
+    status: str,
+    global_profile: Optional[GlobalProfile],
+    issues: IssuesCollection,
+    gating: Optional[Dict[str, Any]] = None,
+) -> None:
     if progress_callback is None:
         return
-    progress_callback(status, _serialize_state(global_profile, issues))
+    progress_callback(status, await offload(_serialize_state, global_profile, issues, gating))
+
+
+def _merge_issues(issues: IssuesCollection, step_result: BaseModel) -> None:
+    for field in type(step_result.issues).model_fields:
+        getattr(issues, field).extend(getattr(step_result.issues, field))
 
 
 async def run_upgraded_workflow(
-    image_bytes: bytes,
-    mime_type: str,
+    image: BlobRef,
     real_age: Optional[int] = None,
     progress_callback: ProgressCallback = None,
+    geometry: Optional[FaceGeometry] = None,
+    deadline: Optional[Deadline] = None,
 ) -> UpgradedFaceAnalysisResult:
+    """Run step 1 and the gated issue steps on ``image``.
+
+    With ``geometry`` each step is sent only the crops it needs (see
+    :data:`app.regions.STEP_TILES`) instead of the whole selfie.
+
+    With ``deadline`` the issue steps are planned to fit it (see
+    :func:`plan_for_deadline`) and those still running when it passes are
+    cancelled and listed in ``cancelled_steps``. When not even step 1 and one
+    issue step would fit, everything is asked for in one call instead (see
+    :func:`use_single_call`). There is no result without step 1, so missing
+    the deadline there raises :class:`DeadlineExceeded`.
+    """
     issues = IssuesCollection()
     global_profile: Optional[GlobalProfile] = None
 
-    gp_result = await _invoke_step(GlobalProfileResult, STEP1_PROMPT, image_bytes, mime_type, real_age=real_age)
+    if deadline is not None and use_single_call(deadline):
+        return await _run_single_call(image, real_age, geometry, deadline)
+
+    try:
+        # The user is watching the first step, so it jumps ahead of other tasks' later steps.
+        gp_result = await run_within(
+            deadline,
+            _invoke_step(
+                GLOBAL_PROFILE_STEP.schema,
+                GLOBAL_PROFILE_STEP.prompt,
+                image,
+                real_age=real_age,
+                priority=Priority.INTERACTIVE,
+                step_name=GLOBAL_PROFILE_STEP.name,
+                geometry=geometry,
+            ),
+        )
+    except DeadlineExceeded:
+        metrics.increment("workflow.deadline_failures")
+        raise DeadlineExceeded("Deadline reached before the skin profile was ready.") from None
     global_profile = gp_result.global_profile
-    _notify(progress_callback, "global_profile_complete", global_profile, issues)
-
-    prev = _build_previous_results(global_profile, issues)
-    texture = await _invoke_step(TextureIssuesResult, STEP2_PROMPT, image_bytes, mime_type, previous_results=prev, real_age=real_age)
-    issues.oily_shine.extend(texture.issues.oily_shine)
-    issues.dryness_dehydration.extend(texture.issues.dryness_dehydration)
-    issues.enlarged_pores_texture.extend(texture.issues.enlarged_pores_texture)
-    issues.blackheads.extend(texture.issues.blackheads)
-    _notify(progress_callback, "texture_complete", global_profile, issues)
-
-    prev = _build_previous_results(global_profile, issues)
-    pigmentation = await _invoke_step(PigmentationIssuesResult, STEP3_PROMPT, image_bytes, mime_type, previous_results=prev, real_age=real_age)
-    issues.pigmentation_brown_spots.extend(pigmentation.issues.pigmentation_brown_spots)
-    issues.freckles.extend(pigmentation.issues.freckles)
-    issues.melasma_like_patches.extend(pigmentation.issues.melasma_like_patches)
-    issues.moles_or_nevi.extend(pigmentation.issues.moles_or_nevi)
-    _notify(progress_callback, "pigmentation_complete", global_profile, issues)
-
-    prev = _build_previous_results(global_profile, issues)
-    acne = await _invoke_step(AcneRednessIssuesResult, STEP4_PROMPT, image_bytes, mime_type, previous_results=prev, real_age=real_age)
-    issues.acne_active.extend(acne.issues.acne_active)
-    issues.acne_scars_post_inflammatory.extend(acne.issues.acne_scars_post_inflammatory)
-    issues.redness_sensitivity.extend(acne.issues.redness_sensitivity)
-    _notify(progress_callback, "acne_complete", global_profile, issues)
-
-    prev = _build_previous_results(global_profile, issues)
-    aging = await _invoke_step(AgingIssuesResult, STEP5_PROMPT, image_bytes, mime_type, previous_results=prev, real_age=real_age)
-    issues.wrinkles_and_fine_lines.extend(aging.issues.wrinkles_and_fine_lines)
-    issues.dark_circles.extend(aging.issues.dark_circles)
-    issues.eye_bags.extend(aging.issues.eye_bags)
-    _notify(progress_callback, "aging_complete", global_profile, issues)
-
-    return UpgradedFaceAnalysisResult(global_profile=global_profile, issues=issues)
+    gates = gate_issue_steps(global_profile)
+    mode: ExecutionMode = "sequential"
+    if deadline is not None:
+        mode, gates = plan_for_deadline(gates, step_priorities(global_profile), deadline)
+    gating: Dict[str, Any] = {
+        "execution_mode": mode,
+        "skipped_steps": {name: gate.reason for name, gate in gates.items() if gate.action == "skip"},
+        "downgraded_steps": {name: gate.reason for name, gate in gates.items() if gate.action == "downgrade"},
+        "cancelled_steps": {},
+    }
+    for action in ("skip", "downgrade"):
+        metrics.increment(
+            f"workflow.deadline_{action}s",
+            sum(1 for gate in gates.values() if gate.action == action and gate.reason.startswith("deadline")),
+        )
+    metrics.increment("workflow.llm_calls_saved", len(gating["skipped_steps"]))
+    metrics.increment("workflow.steps_downgraded", len(gating["downgraded_steps"]))
+    metrics.observe("workflow.llm_calls_saved_per_task", len(gating["skipped_steps"]))
+    await _notify(progress_callback, GLOBAL_PROFILE_STEP.status, global_profile, issues, gating)
+
+    async def _run_step(step: WorkflowStep, prev: Optional[Dict[str, Any]]) -> None:
+        if deadline is not None and deadline.remaining() <= 0:
+            gating["cancelled_steps"][step.name] = "deadline reached before the step started"
+            metrics.increment("workflow.deadline_cancellations")
+            return
+        if prev is None:
+            prev = await offload(_build_previous_results, global_profile, issues)
+        started = time.monotonic()
+        try:
+            step_result = await run_within(
+                deadline,
+                _invoke_step(
+                    step.schema,
+                    step.prompt,
+                    image,
+                    previous_results=prev,
+                    real_age=real_age,
+                    model_name=fast_model_name() if gates[step.name].action == "downgrade" else None,
+                    step_name=step.name,
+                    geometry=geometry,
+                ),
+            )
+        except DeadlineExceeded:
+            # Its issue lists stay empty, like a skipped step's.
+            gating["cancelled_steps"][step.name] = f"deadline reached after {time.monotonic() - started:.1f}s"
+            metrics.increment("workflow.deadline_cancellations")
+            return
+        _merge_issues(issues, step_result)
+        status = ISSUES_RUNNING_STATUS if mode == "parallel" else step.status
+        await _notify(progress_callback, status, global_profile, issues, gating)
+
+    steps = [step for step in ISSUE_STEPS if gates[step.name].action != "skip"]
+    if mode == "parallel":
+        # Concurrent steps only see step 1; nothing else is ready when they start.
+        profile_only = await offload(_build_previous_results, global_profile, IssuesCollection())
+        # plan_for_deadline assumed this many at once; the most relevant steps go first.
+        limit = asyncio.Semaphore(_max_parallel_steps())
+        priorities = step_priorities(global_profile)
+
+        async def _run_limited(step: WorkflowStep) -> None:
+            async with limit:
+                await _run_step(step, profile_only)
+
+        try:
+            async with asyncio.TaskGroup() as group:
+                for step in sorted(steps, key=lambda step: priorities[step.name], reverse=True):
+                    group.create_task(_run_limited(step))
+        except ExceptionGroup as failures:
+            raise failures.exceptions[0] from None
+    else:
+        for step in steps:
+            await _run_step(step, None)
+
+    # Steps the deadline dropped or cut short read as stale, so a reanalysis can fill them in later.
+    degraded = set(gating["cancelled_steps"]) | {
+        name for name, reason in gating["skipped_steps"].items() if reason.startswith("deadline:")
+    }
+    return UpgradedFaceAnalysisResult(
+        global_profile=global_profile,
+        issues=issues,
+        step_versions={name: version for name, version in STEP_VERSIONS.items() if name not in degraded},
+        **gating,
+    )
+
+
+async def _run_single_call(
+    image: BlobRef,
+    real_age: Optional[int],
+    geometry: Optional[FaceGeometry],
+    deadline: Deadline,
+) -> UpgradedFaceAnalysisResult:
+    # Only the combined prompt's version is recorded, so every issue step reads as stale
+    # and can be rerun in full once the client has time.
+    metrics.increment("workflow.single_call_runs")
+    try:
+        result = await run_within(
+            deadline,
+            _invoke_step(
+                SINGLE_CALL_STEP.schema,
+                SINGLE_CALL_STEP.prompt,
+                image,
+                real_age=real_age,
+                priority=Priority.INTERACTIVE,
+                step_name=SINGLE_CALL_STEP.name,
+                geometry=geometry,
+            ),
+        )
+    except DeadlineExceeded:
+        metrics.increment("workflow.deadline_failures")
+        raise DeadlineExceeded("Deadline reached before the combined analysis was ready.") from None
+    return UpgradedFaceAnalysisResult(
+        global_profile=result.global_profile,
+        issues=result.issues,
+        step_versions={SINGLE_CALL_STEP.name: SINGLE_CALL_STEP.version},
+        execution_mode="single_call",
+    )
+
+
+def stale_steps(result: Dict[str, Any]) -> list[str]:
+    """Names of issue steps whose stored prompt version differs from the current one."""
+    stored = result.get("step_versions") or {}
+    return [step.name for step in ISSUE_STEPS if stored.get(step.name) != STEP_VERSIONS[step.name]]
+
+
+async def rerun_issue_steps(
+    image: BlobRef,
+    previous: UpgradedFaceAnalysisResult,
+    step_names: Iterable[str],
+    real_age: Optional[int] = None,
+    progress_callback: ProgressCallback = None,
+    priority: Priority = Priority.BACKGROUND,
+) -> UpgradedFaceAnalysisResult:
+    """Re-run selected issue steps against an existing result.
+
+    The stored ``global_profile`` is reused, the rerun steps' categories are
+    replaced and every other category is left untouched.
+    """
+    names = set(step_names)
+    selected = [step for step in ISSUE_STEPS if step.name in names]
+    global_profile = previous.global_profile
+    issues = previous.issues.model_copy(deep=True)
+    for step in selected:
+        for field in step.issue_fields:
+            setattr(issues, field, [])
+
+    step_versions = dict(previous.step_versions)
+    # Explicitly rerun steps always get the full model.
+    gating = {
+        "execution_mode": previous.execution_mode,
+        "skipped_steps": {name: reason for name, reason in previous.skipped_steps.items() if name not in names},
+        "downgraded_steps": {name: reason for name, reason in previous.downgraded_steps.items() if name not in names},
+        "cancelled_steps": {name: reason for name, reason in previous.cancelled_steps.items() if name not in names},
+    }
+    for step in selected:
+        prev = await offload(_build_previous_results, global_profile, issues)
+        step_result = await _invoke_step(
+            step.schema,
+            step.prompt,
+            image,
+            previous_results=prev,
+            real_age=real_age,
+            priority=priority,
+            step_name=step.name,
+        )
+        _merge_issues(issues, step_result)
+        step_versions[step.name] = STEP_VERSIONS[step.name]
+        await _notify(progress_callback, "reanalyzing", global_profile, issues, gating)
+
+    return UpgradedFaceAnalysisResult(global_profile=global_profile, issues=issues, step_versions=step_versions, **gating)
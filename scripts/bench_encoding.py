@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""Compare wire size and encode time of a completed task payload per encoding."""
+
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.encoding import compress_body, encode_body  # noqa: E402
+from app.schemas import IssuesCollection, TaskStatusResponse  # noqa: E402
+
+REGIONS = ["LeftCheek", "RightCheek", "NoseBase", "FaceOval", "LeftEye", "RightEye", "MouthBottom"]
+
+
+def build_sample_task(seed: int = 7, issues_per_key: int = 4) -> dict[str, Any]:
+    """Build a completed task payload shaped like a real one (analysis + routine)."""
+    rng = random.Random(seed)
+    issues = {
+        key: [
+            {
+                "region": rng.choice(REGIONS),
+                "intensity": round(rng.random(), 2),
+                "area": rng.randint(1, 10),
+                "description": f"Visible {key.replace('_', ' ')} concentrated around this region.",
+            }
+            for _ in range(issues_per_key)
+        ]
+        for key in IssuesCollection.model_fields
+    }
+    scores = {
+        key: rng.randint(0, 100)
+        for key in (
+            "overall", "wrinkles", "dark_circles", "oily_shine", "pores", "blackheads",
+            "acne", "sensitivity_redness", "pigmentation", "hydration", "roughness",
+        )
+    }
+    step = {
+        "type": "cleanser",
+        "instructions": {"how": "Massage onto damp skin for 30 seconds.", "frequency": "daily", "timing": "morning"},
+        "products": [
+            {
+                "id": None,
+                "brand": "CeraVe",
+                "name": "CeraVe Foaming Facial Cleanser",
+                "tier": "budget",
+                "why": "Removes excess oil without stripping the barrier.",
+                "url": "https://www.cerave.com/skincare/cleansers/foaming-facial-cleanser",
+            }
+        ],
+    }
+    routine = {
+        "routine": {"am": [step] * 4, "midday": [step], "pm": [step] * 4},
+        "reasons": {
+            "prioritized_concerns": [{"key": "acne", "severity": "moderate", "why": "Active lesions on both cheeks."}],
+            "notes": "Introduce one active at a time.",
+        },
+        "warnings": ["Patch test new products for 48 hours."],
+        "lifestyle": {
+            "sleep": "Aim for 7-9 hours.",
+            "stress": "Short daily breaks.",
+            "sun": "Reapply SPF every 2 hours outdoors.",
+            "habits": "Avoid picking.",
+            "routine_hygiene": "Change pillowcases weekly.",
+            "diet": {"increase": ["leafy greens"], "limit": ["added sugar"], "supplements": []},
+        },
+    }
+    return TaskStatusResponse(
+        task_id="550e8400-e29b-41d4-a716-446655440000",
+        status="completed",
+        result={
+            "global_profile": {
+                "skin_type": {"label": "combination", "confidence": 0.86},
+                "skin_tone": {"lightness": "medium", "undertone": "neutral"},
+                "skin_age": {"estimated_age": 27, "relative_to_real_age": "similar"},
+                "scores": scores,
+                "summary_description": "Combination skin with mild congestion.",
+            },
+            "issues": issues,
+        },
+        routine_json=routine,
+    ).model_dump(mode="json")
+
+
+def _time(fn: Callable[[], bytes], repeat: int) -> tuple[bytes, float]:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        output = fn()
+    return output, (time.perf_counter() - started) / repeat
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=500, help="Iterations per encoding.")
+    parser.add_argument("--issues-per-key", type=int, default=4, help="Issue items per category.")
+    args = parser.parse_args()
+
+    payload = build_sample_task(issues_per_key=args.issues_per_key)
+    rows = []
+    for media_type in ("application/json", "application/msgpack"):
+        for content_encoding in (None, "gzip", "zstd"):
+
+            def _encode() -> bytes:
+                body = encode_body(payload, media_type)
+                return compress_body(body, content_encoding) if content_encoding else body
+
+            body, seconds = _time(_encode, args.repeat)
+            rows.append((media_type, content_encoding or "identity", len(body), seconds * 1e6))
+
+    baseline = rows[0][2]
+    print(f"{'media type':<22}{'encoding':<10}{'bytes':>10}{'ratio':>8}{'encode us':>12}")
+    for media_type, content_encoding, size, micros in rows:
+        print(f"{media_type:<22}{content_encoding:<10}{size:>10}{size / baseline:>8.2f}{micros:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
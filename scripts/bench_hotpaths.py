@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""Micro-benchmarks of the pure-CPU hot paths, checked against stored baselines.
+
+    python scripts/bench_hotpaths.py            # report current timings next to the baseline
+    python scripts/bench_hotpaths.py --check    # exit 1 when a path is slower than the tolerance allows
+    python scripts/bench_hotpaths.py --update   # record the current timings as the new baseline
+
+Each timing is stored as a multiple of a fixed pure-Python calibration loop
+timed alongside it, so a baseline recorded on one machine still means
+something on a faster or slower one.
+"""
+
+from __future__ import annotations
+
+import argparse
+import copy
+import json
+import os
+import random
+import statistics
+import sys
+import timeit
+from pathlib import Path
+from typing import Any, Callable, Dict
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from bench_encoding import build_sample_task  # noqa: E402
+
+from app.llm import _encode_image, build_multistep_user_message  # noqa: E402
+from app.prompts import build_routine_prompt_messages  # noqa: E402
+from app.recommendations import add_urls_to_routine  # noqa: E402
+from app.schemas import GlobalProfile, IssuesCollection, RoutinePlan, UpgradedFaceAnalysisResult  # noqa: E402
+from app.storage import task_record_from_row  # noqa: E402
+from app.workflow import ISSUE_STEPS, _build_previous_results, _serialize_state  # noqa: E402
+
+BASELINE_PATH = Path(__file__).resolve().with_name("bench_hotpaths_baseline.json")
+DEFAULT_TOLERANCE = 0.5
+# Phone selfies as uploaded: a downscaled JPEG and a full-resolution one.
+IMAGE_SIZES = {"300kb": 300 * 1024, "3mb": 3 * 1024 * 1024}
+INTAKE = {
+    "sensitivity": "medium",
+    "pregnancy": "no",
+    "rx_topical": "no",
+    "allergies": ["fragrance"],
+    "fitzpatrick": "III-IV",
+    "current_actives": ["niacinamide"],
+    "country": "US",
+    "budget_preference": "mid",
+}
+
+Case = Callable[[], Callable[[], Any]]
+
+
+def _analysis(issues_per_key: int = 4) -> Dict[str, Any]:
+    return build_sample_task(issues_per_key=issues_per_key)["result"]
+
+
+def _routine() -> Dict[str, Any]:
+    routine = build_sample_task()["routine_json"]
+    # Near-miss names, as the model writes them, take the edit-distance path.
+    for index, step in enumerate(routine["routine"]["am"] + routine["routine"]["pm"]):
+        step["products"] = [{**step["products"][0], "name": f"CeraVe Foaming Cleanser {index}"}]
+    return routine
+
+
+def _previous_results() -> Callable[[], Any]:
+    analysis = _analysis()
+    profile = GlobalProfile.model_validate(analysis["global_profile"])
+    issues = IssuesCollection.model_validate(analysis["issues"])
+    return lambda: _build_previous_results(profile, issues)
+
+
+def _serialized_state() -> Callable[[], Any]:
+    analysis = _analysis()
+    profile = GlobalProfile.model_validate(analysis["global_profile"])
+    issues = IssuesCollection.model_validate(analysis["issues"])
+    gating = {"execution_mode": "sequential", "skipped_steps": {"acne": "low"}, "downgraded_steps": {}, "cancelled_steps": {}}
+    return lambda: _serialize_state(profile, issues, gating)
+
+
+def _image_bytes(size: int) -> bytes:
+    return random.Random(size).randbytes(size)
+
+
+def _encode(size: int) -> Case:
+    def _setup() -> Callable[[], Any]:
+        data = _image_bytes(size)
+        return lambda: _encode_image(data, "image/jpeg")
+
+    return _setup
+
+
+def _multistep_message(size: int) -> Case:
+    def _setup() -> Callable[[], Any]:
+        data = _image_bytes(size)
+        previous = _analysis()
+        return lambda: build_multistep_user_message(data, "image/jpeg", ISSUE_STEPS[-1].prompt, previous, real_age=31)
+
+    return _setup
+
+
+def _add_urls() -> Callable[[], Any]:
+    routine = _routine()
+    return lambda: add_urls_to_routine(copy.deepcopy(routine))
+
+
+def _routine_prompt() -> Callable[[], Any]:
+    analysis = _analysis()
+    return lambda: build_routine_prompt_messages(analysis, INTAKE)
+
+
+def _task_row() -> Callable[[], Any]:
+    # What a PostgREST GET hands to the repository: a JSON body, decoded then mapped.
+    sample = build_sample_task()
+    body = json.dumps(
+        {
+            "id": sample["task_id"],
+            "user_id": "6a1f3c8e-8f3b-4a52-9a43-1d4c1f0e9b7d",
+            "status": "completed",
+            "result": sample["result"],
+            "error": None,
+            "intake": INTAKE,
+            "routine_json": sample["routine_json"],
+            "real_age": 31,
+            "version": 7,
+        }
+    )
+    return lambda: task_record_from_row(json.loads(body))
+
+
+def _validate_analysis() -> Callable[[], Any]:
+    analysis = _analysis(issues_per_key=8)
+    return lambda: UpgradedFaceAnalysisResult.model_validate(analysis)
+
+
+def _validate_routine() -> Callable[[], Any]:
+    routine = build_sample_task()["routine_json"]
+    return lambda: RoutinePlan.model_validate(routine)
+
+
+CASES: Dict[str, Case] = {
+    "workflow.build_previous_results": _previous_results,
+    "workflow.serialize_state": _serialized_state,
+    **{f"llm.encode_image.{label}": _encode(size) for label, size in IMAGE_SIZES.items()},
+    **{f"llm.build_multistep_user_message.{label}": _multistep_message(size) for label, size in IMAGE_SIZES.items()},
+    "recommendations.add_urls_to_routine": _add_urls,
+    "prompts.build_routine_prompt_messages": _routine_prompt,
+    "storage.task_record_from_row": _task_row,
+    "schemas.validate_analysis_result": _validate_analysis,
+    "schemas.validate_routine_plan": _validate_routine,
+}
+
+
+def _calibration() -> int:
+    return sum(len(str(value)) for value in sorted(range(20_000), key=lambda value: -value))
+
+
+def measure(fn: Callable[[], Any], rounds: int = 5) -> float:
+    """Median over ``rounds`` of per-call seconds of ``fn`` divided by those of the calibration loop.
+
+    Each round times the calibration right next to the case, so a CPU that
+    speeds up or slows down mid-run shifts both alike.
+    """
+    timer, reference = timeit.Timer(fn), timeit.Timer(_calibration)
+    number, _ = timer.autorange()
+    reference_number, _ = reference.autorange()
+    ratios = []
+    for _ in range(rounds):
+        seconds = min(timer.repeat(repeat=3, number=number)) / number
+        reference_seconds = min(reference.repeat(repeat=3, number=reference_number)) / reference_number
+        ratios.append(seconds / reference_seconds)
+    return statistics.median(ratios)
+
+
+def run(cases: Dict[str, Case], rounds: int = 5) -> Dict[str, float]:
+    """Each case's time as a multiple of the calibration loop."""
+    return {name: measure(setup(), rounds) for name, setup in cases.items()}
+
+
+def regressions(current: Dict[str, float], baseline: Dict[str, float], tolerance: float) -> Dict[str, float]:
+    """Cases slower than ``(1 + tolerance)`` times their baseline, with the slowdown factor."""
+    slower = {name: current[name] / baseline[name] for name in current if name in baseline}
+    return {name: factor for name, factor in slower.items() if factor > 1 + tolerance}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--check", action="store_true", help="Exit 1 if a case regressed beyond the tolerance.")
+    mode.add_argument("--update", action="store_true", help="Write the current timings to the baseline file.")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH, help="Baseline JSON file.")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=None,
+        help="Allowed slowdown as a fraction (default: the baseline's, else BENCH_TOLERANCE or 0.5).",
+    )
+    parser.add_argument("--filter", default="", help="Only run cases whose name contains this text.")
+    parser.add_argument("--rounds", type=int, default=5, help="Timing rounds per case; the median counts.")
+    args = parser.parse_args()
+
+    stored = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+    baseline: Dict[str, float] = stored.get("cases", {})
+    tolerance = args.tolerance
+    if tolerance is None:
+        tolerance = float(os.getenv("BENCH_TOLERANCE") or stored.get("tolerance", DEFAULT_TOLERANCE))
+    cases = {name: setup for name, setup in CASES.items() if args.filter in name}
+
+    current = run(cases, args.rounds)
+    print("figures are multiples of the calibration loop's time")
+    print(f"{'case':<48}{'baseline':>10}{'current':>10}{'change':>9}")
+    for name, value in current.items():
+        before = baseline.get(name)
+        change = f"{value / before - 1:+.0%}" if before else "new"
+        print(f"{name:<48}{before or float('nan'):>10.4f}{value:>10.4f}{change:>9}")
+
+    if args.update:
+        rounded = {name: float(f"{value:.4g}") for name, value in current.items()}
+        updated = {**baseline, **rounded} if args.filter else rounded
+        args.baseline.write_text(
+            json.dumps({"tolerance": stored.get("tolerance", DEFAULT_TOLERANCE), "cases": updated}, indent=2) + "\n"
+        )
+        print(f"baseline written to {args.baseline}")
+    elif args.check:
+        missing = sorted(set(current) - set(baseline))
+        slower = regressions(current, baseline, tolerance)
+        for name in missing:
+            print(f"MISSING BASELINE {name}; run with --update")
+        for name, factor in slower.items():
+            print(f"REGRESSION {name}: {factor:.2f}x baseline (tolerance {1 + tolerance:.2f}x)")
+        if missing or slower:
+            sys.exit(1)
+        print(f"all {len(current)} cases within {tolerance:.0%} of baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""Compare peak RSS of many concurrent five-step workflows: images held as bytes vs. spilled to the blob store.
+
+Each mode runs in a fresh interpreter. The LLM is replaced by a sleep while
+holding a scheduler slot, so only the image and payload memory is measured.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import resource
+import subprocess
+import sys
+from pathlib import Path
+from typing import Any
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+class _SleepingModel:
+    def __init__(self, latency: float) -> None:
+        self._latency = latency
+
+    async def ainvoke(self, messages: Any) -> dict[str, Any]:
+        await asyncio.sleep(self._latency)
+        return {"raw": None, "parsed": None, "parsing_error": None}
+
+
+async def _run(mode: str, tasks: int, image_mb: float, latency: float) -> None:
+    from app import llm, workflow
+    from app.blobs import get_blob_store
+    from app.schemas import GlobalProfileResult
+
+    llm.get_structured_model = lambda schema, model_name=None: _SleepingModel(latency)  # type: ignore[assignment]
+    store = get_blob_store()
+    size = int(image_mb * 1024 * 1024)
+
+    async def _bytes_task() -> None:
+        # Previous behaviour: bytes live for the whole task and every step
+        # encodes its payload before queueing for a slot.
+        image = os.urandom(size)
+        for _ in range(5):
+            content = await workflow.offload(llm.build_multistep_user_message, image, "image/jpeg", "Analyze.")
+            await llm.invoke_structured(GlobalProfileResult, [{"role": "user", "content": content}])
+
+    async def _blob_task() -> None:
+        # Uploads are spooled straight to disk, so only one chunk is in memory at a time.
+        ref = await asyncio.to_thread(lambda: store.put(os.urandom(size), "image/jpeg"))
+        try:
+            for _ in range(5):
+                await workflow._invoke_step(GlobalProfileResult, "Analyze.", ref)
+        finally:
+            store.release(ref)
+
+    task = _bytes_task if mode == "bytes" else _blob_task
+    await asyncio.gather(*(task() for _ in range(tasks)))
+    store.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tasks", type=int, default=200)
+    parser.add_argument("--image-mb", type=float, default=2.0)
+    parser.add_argument("--latency", type=float, default=0.2, help="Simulated seconds per LLM call.")
+    parser.add_argument("--mode", choices=("bytes", "blob"))
+    args = parser.parse_args()
+
+    if args.mode:
+        asyncio.run(_run(args.mode, args.tasks, args.image_mb, args.latency))
+        print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+        return
+
+    print(f"{args.tasks} tasks, {args.image_mb} MB images, LLM_MAX_CONCURRENCY={os.getenv('LLM_MAX_CONCURRENCY', '16')}")
+    print(f"{'mode':<8}{'peak RSS MB':>14}")
+    for mode in ("bytes", "blob"):
+        output = subprocess.run(
+            [sys.executable, __file__, "--mode", mode, "--tasks", str(args.tasks), "--image-mb", str(args.image_mb), "--latency", str(args.latency)],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        peak_kb = int(output.strip().splitlines()[-1])
+        print(f"{mode:<8}{peak_kb / 1024:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
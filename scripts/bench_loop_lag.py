@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""Measure event-loop lag while concurrent tasks encode large images, inline vs offloaded."""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app import executor  # noqa: E402
+from app.llm import build_multistep_user_message  # noqa: E402
+
+
+async def _probe(stop: asyncio.Event, samples: list[float], interval: float = 0.01) -> None:
+    while not stop.is_set():
+        expected = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, time.perf_counter() - expected))
+
+
+async def _run(mode: str, concurrency: int, image_mb: float, rounds: int) -> tuple[float, float, float]:
+    os.environ["OFFLOAD_EXECUTOR"] = mode
+    executor.get_offload_executor.cache_clear()
+    image = os.urandom(int(image_mb * 1024 * 1024))
+    previous = {"issues": {f"key_{i}": [{"description": "x" * 200}] * 5 for i in range(14)}}
+
+    async def _task() -> None:
+        for _ in range(rounds):
+            await executor.offload(build_multistep_user_message, image, "image/jpeg", "Analyze.", previous)
+
+    samples: list[float] = []
+    stop = asyncio.Event()
+    probe = asyncio.create_task(_probe(stop, samples))
+    started = time.perf_counter()
+    await asyncio.gather(*(_task() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await probe
+    executor.shutdown_offload_executor()
+    samples.sort()
+    return elapsed, samples[int(0.99 * (len(samples) - 1))] if samples else 0.0, max(samples, default=0.0)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--image-mb", type=float, default=4.0)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'mode':<8}{'elapsed s':>11}{'p99 lag ms':>12}{'max lag ms':>12}")
+    for mode in ("inline", "thread", "process"):
+        elapsed, p99, worst = asyncio.run(_run(mode, args.concurrency, args.image_mb, args.rounds))
+        print(f"{mode:<8}{elapsed:>11.2f}{p99 * 1000:>12.1f}{worst * 1000:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
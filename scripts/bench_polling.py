@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""Simulate polling an analysis at a fixed interval vs. following the server's Retry-After hints.
+
+Step durations are drawn from a log-normal distribution around per-step
+medians on a virtual clock, so no server or LLM is involved. The tracker is
+warmed up on ``--warmup`` tasks first, as a worker would be after a while in
+production. Reports polls per task and how long after completion the client
+noticed.
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import statistics
+import sys
+from pathlib import Path
+from typing import Callable
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.eta import ANALYSIS_STEPS, StepLatencyTracker  # noqa: E402
+from app.storage import TaskRecord  # noqa: E402
+from app.workflow import GLOBAL_PROFILE_STEP, ISSUE_STEPS  # noqa: E402
+
+_MEDIANS = {GLOBAL_PROFILE_STEP.name: 6.0, **{step.name: 9.0 for step in ISSUE_STEPS}}
+_STATUS_AFTER = [step.status for step in (GLOBAL_PROFILE_STEP, *ISSUE_STEPS)]
+_FINALIZE_SECONDS = 0.3
+
+
+def _timeline(rng: random.Random, spread: float) -> list[tuple[float, str]]:
+    """``(at, status)`` changes of one task, starting at t=0 with 'processing'."""
+    now = 0.0
+    changes = [(now, "processing")]
+    for step, status in zip(ANALYSIS_STEPS, _STATUS_AFTER):
+        now += _MEDIANS[step] * rng.lognormvariate(0, spread)
+        changes.append((now, status))
+    changes.append((now + _FINALIZE_SECONDS, "completed"))
+    return changes
+
+
+def _state_at(changes: list[tuple[float, str]], now: float) -> TaskRecord:
+    seen = [(at, status) for at, status in changes if at <= now]
+    log = [{"version": index + 2, "sections": ["status"], "at": at} for index, (at, _) in enumerate(seen)]
+    return TaskRecord(id="t", user_id="u", status=seen[-1][1], result=None, error=None, change_log=log)
+
+
+def _poll(changes: list[tuple[float, str]], next_delay: Callable[[TaskRecord, float], float | None]) -> tuple[int, float]:
+    now, polls = 0.0, 0
+    while True:
+        polls += 1
+        task = _state_at(changes, now)
+        delay = next_delay(task, now)
+        if delay is None:
+            return polls, now - changes[-1][0]
+        now += delay
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tasks", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--interval", type=float, default=1.5, help="Fixed client polling interval in seconds.")
+    parser.add_argument("--spread", type=float, default=0.3, help="Log-normal sigma of step durations.")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    tracker = StepLatencyTracker()
+    for _ in range(args.warmup):
+        changes = _timeline(rng, args.spread)
+        for (started, _), (ended, status) in zip(changes, changes[1:-1]):
+            tracker.record_progress(status, ended - started)
+
+    def _fixed(task: TaskRecord, now: float) -> float | None:
+        return None if task.status == "completed" else args.interval
+
+    def _hinted(task: TaskRecord, now: float) -> float | None:
+        hint = tracker.hint(task, now=now)
+        return float(hint.retry_after) if hint is not None else None
+
+    print(f"{'client':<10}{'polls/task':>12}{'notice p50 s':>14}{'notice p95 s':>14}")
+    tasks = [_timeline(rng, args.spread) for _ in range(args.tasks)]
+    for name, strategy in (("fixed", _fixed), ("hinted", _hinted)):
+        results = [_poll(changes, strategy) for changes in tasks]
+        polls = statistics.fmean(count for count, _ in results)
+        lags = sorted(lag for _, lag in results)
+        p50, p95 = lags[len(lags) // 2], lags[int(len(lags) * 0.95)]
+        print(f"{name:<10}{polls:>12.1f}{p50:>14.2f}{p95:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""Compare vision tokens per analysis step: whole selfie vs. region crops.
+
+Uses ``scripts/face.png`` with hand-placed ML Kit-style geometry, builds each
+step's content as the workflow does and reports estimated vision tokens, the
+payload size and the time spent cropping and encoding.
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.blobs import BlobStore  # noqa: E402
+from app.schemas import FaceGeometry  # noqa: E402
+from app.workflow import GLOBAL_PROFILE_STEP, ISSUE_STEPS, _build_step_content  # noqa: E402
+
+# Positions on the 740x1110 sample; the subject's left is the image's right.
+_GEOMETRY = FaceGeometry(
+    landmarks={
+        "LeftEye": (485, 373),
+        "RightEye": (318, 373),
+        "NoseBase": (398, 485),
+        "LeftCheek": (490, 470),
+        "RightCheek": (305, 470),
+        "MouthBottom": (398, 590),
+        "MouthLeft": (463, 555),
+        "MouthRight": (335, 555),
+        "LeftEar": (548, 440),
+        "RightEar": (225, 440),
+    },
+    contours={
+        "FaceOval": [
+            (398, 190), (470, 205), (530, 250), (548, 380), (535, 520), (480, 620),
+            (398, 665), (320, 620), (265, 520), (250, 380), (270, 250), (330, 205),
+        ],
+        "LeftEyebrowTop": [(440, 322), (490, 314), (540, 325)],
+        "LeftEyebrowBottom": [(440, 334), (490, 328), (535, 336)],
+        "RightEyebrowTop": [(260, 325), (310, 314), (360, 322)],
+        "RightEyebrowBottom": [(265, 336), (310, 328), (360, 334)],
+    },
+)
+
+
+def _image_bytes(content: list[dict]) -> int:
+    return sum(len(base64.b64decode(block["base64"])) for block in content if block.get("type") == "image")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--image", default=str(Path(__file__).resolve().parent / "face.png"))
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    store = BlobStore(str(Path("/tmp") / "ff-bench-region-tiles"), 64 * 1024 * 1024)
+    ref = store.put(Path(args.image).read_bytes(), "image/png")
+    print(f"{'step':<16}{'tokens full':>12}{'tokens crops':>14}{'KiB full':>10}{'KiB crops':>11}{'build ms':>10}")
+    totals = [0, 0]
+    for step in (GLOBAL_PROFILE_STEP, *ISSUE_STEPS):
+        full, full_usage = _build_step_content(ref, step.prompt, step_name=step.name)
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            tiled, usage = _build_step_content(ref, step.prompt, step_name=step.name, geometry=_GEOMETRY)
+        elapsed_ms = (time.perf_counter() - started) / args.repeat * 1000
+        totals[0] += full_usage.tokens
+        totals[1] += usage.tokens
+        print(
+            f"{step.name:<16}{full_usage.tokens:>12}{usage.tokens:>14}"
+            f"{_image_bytes(full) / 1024:>10.0f}{_image_bytes(tiled) / 1024:>11.0f}{elapsed_ms:>10.1f}"
+        )
+    print(f"{'total':<16}{totals[0]:>12}{totals[1]:>14}")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""Per-operation latency of each task storage backend.
+
+SQLite (in memory and on disk) always runs; PostgREST runs when
+``SUPABASE_URL``/``SUPABASE_SERVICE_ROLE_KEY`` are set and direct Postgres
+when ``DATABASE_URL`` is set. Each task goes through the request path's
+operations: create, five progress updates, a poll and a history page.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Awaitable, Callable
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.storage import TaskRepository, TaskStore  # noqa: E402
+from app.storage_postgres import PostgresTaskRepository  # noqa: E402
+from app.storage_sqlite import SQLiteTaskRepository  # noqa: E402
+
+
+def _backends(tmp_dir: str) -> dict[str, Callable[[], TaskStore]]:
+    backends: dict[str, Callable[[], TaskStore]] = {
+        "sqlite-memory": SQLiteTaskRepository,
+        "sqlite-file": lambda: SQLiteTaskRepository(os.path.join(tmp_dir, "tasks.db")),
+    }
+    if os.getenv("SUPABASE_URL") and os.getenv("SUPABASE_SERVICE_ROLE_KEY"):
+        backends["postgrest"] = TaskRepository
+    if os.getenv("DATABASE_URL"):
+        backends["postgres"] = PostgresTaskRepository
+    return backends
+
+
+async def _timed(samples: list[float], call: Awaitable[Any]) -> Any:
+    started = time.perf_counter()
+    value = await call
+    samples.append(time.perf_counter() - started)
+    return value
+
+
+async def _run(store: TaskStore, tasks: int, user_id: str) -> dict[str, list[float]]:
+    samples: dict[str, list[float]] = defaultdict(list)
+    result: dict[str, Any] = {"global_profile": {"scores": {"hydration": 70}}, "issues": {}}
+    for _ in range(tasks):
+        task = await _timed(samples["create"], store.create_task(user_id=user_id, real_age=30))
+        for step in ("texture", "pigmentation", "acne", "aging", "done"):
+            result = {**result, "issues": {**result["issues"], step: [{"region": "Forehead"}]}}
+            await _timed(samples["update"], store.update_task(task.id, status_value="processing", result_value=result))
+        await _timed(samples["get"], store.get_task(task.id, user_id=user_id))
+        await _timed(samples["list_summaries"], store.list_task_summaries(user_id, limit=10))
+    return samples
+
+
+def _ms(values: list[float], quantile: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(quantile * len(ordered)))] * 1000
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tasks", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'backend':<15}{'operation':<16}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, factory in _backends(tmp_dir).items():
+            store = factory()
+            try:
+                samples = await _run(store, args.tasks, str(uuid.uuid4()))
+            finally:
+                await store.aclose()
+            for operation, values in samples.items():
+                mean = statistics.fmean(values) * 1000
+                print(f"{name:<15}{operation:<16}{mean:>10.3f}{_ms(values, 0.5):>10.3f}{_ms(values, 0.95):>10.3f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
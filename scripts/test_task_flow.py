@@ -32,15 +32,20 @@ async def _start_task(client: httpx.AsyncClient, image_path: Path, real_age: int
 
 
 async def _poll_task(client: httpx.AsyncClient, task_id: str, interval: float) -> dict[str, Any]:
+    polls = 0
     while True:
         response = await client.get(f"/tasks/{task_id}")
         response.raise_for_status()
+        polls += 1
         payload = response.json()
         status = payload["status"]
-        print(f"status={status}")
-        if status in {"completed", "failed"}:
+        retry_after = response.headers.get("Retry-After")
+        print(f"status={status} step={payload.get('current_step')} eta={payload.get('eta_seconds')} retry_after={retry_after}")
+        # The server only sends Retry-After while more is coming.
+        if retry_after is None and status in {"completed", "failed", "cancelled", "interrupted"}:
+            print(f"polls={polls}")
             return payload
-        await asyncio.sleep(interval)
+        await asyncio.sleep(float(retry_after) if retry_after is not None else interval)
 
 
 async def main() -> None:
@@ -48,7 +53,7 @@ async def main() -> None:
     parser.add_argument("image", type=Path, help="Path to the selfie to upload.")
     parser.add_argument("--base-url", default="http://localhost:8000", help="FastAPI base URL.")
     parser.add_argument("--real-age", type=int, default=None, help="Optional real age to include.")
-    parser.add_argument("--interval", type=float, default=2.0, help="Seconds between status polls.")
+    parser.add_argument("--interval", type=float, default=2.0, help="Seconds between status polls when the server sends no Retry-After.")
     args = parser.parse_args()
 
     async with httpx.AsyncClient(base_url=args.base_url) as client:
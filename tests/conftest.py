@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+from typing import Any, Dict
+
+import pytest
+
+
+class RecordingRepository:
+    """Task store stand-in that keeps what a routine or analysis job wrote."""
+
+    def __init__(self) -> None:
+        self.saved: list[Dict[str, Any]] = []
+        self.updates: list[Dict[str, Any]] = []
+        self.errors: list[str] = []
+
+    async def save_routine_plan(self, task_id: str, *, intake: Dict[str, Any], routine_json: Dict[str, Any]) -> None:
+        self.saved.append(routine_json)
+
+    async def update_task(self, task_id: str, **kwargs: Any) -> None:
+        self.updates.append(kwargs)
+        if kwargs.get("error_value"):
+            self.errors.append(kwargs["error_value"])
+
+
+@pytest.fixture
+def recording_repository() -> RecordingRepository:
+    return RecordingRepository()
+
+
+def _step(step_type: str, name: str, brand: str = "CeraVe", tier: str = "budget") -> Dict[str, Any]:
+    return {
+        "type": step_type,
+        "instructions": {"how": "Apply evenly.", "frequency": "daily", "timing": "morning"},
+        "products": [{"id": None, "brand": brand, "name": name, "tier": tier, "why": "Fits the profile."}],
+    }
+
+
+@pytest.fixture
+def sample_analysis() -> Dict[str, Any]:
+    return {
+        "global_profile": {
+            "skin_type": {"label": "combination", "confidence": 0.8},
+            "skin_tone": {"lightness": "medium", "undertone": "neutral"},
+            "skin_age": {"estimated_age": 29, "relative_to_real_age": "similar"},
+            "scores": {
+                "overall": 74,
+                "wrinkles": 20,
+                "dark_circles": 35,
+                "oily_shine": 60,
+                "pores": 45,
+                "blackheads": 30,
+                "acne": 55,
+                "sensitivity_redness": 25,
+                "pigmentation": 40,
+                "hydration": 50,
+                "roughness": 30,
+            },
+            "summary_description": "Combination skin with mild acne.",
+        },
+        "issues": {
+            "acne_active": [
+                {"region": "LeftCheek", "intensity": 0.6, "area": 3, "description": "A few papules."},
+            ],
+            "oily_shine": [
+                {"region": "NoseBase", "intensity": 0.5, "area": 2, "description": "Shine on the nose."},
+            ],
+        },
+    }
+
+
+@pytest.fixture
+def sample_routine_plan() -> Dict[str, Any]:
+    return {
+        "routine": {
+            "am": [
+                _step("cleanser", "CeraVe Foaming Facial Cleanser"),
+                _step("sunscreen", "EltaMD UV Clear Tinted SPF 46", brand="EltaMD", tier="mid"),
+            ],
+            "midday": None,
+            "pm": [
+                _step("cleanser", "CeraVe Foaming Facial Cleanser"),
+                _step("active", "The Ordinary Niacinamide 10% + Zinc 1%", brand="The Ordinary"),
+            ],
+        },
+        "reasons": {
+            "prioritized_concerns": [{"key": "acne", "severity": "moderate", "why": "Active papules on the cheeks."}],
+            "notes": "Keep the routine simple.",
+        },
+        "warnings": ["Patch test new products."],
+        "lifestyle": {
+            "sleep": "7-9 hours.",
+            "stress": "Short daily walks.",
+            "sun": "Reapply SPF outdoors.",
+            "habits": "Avoid touching the face.",
+            "routine_hygiene": "Wash pillowcases weekly.",
+            "diet": {"increase": ["vegetables"], "limit": ["sugar"], "supplements": []},
+        },
+    }
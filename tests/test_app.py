@@ -1,20 +1,22 @@
 import pytest
-from httpx import AsyncClient
+from httpx import ASGITransport, AsyncClient
 
 from app.main import app
 
 
 @pytest.mark.asyncio
-async def test_health_check() -> None:
-    async with AsyncClient(app=app, base_url="http://test") as client:
-        response = await client.get("/health")
-        assert response.status_code == 200
-        assert response.json() == {"status": "ok"}
+async def test_health_check(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("LLM_WARMUP_TIMEOUT_SECONDS", "0.5")
+    async with app.router.lifespan_context(app):
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+            response = await client.get("/health")
+            assert response.status_code == 200
+            assert response.json() == {"status": "ok"}
 
 
 @pytest.mark.asyncio
 async def test_root_route() -> None:
-    async with AsyncClient(app=app, base_url="http://test") as client:
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
         response = await client.get("/")
         assert response.status_code == 200
         assert response.json()["message"]
@@ -0,0 +1,29 @@
+import importlib.util
+import json
+from pathlib import Path
+
+_SCRIPT = Path(__file__).resolve().parent.parent / "scripts" / "bench_hotpaths.py"
+
+
+def _load_bench():
+    spec = importlib.util.spec_from_file_location("bench_hotpaths", _SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_every_case_runs_and_has_a_baseline() -> None:
+    bench = _load_bench()
+    baseline = json.loads(bench.BASELINE_PATH.read_text())
+
+    assert set(baseline["cases"]) == set(bench.CASES)
+    for setup in bench.CASES.values():
+        setup()()  # timings are left to the script; this keeps the cases from rotting
+
+
+def test_only_slowdowns_past_the_tolerance_count_as_regressions() -> None:
+    bench = _load_bench()
+    baseline = {"fast": 1.0, "steady": 1.0, "slower": 1.0, "removed": 1.0}
+    current = {"fast": 0.5, "steady": 1.4, "slower": 1.6, "new": 9.0}
+
+    assert bench.regressions(current, baseline, tolerance=0.5) == {"slower": 1.6}
@@ -0,0 +1,30 @@
+from pathlib import Path
+
+from app.blobs import BlobStore, open_blob
+from app.workflow import _build_step_content
+
+
+def test_blob_store_dedups_and_evicts_only_unpinned(tmp_path: Path) -> None:
+    store = BlobStore(str(tmp_path), max_bytes=10)
+    first = store.put(b"123456", "image/png")
+    again = store.put(b"123456", "image/png")
+    second = store.put(b"abcdef", "image/jpeg")
+
+    assert first == again
+    assert store.total_bytes == 12  # over budget, but both blobs are pinned
+    with open_blob(second) as data:
+        assert bytes(data) == b"abcdef"
+
+    store.release(first)
+    assert Path(first.path).exists()  # still pinned by the second put
+    store.release(again)
+    assert not Path(first.path).exists()
+    assert store.total_bytes == 6
+
+
+def test_step_content_encodes_from_the_mapped_blob(tmp_path: Path) -> None:
+    ref = BlobStore(str(tmp_path), max_bytes=1024).put(b"\x89PNG", "image/png")
+    content, usage = _build_step_content(ref, "Analyze.", real_age=30)
+    assert content[0] == {"type": "image", "base64": "iVBORw==", "mime_type": "image/png"}
+    assert "Reported real_age: 30" in content[2]["text"]
+    assert usage.tokens == usage.full_image_tokens == 0  # not a decodable image
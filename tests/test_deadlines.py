@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Any, Dict
+
+import pytest
+
+from app import recommendations, workflow
+from app.blobs import BlobStore
+from app.deadlines import Deadline, DeadlineExceeded, run_within
+from app.schemas import GlobalProfile, RoutineIntake
+from app.workflow import StepGate, plan_for_deadline, step_priorities
+
+
+def _estimates(**seconds: float):
+    return lambda step: seconds.get(step, 4.0)
+
+
+def _deadline(seconds_left: float, **estimates: float) -> Deadline:
+    return Deadline(time.monotonic() + seconds_left, _estimates(**estimates))
+
+
+@pytest.mark.asyncio
+async def test_run_within_cancels_only_at_our_own_deadline(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("DEADLINE_MARGIN_SECONDS", "1")
+    assert Deadline.from_budget(None, _estimates()) is None
+    assert 3.5 < Deadline.from_budget(5, _estimates()).remaining() <= 4
+
+    with pytest.raises(DeadlineExceeded):
+        await run_within(_deadline(0.05), asyncio.sleep(5))
+    assert await run_within(None, asyncio.sleep(0, "done")) == "done"
+
+    async def _provider_timeout() -> None:
+        raise TimeoutError("provider")
+
+    with pytest.raises(TimeoutError) as caught:
+        await run_within(_deadline(5), _provider_timeout())
+    assert not isinstance(caught.value, DeadlineExceeded)
+
+
+def test_plan_drops_lowest_priority_steps_until_they_fit(monkeypatch: pytest.MonkeyPatch, sample_analysis: Dict[str, Any]) -> None:
+    monkeypatch.delenv("OPENROUTER_FAST_MODEL", raising=False)
+    monkeypatch.setenv("DEADLINE_MAX_PARALLEL_STEPS", "2")
+    # texture 60, acne 55, pigmentation 40, aging 35
+    priorities = step_priorities(GlobalProfile.model_validate(sample_analysis["global_profile"]))
+    gates = {name: StepGate("run") for name in workflow.ISSUE_STEP_NAMES}
+
+    assert plan_for_deadline(gates, priorities, _deadline(20)) == ("sequential", gates)
+    assert plan_for_deadline(gates, priorities, _deadline(10)) == ("parallel", gates)
+
+    mode, planned = plan_for_deadline(gates, priorities, _deadline(5))
+    assert mode == "parallel"
+    assert {name for name, gate in planned.items() if gate.action == "skip"} == {"aging", "pigmentation"}
+    assert planned["aging"].reason.startswith("deadline:")
+
+    # A step that cannot finish alone goes regardless of its priority.
+    _, planned = plan_for_deadline(gates, priorities, _deadline(10, texture=12))
+    assert [name for name, gate in planned.items() if gate.action == "skip"] == ["texture"]
+
+    monkeypatch.setenv("OPENROUTER_FAST_MODEL", "small-model")
+    _, planned = plan_for_deadline(gates, priorities, _deadline(5.7))
+    assert {name: gate.action for name, gate in planned.items()} == {
+        "texture": "run",
+        "pigmentation": "downgrade",
+        "acne": "downgrade",
+        "aging": "downgrade",
+    }
+
+
+@pytest.mark.asyncio
+async def test_workflow_cancels_late_steps_and_falls_back_to_one_call(
+    monkeypatch: pytest.MonkeyPatch,
+    sample_analysis: Dict[str, Any],
+    tmp_path: Any,
+) -> None:
+    monkeypatch.delenv("OPENROUTER_FAST_MODEL", raising=False)
+    monkeypatch.setenv("STEP_GATING", "0")
+    calls: list[str] = []
+
+    async def _fake_step(schema: Any, instructions: str, *args: Any, **kwargs: Any) -> Any:
+        calls.append(schema.__name__)
+        if schema.__name__ == "TextureIssuesResult":
+            await asyncio.sleep(5)
+        if schema.__name__ == "GlobalProfileResult":
+            return schema.model_validate({"global_profile": sample_analysis["global_profile"]})
+        return schema.model_validate(sample_analysis if schema.__name__ == "CombinedAnalysisResult" else {"issues": {}})
+
+    monkeypatch.setattr(workflow, "_invoke_step", _fake_step)
+    image = BlobStore(str(tmp_path), 1024).put(b"img", "image/jpeg")
+
+    estimates = dict(global_profile=0.01, texture=0.2, pigmentation=0.2, acne=0.2, aging=0.2)
+    statuses: list[str] = []
+    result = await workflow.run_upgraded_workflow(
+        image, progress_callback=lambda status, _: statuses.append(status), deadline=_deadline(0.5, **estimates)
+    )
+    assert result.execution_mode == "parallel"
+    # Completion order is arbitrary, so parallel steps never report a specific "<step>_complete".
+    assert statuses == ["global_profile_complete"] + [workflow.ISSUES_RUNNING_STATUS] * 3
+    assert list(result.cancelled_steps) == ["texture"] and not result.skipped_steps
+    assert len(calls) == 5
+    assert workflow.stale_steps(result.model_dump()) == ["texture"]
+
+    calls.clear()
+    result = await workflow.run_upgraded_workflow(image, deadline=_deadline(3, global_profile=8, single_call=2))
+    assert calls == ["CombinedAnalysisResult"]
+    assert result.execution_mode == "single_call"
+    assert [issue.region for issue in result.issues.acne_active] == ["LeftCheek"]
+    assert workflow.stale_steps(result.model_dump()) == list(workflow.ISSUE_STEP_NAMES)
+
+
+@pytest.mark.asyncio
+async def test_routine_swaps_to_a_faster_engine_for_the_deadline(
+    monkeypatch: pytest.MonkeyPatch,
+    sample_analysis: Dict[str, Any],
+    sample_routine_plan: Dict[str, Any],
+    recording_repository: Any,
+) -> None:
+    calls: list[str] = []
+
+    async def _slow_llm(schema: Any, messages: Any, **kwargs: Any) -> Any:
+        calls.append(schema.__name__)
+        await asyncio.sleep(5)
+
+    monkeypatch.setattr(recommendations, "invoke_structured", _slow_llm)
+    monkeypatch.setattr(recommendations, "_routine_cache_enabled", lambda: False)
+    repository = recording_repository
+    intake = RoutineIntake(pregnancy="no")
+
+    assert recommendations.engine_for_deadline("llm", _deadline(5, routine=20, routine_narrative=3))[0] == "hybrid"
+    await recommendations.generate_routine_plan(
+        "t1", sample_analysis, intake, repository, deadline=_deadline(5, routine=20, routine_narrative=8)
+    )
+    assert calls == []
+    assert repository.saved[0]["degraded"]["engine"] == "rules"
+    assert repository.saved[0]["degraded"]["requested_engine"] == "llm"
+
+    # Expected to fit, but the call overruns: the rule-built plan still ships.
+    await recommendations.generate_routine_plan(
+        "t2", sample_analysis, intake, repository, deadline=_deadline(0.2, routine=0.01)
+    )
+    assert calls == ["RoutinePlan"]
+    assert repository.saved[1]["degraded"]["reason"] == "deadline: reached while the llm engine was running"
+    assert repository.saved[1]["routine"] == repository.saved[0]["routine"]
+    assert not repository.updates
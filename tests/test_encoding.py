@@ -0,0 +1,35 @@
+import gzip
+
+import ormsgpack
+import pytest
+import zstandard
+from starlette.requests import Request
+
+from app.encoding import negotiate_content_encoding, negotiate_media_type, negotiated_response
+
+
+def _request(**headers: str) -> Request:
+    raw = [(name.replace("_", "-").lower().encode(), value.encode()) for name, value in headers.items()]
+    return Request({"type": "http", "method": "GET", "path": "/tasks/x", "headers": raw})
+
+
+def test_negotiation_prefers_zstd_and_honours_qualities() -> None:
+    assert negotiate_content_encoding("gzip, deflate, br, zstd") == "zstd"
+    assert negotiate_content_encoding("zstd;q=0.5, gzip") == "gzip"
+    assert negotiate_content_encoding("identity") is None
+    assert negotiate_media_type("application/msgpack, application/json;q=0.5") == "application/msgpack"
+    assert negotiate_media_type("*/*") == "application/json"
+
+
+@pytest.mark.parametrize("encoding, decompress", [("gzip", gzip.decompress), ("zstd", zstandard.decompress)])
+def test_large_payloads_are_compressed(encoding: str, decompress) -> None:
+    payload = {"issues": [{"region": "LeftCheek", "description": "shine"}] * 200}
+    response = negotiated_response(_request(accept_encoding=encoding, accept="application/msgpack"), payload)
+    assert response.headers["content-encoding"] == encoding
+    assert ormsgpack.unpackb(decompress(response.body)) == payload
+
+
+def test_small_payloads_skip_compression() -> None:
+    response = negotiated_response(_request(accept_encoding="gzip"), {"status": "queued"})
+    assert "content-encoding" not in response.headers
+    assert response.body == b'{"status":"queued"}'
@@ -0,0 +1,63 @@
+import time
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from app.auth import AuthenticatedUser, require_supabase_user
+from app.eta import StepLatencyTracker, get_latency_tracker
+from app.main import app
+from app.storage import TaskRecord, get_task_repository
+from app.storage_sqlite import SQLiteTaskRepository
+
+
+def _task(status: str, started_ago: float, routine_json: dict | None = None) -> TaskRecord:
+    log = [{"version": 2, "sections": ["status"], "at": time.time() - started_ago}]
+    return TaskRecord(id="t1", user_id="u1", status=status, result=None, error=None, routine_json=routine_json, change_log=log)
+
+
+def test_hint_waits_for_the_running_step_and_floors_overruns() -> None:
+    tracker = StepLatencyTracker(default_step_seconds=8)
+    for seconds in (5.0, 6.0, 10.0):
+        tracker.record_progress("global_profile_complete", seconds)
+
+    hint = tracker.hint(_task("processing", started_ago=1))
+    assert hint is not None and hint.current_step == "global_profile"
+    assert hint.retry_after == 4  # Fastest recent run (5s) minus the 1s already spent.
+    assert hint.eta_seconds == pytest.approx(5 + 4 * 8, abs=0.1)
+
+    # Overrunning an intermediate step polls at a fraction of its median...
+    assert tracker.hint(_task("processing", started_ago=30)).retry_after == 2
+    # ...and the last step, whose end the client waits for, at the floor.
+    assert tracker.hint(_task("acne_complete", started_ago=30)).retry_after == 1
+    assert tracker.hint(_task("aging_complete", started_ago=0)).current_step == "finalizing"
+    parallel = tracker.hint(_task("issues_running", started_ago=0))
+    assert parallel is not None and parallel.current_step == "issues" and parallel.eta_seconds is None
+
+    assert tracker.hint(_task("completed", started_ago=0)) is None
+    routine = tracker.hint(_task("completed", started_ago=0), routine_elapsed=5)
+    assert routine is not None and routine.current_step == "routine" and routine.retry_after == 15
+    assert tracker.hint(_task("completed", started_ago=0, routine_json={}), routine_elapsed=5) is None
+    assert tracker.hint(_task("failed", started_ago=0)) is None
+
+
+@pytest.mark.asyncio
+async def test_poll_carries_retry_after_until_the_task_finishes() -> None:
+    store = SQLiteTaskRepository()
+    task = await store.create_task(user_id="u1")
+    await store.update_task(task.id, status_value="processing")
+    get_latency_tracker.cache_clear()
+    app.dependency_overrides[get_task_repository] = lambda: store
+    app.dependency_overrides[require_supabase_user] = lambda: AuthenticatedUser(id="u1")
+    try:
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+            response = await client.get(f"/tasks/{task.id}")
+            assert response.headers["Retry-After"] == "8"
+            assert response.json()["current_step"] == "global_profile"
+
+            await store.update_task(task.id, status_value="completed", result_value={"global_profile": {}})
+            response = await client.get(f"/tasks/{task.id}")
+            assert "Retry-After" not in response.headers
+            assert response.json()["eta_seconds"] is None
+    finally:
+        app.dependency_overrides.clear()
+        await store.aclose()
@@ -0,0 +1,126 @@
+import io
+from typing import Any, Dict
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+from PIL import Image
+
+from app import idempotency, routes
+from app.auth import AuthenticatedUser, require_supabase_user
+from app.blobs import BlobStore
+from app.cache import MemoryCache
+from app.jobs import JobRegistry
+from app.main import app
+from app.storage import get_task_repository
+from app.storage_sqlite import SQLiteTaskRepository
+
+
+def _png(color: tuple[int, int, int]) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 64), color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def store(monkeypatch: pytest.MonkeyPatch) -> MemoryCache:
+    cache = MemoryCache()
+    monkeypatch.setattr(idempotency, "get_idempotency_store", lambda: cache)
+    return cache
+
+
+@pytest.fixture
+def charged(monkeypatch: pytest.MonkeyPatch) -> list[str]:
+    buckets: list[str] = []
+
+    async def _enforce_limits(user_id: str, bucket: str) -> None:
+        buckets.append(bucket)
+
+    monkeypatch.setattr(routes, "enforce_limits", _enforce_limits)
+    return buckets
+
+
+@pytest.mark.asyncio
+async def test_retried_start_task_replays_the_first_task(
+    monkeypatch: pytest.MonkeyPatch, tmp_path, store: MemoryCache, charged: list[str]
+) -> None:
+    monkeypatch.setenv("QUALITY_GATE", "0")
+    blobs = BlobStore(str(tmp_path), 1024 * 1024)
+    monkeypatch.setattr(routes, "get_blob_store", lambda: blobs)
+    registry = JobRegistry()
+    started: list[str] = []
+    monkeypatch.setattr(routes, "get_job_registry", lambda: registry)
+    monkeypatch.setattr(registry, "start", lambda task_id, *args: started.append(task_id) or args[-1].close())
+    repository = SQLiteTaskRepository()
+    app.dependency_overrides[get_task_repository] = lambda: repository
+    app.dependency_overrides[require_supabase_user] = lambda: AuthenticatedUser(id="u1")
+    headers = {"Idempotency-Key": "retry-1"}
+    try:
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+            first = await client.post("/start-task", headers=headers, files={"image": ("a.png", _png((200, 160, 130)), "image/png")})
+            again = await client.post("/start-task", headers=headers, files={"image": ("a.png", _png((200, 160, 130)), "image/png")})
+            other = await client.post("/start-task", headers=headers, files={"image": ("b.png", _png((90, 60, 40)), "image/png")})
+            fresh = await client.post("/start-task", files={"image": ("a.png", _png((200, 160, 130)), "image/png")})
+
+        assert first.status_code == again.status_code == 200
+        assert again.json() == first.json() and again.headers["Idempotent-Replayed"] == "true"
+        assert "Idempotent-Replayed" not in first.headers
+        assert other.status_code == 422 and "different request" in other.json()["detail"]
+        assert fresh.json()["task_id"] != first.json()["task_id"]
+        assert started == [first.json()["task_id"], fresh.json()["task_id"]]
+        # Replays and key conflicts are answered before the rate limiter is charged.
+        assert charged == ["analysis", "analysis"]
+        assert len((await repository.list_task_summaries("u1")).items) == 2
+    finally:
+        app.dependency_overrides.clear()
+        await repository.aclose()
+
+
+@pytest.mark.asyncio
+async def test_recommend_keys_are_per_user_and_freed_after_a_failure(
+    monkeypatch: pytest.MonkeyPatch,
+    sample_analysis: Dict[str, Any],
+    store: MemoryCache,
+    charged: list[str],
+) -> None:
+    registry = JobRegistry()
+    started: list[str] = []
+    monkeypatch.setattr(routes, "get_job_registry", lambda: registry)
+    monkeypatch.setattr(registry, "start", lambda task_id, user_id, *args: started.append(user_id) or args[-1].close())
+    repository = SQLiteTaskRepository()
+    app.dependency_overrides[get_task_repository] = lambda: repository
+    user = {"id": "u1"}
+    app.dependency_overrides[require_supabase_user] = lambda: AuthenticatedUser(id=user["id"])
+    tasks = {}
+    for user_id in ("u1", "u2"):
+        tasks[user_id] = (await repository.create_task(user_id=user_id, real_age=None)).id
+        await repository.update_task(tasks[user_id], status_value="completed", result_value=sample_analysis)
+
+    def _body(user_id: str, budget: float | None = None) -> Dict[str, Any]:
+        return {"task_id": tasks[user_id], "intake": {"pregnancy": "no"}, "latency_budget_seconds": budget}
+
+    headers = {"Idempotency-Key": "routine-1"}
+    try:
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+            first = await client.post("/recommend", headers=headers, json=_body("u1"))
+            # A shrunken budget on the retry is still the same request.
+            again = await client.post("/recommend", headers=headers, json=_body("u1", budget=3))
+            conflict = await client.post("/recommend", headers=headers, json={**_body("u1"), "engine": "rules"})
+            user["id"] = "u2"
+            other_user = await client.post("/recommend", headers=headers, json=_body("u2"))
+
+            monkeypatch.setattr(registry, "start", lambda *args: args[-1].close() or 1 / 0)
+            headers = {"Idempotency-Key": "routine-2"}
+            with pytest.raises(ZeroDivisionError):
+                await client.post("/recommend", headers=headers, json=_body("u2"))
+            monkeypatch.setattr(registry, "start", lambda task_id, user_id, *args: started.append(user_id) or args[-1].close())
+            retried = await client.post("/recommend", headers=headers, json=_body("u2"))
+
+        assert first.status_code == again.status_code == other_user.status_code == retried.status_code == 202
+        assert again.json() == first.json() and again.headers["Idempotent-Replayed"] == "true"
+        assert conflict.status_code == 422
+        assert "Idempotent-Replayed" not in other_user.headers and "Idempotent-Replayed" not in retried.headers
+        assert started == ["u1", "u2", "u2"]
+        assert charged == ["routine"] * 4
+    finally:
+        app.dependency_overrides.clear()
+        await repository.aclose()
@@ -0,0 +1,179 @@
+import asyncio
+from typing import Any, Dict
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from app import recommendations, routes
+from app.auth import AuthenticatedUser, require_supabase_user
+from app.blobs import BlobStore
+from app.jobs import JobRegistry
+from app.main import app
+from app.schemas import RoutineIntake, UpgradedFaceAnalysisResult
+from app.storage import get_task_repository
+from app.storage_sqlite import SQLiteTaskRepository
+
+
+def _slow_workflow(started: asyncio.Event):
+    async def _run(image: Any, real_age: Any = None, progress_callback: Any = None, geometry: Any = None, deadline: Any = None) -> None:
+        progress_callback("global_profile_complete", {"issues": {}, "global_profile": {"summary_description": "x"}})
+        started.set()
+        await asyncio.sleep(60)
+
+    return _run
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("reason, expected_status", [("user", "cancelled"), ("shutdown", "interrupted")])
+async def test_cancelling_process_task_marks_status(
+    monkeypatch: pytest.MonkeyPatch,
+    reason: str,
+    expected_status: str,
+    tmp_path: Any,
+    recording_repository: Any,
+) -> None:
+    registry = JobRegistry()
+    store = BlobStore(str(tmp_path), max_bytes=0)
+    monkeypatch.setattr(routes, "get_blob_store", lambda: store)
+    started = asyncio.Event()
+    monkeypatch.setattr(routes, "get_job_registry", lambda: registry)
+    monkeypatch.setattr(routes, "run_upgraded_workflow", _slow_workflow(started))
+    repository = recording_repository
+
+    image = store.put(b"img", "image/png")
+    registry.start("t1", "u1", "analysis", routes._process_task("t1", image, None, repository, user_id="u1"))
+    # A signature mismatch fails the task before it starts; don't wait on it forever.
+    await asyncio.wait_for(started.wait(), timeout=5)
+    if reason == "shutdown":
+        await registry.shutdown(drain_timeout=0.01)
+    else:
+        await registry.cancel_and_wait(registry.for_task("t1"), "user")
+
+    assert len(registry) == 0
+    assert store.total_bytes == 0  # released and evicted once the task ended
+    assert repository.updates[-1]["status_value"] == expected_status
+    if reason == "shutdown":
+        assert repository.updates[-1]["result_value"]["global_profile"]
+
+
+@pytest.mark.asyncio
+async def test_recommend_supersedes_the_running_routine(monkeypatch: pytest.MonkeyPatch, sample_analysis: Dict[str, Any]) -> None:
+    registry = JobRegistry()
+    monkeypatch.setattr(routes, "get_job_registry", lambda: registry)
+    runs: list[str] = []
+
+    async def _slow_routine(task_id: str, *args: Any, **kwargs: Any) -> None:
+        runs.append(task_id)
+        await asyncio.sleep(60)
+
+    monkeypatch.setattr(routes, "generate_routine_plan", _slow_routine)
+    monkeypatch.setattr(routes, "enforce_limits", lambda user_id, bucket: asyncio.sleep(0))
+    repository = SQLiteTaskRepository()
+    app.dependency_overrides[get_task_repository] = lambda: repository
+    app.dependency_overrides[require_supabase_user] = lambda: AuthenticatedUser(id="u1")
+    task = await repository.create_task(user_id="u1")
+    await repository.update_task(task.id, status_value="completed", result_value=sample_analysis)
+    body = {"task_id": task.id, "intake": {"pregnancy": "no"}}
+    try:
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+            assert (await client.post("/recommend", json=body)).status_code == 202
+            await asyncio.sleep(0)
+            first = registry.get(task.id, "routine")
+            assert (await client.post("/recommend", json=body)).status_code == 202
+
+        assert first is not None and first.task.cancelled() and first.cancel_reason == "superseded"
+        current = registry.get(task.id, "routine")
+        assert current is not None and current is not first and not current.task.done()
+        with pytest.raises(RuntimeError):
+            registry.start(task.id, "u1", "routine", _slow_routine(task.id))
+        await registry.cancel_and_wait(registry.running(), "user")
+    finally:
+        app.dependency_overrides.clear()
+        await repository.aclose()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "reason, expected_error",
+    [("user", "Routine generation was cancelled."), ("shutdown", "Server restarted before the routine was ready."), ("superseded", None)],
+)
+async def test_cancelling_a_routine_records_why(
+    monkeypatch: pytest.MonkeyPatch,
+    sample_analysis: Dict[str, Any],
+    reason: str,
+    expected_error: str | None,
+    recording_repository: Any,
+) -> None:
+    registry = JobRegistry()
+    monkeypatch.setattr(recommendations, "get_job_registry", lambda: registry)
+    monkeypatch.setattr(recommendations, "_routine_cache", lambda engine: None)
+    started = asyncio.Event()
+
+    async def _slow_model(*args: Any, **kwargs: Any) -> None:
+        started.set()
+        await asyncio.sleep(60)
+
+    monkeypatch.setattr(recommendations, "invoke_structured", _slow_model)
+    repository = recording_repository
+    registry.start("t1", "u1", "routine", recommendations.generate_routine_plan("t1", sample_analysis, RoutineIntake(), repository))
+    await asyncio.wait_for(started.wait(), timeout=5)
+    if reason == "shutdown":
+        await registry.shutdown(drain_timeout=0.01)
+    else:
+        await registry.cancel_and_wait(registry.for_task("t1"), reason)
+
+    assert len(registry) == 0
+    assert repository.updates == ([{"error_value": expected_error}] if expected_error else [])
+
+
+@pytest.mark.asyncio
+async def test_selfie_upload_runs_beside_the_task_and_goes_with_a_superseded_one(
+    monkeypatch: pytest.MonkeyPatch, sample_analysis: Dict[str, Any], tmp_path: Any
+) -> None:
+    registry = JobRegistry()
+    store = BlobStore(str(tmp_path), max_bytes=1024)
+    monkeypatch.setattr(routes, "get_blob_store", lambda: store)
+    monkeypatch.setattr(routes, "get_job_registry", lambda: registry)
+    monkeypatch.setattr(routes, "record_completed_analysis", lambda *args, **kwargs: asyncio.sleep(0))
+    repository = SQLiteTaskRepository()
+    uploaded = asyncio.Event()
+    save_task_image = repository.save_task_image
+
+    async def _slow_upload(*args: Any, **kwargs: Any) -> None:
+        await uploaded.wait()
+        await save_task_image(*args, **kwargs)
+
+    monkeypatch.setattr(repository, "save_task_image", _slow_upload)
+
+    async def _workflow(*args: Any, **kwargs: Any) -> UpgradedFaceAnalysisResult:
+        return UpgradedFaceAnalysisResult.model_validate(sample_analysis)
+
+    monkeypatch.setattr(routes, "run_upgraded_workflow", _workflow)
+    done = await repository.create_task(user_id="u1")
+    job = registry.start(done.id, "u1", "analysis", routes._process_task(done.id, store.put(b"img", "image/png"), None, repository, user_id="u1"))
+    for _ in range(100):
+        if (await repository.get_task(done.id)).status == "completed":
+            break
+        await asyncio.sleep(0.01)
+    # Completed while the upload is still waiting; the blob stays pinned for it.
+    assert (await repository.get_task(done.id)).status == "completed" and not job.done()
+    uploaded.set()
+    await job
+    assert await repository.load_task_image(done.id, user_id="u1") is not None
+    assert not store._pins
+
+    started = asyncio.Event()
+    monkeypatch.setattr(routes, "run_upgraded_workflow", _slow_workflow(started))
+    superseded = await repository.create_task(user_id="u1")
+    registry.start(superseded.id, "u1", "analysis", routes._process_task(superseded.id, store.put(b"img", "image/png"), None, repository, user_id="u1"))
+    await asyncio.wait_for(started.wait(), timeout=5)
+    await registry.cancel_and_wait(registry.for_task(superseded.id), "superseded")
+    assert (await repository.get_task(superseded.id)).status == "cancelled"
+    assert await repository.load_task_image(superseded.id, user_id="u1") is None
+
+    monkeypatch.setenv("STORE_TASK_IMAGES", "0")
+    monkeypatch.setattr(routes, "run_upgraded_workflow", _workflow)
+    skipped = await repository.create_task(user_id="u1")
+    await routes._process_task(skipped.id, store.put(b"img", "image/png"), None, repository, user_id="u1")
+    assert await repository.load_task_image(skipped.id, user_id="u1") is None
+    await repository.aclose()
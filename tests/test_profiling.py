@@ -0,0 +1,78 @@
+import asyncio
+from typing import Any
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from app import routes
+from app.auth import AuthenticatedUser, require_supabase_user
+from app.jobs import JobRegistry
+from app.main import app
+
+_ADMIN_ENDPOINTS = [
+    ("post", "/admin/debug/profile?seconds=0.1"),
+    ("post", "/admin/debug/tracemalloc/start"),
+    ("post", "/admin/debug/tracemalloc/stop"),
+    ("get", "/admin/debug/tracemalloc/top"),
+    ("get", "/admin/debug/tasks"),
+]
+
+
+@pytest.mark.asyncio
+async def test_debug_endpoints_are_admin_only(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("ADMIN_USER_IDS", "admin-1")
+    app.dependency_overrides[require_supabase_user] = lambda: AuthenticatedUser(id="u1", raw={"app_metadata": {}})
+    try:
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+            for method, path in _ADMIN_ENDPOINTS:
+                response = await client.request(method, path)
+                assert response.status_code == 403, path
+    finally:
+        app.dependency_overrides.clear()
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        assert (await client.get("/admin/debug/tasks")).status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_admin_sees_profiles_allocations_and_stuck_tasks(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("ADMIN_USER_IDS", "admin-1")
+    app.dependency_overrides[require_supabase_user] = lambda: AuthenticatedUser(id="admin-1")
+    registry = JobRegistry()
+    monkeypatch.setattr(routes, "get_job_registry", lambda: registry)
+    stuck = asyncio.Event()
+
+    async def _stuck_step() -> None:
+        await stuck.wait()
+
+    async def _process_task() -> None:
+        await _stuck_step()
+
+    registry.start("t1", "u1", "analysis", _process_task())
+    try:
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+            dump = (await client.get("/admin/debug/tasks")).json()
+            job = dump["tasks"][0]
+            assert job["name"] == "analysis:t1" and job["job_age_seconds"] is not None
+            assert [frame.split(" ")[0] for frame in job["stack"]] == ["_process_task", "_stuck_step", "wait"]
+            assert "Future pending" in job["awaiting"]
+
+            profile = await client.post("/admin/debug/profile", params={"seconds": 0.2, "interval_ms": 10})
+            assert profile.status_code == 200
+            lines = profile.text.splitlines()
+            assert lines and all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+            assert any(line.startswith("MainThread;") for line in lines)
+            too_long = await client.post("/admin/debug/profile", params={"seconds": 3600})
+            assert too_long.status_code == 422
+
+            assert (await client.get("/admin/debug/tracemalloc/top")).status_code == 409
+            assert (await client.post("/admin/debug/tracemalloc/start")).json()["tracing"] is True
+            retained: list[Any] = [bytearray(1024) for _ in range(2000)]
+            top = (await client.get("/admin/debug/tracemalloc/top", params={"limit": 5})).json()
+            assert "test_profiling.py" in top["top"][0]["location"] and top["top"][0]["size_diff"] >= 2_000_000
+            assert (await client.post("/admin/debug/tracemalloc/stop")).json()["tracing"] is False
+            del retained
+    finally:
+        stuck.set()
+        app.dependency_overrides.clear()
+        await registry.shutdown(drain_timeout=1)
@@ -0,0 +1,68 @@
+import io
+
+import numpy as np
+import pytest
+from httpx import ASGITransport, AsyncClient
+from PIL import Image, ImageFilter
+
+from app import routes
+from app.auth import AuthenticatedUser, require_supabase_user
+from app.blobs import BlobStore
+from app.main import app
+from app.quality import assess_image
+from app.storage import get_task_repository
+from app.storage_sqlite import SQLiteTaskRepository
+
+
+def _encode(image: Image.Image) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _selfie(width: int = 480, height: int = 640, color: tuple[int, int, int] = (214, 164, 134)) -> Image.Image:
+    rng = np.random.default_rng(0)
+    pixels = np.clip(np.array(color) + rng.normal(0, 18, (height, width, 3)), 0, 255).astype(np.uint8)
+    return Image.fromarray(pixels, "RGB")
+
+
+@pytest.mark.parametrize(
+    ("image", "reason"),
+    [
+        (_selfie(), None),
+        (_selfie().filter(ImageFilter.GaussianBlur(4)), "too_blurry"),
+        (_selfie().point(lambda value: value * 0.12), "too_dark"),
+        (_selfie().point(lambda value: min(255, value * 3)), "overexposed"),
+        (_selfie(120, 120), "too_small"),
+        (_selfie(1200, 300), "bad_aspect_ratio"),
+        (_selfie(color=(40, 90, 200)), "no_face_detected"),
+    ],
+)
+def test_assess_image_reasons(image: Image.Image, reason: str | None) -> None:
+    report = assess_image(_encode(image))
+    assert report.reason == reason
+    assert report.passed is (reason is None)
+
+
+def test_undecodable_upload_is_rejected() -> None:
+    assert assess_image(b"not an image").reason == "unreadable_image"
+
+
+@pytest.mark.asyncio
+async def test_start_task_rejects_unusable_photo_before_creating_a_task(monkeypatch: pytest.MonkeyPatch, tmp_path) -> None:
+    blobs = BlobStore(str(tmp_path), 1024 * 1024)
+    monkeypatch.setattr(routes, "get_blob_store", lambda: blobs)
+    store = SQLiteTaskRepository()
+    app.dependency_overrides[get_task_repository] = lambda: store
+    app.dependency_overrides[require_supabase_user] = lambda: AuthenticatedUser(id="u1")
+    try:
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+            blurry = _encode(_selfie().filter(ImageFilter.GaussianBlur(4)))
+            response = await client.post("/start-task", files={"image": ("selfie.png", blurry, "image/png")})
+        assert response.status_code == 422
+        assert response.json()["detail"]["reason"] == "too_blurry"
+        assert (await store.list_task_summaries("u1")).items == []
+        assert blobs.total_bytes > 0 and not blobs._pins
+    finally:
+        app.dependency_overrides.clear()
+        await store.aclose()
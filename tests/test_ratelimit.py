@@ -0,0 +1,51 @@
+import pytest
+from fastapi import HTTPException
+
+from app import ratelimit
+from app.ratelimit import BucketConfig, MemoryRateLimitBackend
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_refuses_when_empty() -> None:
+    backend = MemoryRateLimitBackend()
+    config = BucketConfig(capacity=2, refill_per_second=0.5)
+    assert await backend.take("analysis:u1", config) == 0
+    assert await backend.take("analysis:u1", config) == 0
+    retry_after = await backend.take("analysis:u1", config)
+    assert 0 < retry_after <= 2
+    assert await backend.take("analysis:u2", config) == 0
+
+
+@pytest.mark.asyncio
+async def test_enforce_limits_returns_429_with_retry_after(monkeypatch: pytest.MonkeyPatch) -> None:
+    backend = MemoryRateLimitBackend()
+    monkeypatch.setattr(ratelimit, "get_rate_limit_backend", lambda: backend)
+    monkeypatch.setattr(ratelimit, "get_bucket_configs", lambda: {"routine": BucketConfig(1, 1 / 60)})
+
+    await ratelimit.enforce_limits("u1", "routine")
+    with pytest.raises(HTTPException) as exc_info:
+        await ratelimit.enforce_limits("u1", "routine")
+    assert exc_info.value.status_code == 429
+    assert int(exc_info.value.headers["Retry-After"]) >= 59
+
+
+@pytest.mark.asyncio
+async def test_daily_quota_counts_llm_usage(monkeypatch: pytest.MonkeyPatch) -> None:
+    backend = MemoryRateLimitBackend()
+    monkeypatch.setattr(ratelimit, "get_rate_limit_backend", lambda: backend)
+    monkeypatch.setenv("DAILY_LLM_TOKEN_QUOTA", "1000")
+
+    token = ratelimit.llm_usage_user.set("u1")
+    try:
+        await ratelimit.record_llm_usage(1, 1200)
+    finally:
+        ratelimit.llm_usage_user.reset(token)
+
+    with pytest.raises(HTTPException) as exc_info:
+        await ratelimit.enforce_limits("u1", "analysis")
+    assert exc_info.value.detail == "Daily LLM quota exceeded."
+    # The quota is shared by both buckets, so the routine endpoints hit the same wall.
+    with pytest.raises(HTTPException) as exc_info:
+        await ratelimit.enforce_limits("u1", "routine")
+    assert exc_info.value.detail == "Daily LLM quota exceeded."
+    await ratelimit.enforce_limits("u2", "analysis")
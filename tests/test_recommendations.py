@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from typing import Any, Dict
+
+import pytest
+from langchain_core.messages import AIMessageChunk
+
+from app import metrics, recommendations
+from app.cache import MemoryCache, TieredCache
+from app.prompts import build_routine_prompt_messages
+from app.scheduler import FairScheduler
+from app.schemas import RoutineIntake, RoutinePlan
+
+
+class _FakeModel:
+    def __init__(self, plan: Dict[str, Any]) -> None:
+        self.plan = plan
+        self.calls = 0
+
+    async def invoke(self, schema: Any, messages: Any, **kwargs: Any) -> RoutinePlan:
+        self.calls += 1
+        return RoutinePlan.model_validate(self.plan)
+
+
+@pytest.mark.asyncio
+async def test_routine_cache_skips_llm_on_repeat(
+    monkeypatch: pytest.MonkeyPatch,
+    sample_analysis: Dict[str, Any],
+    sample_routine_plan: Dict[str, Any],
+    recording_repository: Any,
+) -> None:
+    model = _FakeModel(sample_routine_plan)
+    monkeypatch.setattr(recommendations, "invoke_structured", model.invoke)
+    cache = TieredCache(MemoryCache())
+    monkeypatch.setattr(recommendations, "get_routine_cache", lambda: cache)
+    repository = recording_repository
+    intake = RoutineIntake(sensitivity="low")
+
+    await recommendations.generate_routine_plan("t1", sample_analysis, intake, repository)
+    await recommendations.generate_routine_plan("t2", dict(sample_analysis, extra="ignored"), intake, repository)
+    await recommendations.generate_routine_plan("t3", sample_analysis, RoutineIntake(sensitivity="high"), repository)
+
+    assert model.calls == 2
+    assert len(repository.saved) == 3
+    assert repository.saved[1]["routine"]["am"][0]["products"][0]["url"]
+    assert not repository.errors
+
+
+@pytest.mark.asyncio
+async def test_memory_cache_evicts_least_recently_used() -> None:
+    cache = MemoryCache(max_entries=2, ttl_seconds=60)
+    await cache.set("a", {"v": 1})
+    await cache.set("b", {"v": 2})
+    assert await cache.get("a") == {"v": 1}
+    await cache.set("c", {"v": 3})
+    assert await cache.get("b") is None
+    assert await cache.get("a") == {"v": 1}
+    await cache.set("expired", {"v": 4}, ttl_seconds=0)
+    assert await cache.get("expired") is None
+
+
+class _FakeStreamModel:
+    def __init__(self, text: str, chunk_size: int = 7) -> None:
+        self.chunks = [text[i : i + chunk_size] for i in range(0, len(text), chunk_size)]
+
+    async def astream(self, messages: Any):
+        for chunk in self.chunks:
+            yield AIMessageChunk(content=chunk)
+
+
+@pytest.mark.asyncio
+async def test_stream_routine_emits_sections_before_completion(
+    monkeypatch: pytest.MonkeyPatch,
+    sample_analysis: Dict[str, Any],
+    sample_routine_plan: Dict[str, Any],
+    recording_repository: Any,
+) -> None:
+    monkeypatch.setattr(
+        recommendations,
+        "get_json_stream_model",
+        lambda schema: _FakeStreamModel(json.dumps(sample_routine_plan)),
+    )
+    monkeypatch.setattr(recommendations, "_routine_cache_enabled", lambda: False)
+    repository = recording_repository
+
+    events = [
+        event
+        async for event in recommendations.stream_routine_plan("t1", sample_analysis, RoutineIntake(), repository)
+    ]
+
+    sections = [data["section"] for name, data in events if name == "section"]
+    assert sections == list(recommendations.ROUTINE_STREAM_SECTIONS)
+    assert events[-1][0] == "complete"
+    assert events[0][1]["data"][0]["type"] == "cleanser"
+    assert len(repository.saved) == 1
+    assert "routine_stream.time_to_first_section_seconds" in metrics.snapshot()["summaries"]
+
+
+@pytest.mark.asyncio
+async def test_stream_releases_the_llm_slot_while_the_client_reads(
+    monkeypatch: pytest.MonkeyPatch,
+    sample_analysis: Dict[str, Any],
+    sample_routine_plan: Dict[str, Any],
+    recording_repository: Any,
+) -> None:
+    class _PacedStreamModel(_FakeStreamModel):
+        async def astream(self, messages: Any):
+            for chunk in self.chunks:
+                await asyncio.sleep(0)
+                yield AIMessageChunk(content=chunk)
+
+    scheduler = FairScheduler(1)
+    monkeypatch.setattr(recommendations, "get_llm_scheduler", lambda: scheduler)
+    monkeypatch.setattr(recommendations, "get_json_stream_model", lambda schema: _PacedStreamModel(json.dumps(sample_routine_plan)))
+    monkeypatch.setattr(recommendations, "_routine_cache_enabled", lambda: False)
+    stream = recommendations.stream_routine_plan("t1", sample_analysis, RoutineIntake(), recording_repository)
+
+    assert (await anext(stream))[0] == "section"
+    # The client stalls after the first section; the model finishes anyway and frees the slot.
+    for _ in range(1000):
+        if scheduler.in_use == 0:
+            break
+        await asyncio.sleep(0)
+    assert scheduler.in_use == 0
+    events = [event async for event in stream]
+    assert events[-1][0] == "complete"
+
+
+def test_routine_messages_keep_static_prefix_stable(
+    sample_analysis: Dict[str, Any],
+) -> None:
+    first = build_routine_prompt_messages(sample_analysis, RoutineIntake().model_dump())
+    second = build_routine_prompt_messages({}, RoutineIntake(pregnancy="yes").model_dump())
+    assert first[0] == second[0]
+    assert "Product DB" in first[0]["content"][0]["text"]
+    assert "LeftCheek" in first[1]["content"] and "LeftCheek" not in first[0]["content"][0]["text"]
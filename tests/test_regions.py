@@ -0,0 +1,57 @@
+import io
+from pathlib import Path
+
+from PIL import Image
+
+from app.blobs import BlobStore
+from app.regions import crop_step_tiles
+from app.schemas import FaceGeometry
+from app.workflow import _build_step_content
+
+_GEOMETRY = {
+    "landmarks": {"LeftEye": [300, 200], "RightEye": [180, 200], "NoseBase": [240, 280], "LeftCheek": [310, 290], "RightCheek": [170, 290], "MouthBottom": [240, 360]},
+    "contours": {
+        "FaceOval": [[240, 80], [340, 150], [350, 260], [320, 380], [240, 420], [160, 380], [130, 260], [140, 150]],
+        "LeftEyebrowTop": [[270, 170], [330, 168]],
+        "RightEyebrowTop": [[150, 168], [210, 170]],
+    },
+}
+
+
+def _stored_selfie(tmp_path: Path, size: tuple[int, int] = (480, 640)):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, (214, 164, 134)).save(buffer, format="PNG")
+    return BlobStore(str(tmp_path), 1024 * 1024).put(buffer.getvalue(), "image/png")
+
+
+def test_steps_get_region_crops_labelled_with_ml_kit_regions(tmp_path: Path) -> None:
+    image = _stored_selfie(tmp_path)
+    geometry = FaceGeometry.model_validate(_GEOMETRY)
+
+    eyes, overview = crop_step_tiles(image, geometry, "aging")
+    assert eyes.name == "eyes" and {"LeftEye", "RightEye"} <= set(eyes.regions)
+    assert "MouthBottom" not in eyes.regions and "MouthBottom" in overview.regions
+    assert eyes.height < eyes.width < 480
+
+    # Three crops of a small upload cost more than the upload itself.
+    content, usage = _build_step_content(image, "Analyze.", step_name="texture", geometry=geometry)
+    assert content[0]["type"] == "image" and usage.tokens == usage.full_image_tokens
+
+    # Geometry from a half-size preview frame is scaled up to the upload.
+    large = _stored_selfie(tmp_path, (1440, 1920))
+    scaled = FaceGeometry.model_validate({**_GEOMETRY, "image_width": 480, "image_height": 640})
+    content, usage = _build_step_content(large, "Analyze.", step_name="texture", geometry=scaled)
+    captions = [block["text"] for block in content if block["type"] == "text" and block["text"].startswith("Crop")]
+    assert [caption.split("`")[1] for caption in captions] == ["t_zone", "left_cheek", "right_cheek"]
+    assert usage.tokens <= usage.full_image_tokens
+    _, usage = _build_step_content(large, "Analyze.", step_name="aging", geometry=scaled)
+    assert usage.tokens < usage.full_image_tokens
+
+
+def test_missing_regions_fall_back_to_the_full_image(tmp_path: Path) -> None:
+    image = _stored_selfie(tmp_path)
+    geometry = FaceGeometry.model_validate({"landmarks": {"NoseBase": [240, 280]}})
+
+    assert crop_step_tiles(image, geometry, "aging") is None
+    content, usage = _build_step_content(image, "Analyze.", step_name="aging", geometry=geometry)
+    assert content[0]["type"] == "image" and usage.tokens == usage.full_image_tokens
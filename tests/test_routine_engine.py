@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+from typing import Any, Dict
+
+import pytest
+
+from app import metrics, recommendations
+from app.routine_engine import build_routine, load_catalog
+from app.schemas import RoutineIntake, RoutinePlan
+
+
+def _products(plan: RoutinePlan) -> list[str]:
+    steps = [*plan.routine.am, *(plan.routine.midday or []), *plan.routine.pm]
+    return [product.name for step in steps for product in step.products]
+
+
+def test_rules_follow_the_safety_and_sequencing_rules(sample_analysis: Dict[str, Any]) -> None:
+    catalog = {product.name: product for product in load_catalog()}
+    plan = build_routine(sample_analysis, RoutineIntake(pregnancy="no"))
+
+    assert RoutinePlan.model_validate(plan.model_dump()) == plan
+    assert [step.type for step in plan.routine.am] == ["cleanser", "moisturizer", "sunscreen"]
+    assert [step.type for step in plan.routine.pm] == ["cleanser", "active", "moisturizer"]
+    assert [concern.key for concern in plan.reasons.prioritized_concerns] == ["oily_shine", "acne"]
+    assert all(name in catalog for name in _products(plan))
+    assert build_routine(sample_analysis, RoutineIntake(pregnancy="no")) == plan
+
+    sample_analysis["global_profile"]["scores"].update(acne=10, oily_shine=10, wrinkles=70)
+    pregnant = build_routine(sample_analysis, RoutineIntake(pregnancy="yes"))
+    assert not any(catalog[name].contains(("Retin", "Adapalene")) for name in _products(pregnant))
+    assert any(step.type == "active" for step in pregnant.routine.am)  # vitamin C instead of a retinoid
+
+    on_rx = build_routine(sample_analysis, RoutineIntake(rx_topical="yes", budget_preference="budget", allergies=["zinc"]))
+    assert not any(step.type == "active" for step in [*on_rx.routine.am, *on_rx.routine.pm])
+    assert not any("zinc" in catalog[name].actives.lower() for name in _products(on_rx))
+    assert [step.products[0].tier for step in on_rx.routine.am] == ["budget", "budget", "mid"]  # no zinc-free budget SPF
+
+
+@pytest.mark.asyncio
+async def test_hybrid_keeps_rule_products_and_takes_llm_text(
+    monkeypatch: pytest.MonkeyPatch,
+    sample_analysis: Dict[str, Any],
+    sample_routine_plan: Dict[str, Any],
+    recording_repository: Any,
+) -> None:
+    calls: list[str] = []
+
+    async def _narrate(schema: Any, messages: Any, **kwargs: Any) -> Any:
+        calls.append(schema.__name__)
+        return schema.model_validate(
+            {
+                "product_why": [{"key": "CeraVe Acne Control Cleanser", "text": "Clears pores gently."}],
+                "concern_why": [{"key": "acne", "text": "Papules on the left cheek."}],
+                "notes": "Start slowly.",
+                "lifestyle": sample_routine_plan["lifestyle"],
+            }
+        )
+
+    monkeypatch.setattr(recommendations, "invoke_structured", _narrate)
+    monkeypatch.setattr(recommendations, "_routine_cache_enabled", lambda: False)
+    repository = recording_repository
+    intake = RoutineIntake(pregnancy="no")
+
+    await recommendations.generate_routine_plan("t1", sample_analysis, intake, repository, engine="rules")
+    await recommendations.generate_routine_plan("t2", sample_analysis, intake, repository, engine="hybrid")
+
+    assert calls == ["RoutineNarrative"]
+    rules, hybrid = (RoutinePlan.model_validate(saved) for saved in repository.saved)
+    assert _products(hybrid) == _products(rules)
+    cleanser = hybrid.routine.am[0].products[0]
+    assert cleanser.name == "CeraVe Acne Control Cleanser" and cleanser.why == "Clears pores gently."
+    assert hybrid.reasons.notes == "Start slowly."
+    assert repository.saved[1]["routine"]["am"][0]["products"][0]["url"]
+
+    async def _fail(*args: Any, **kwargs: Any) -> Any:
+        raise RuntimeError("provider down")
+
+    monkeypatch.setattr(recommendations, "invoke_structured", _fail)
+    metrics.reset()
+    await recommendations.generate_routine_plan("t3", sample_analysis, intake, repository, engine="hybrid")
+    assert repository.saved[2] == repository.saved[0] and not repository.errors
+    assert metrics.get_counter("routine.narrative_failures") == 1
+
+
+@pytest.mark.asyncio
+async def test_hybrid_narrative_cannot_reintroduce_unsafe_advice(
+    monkeypatch: pytest.MonkeyPatch,
+    sample_analysis: Dict[str, Any],
+    sample_routine_plan: Dict[str, Any],
+    recording_repository: Any,
+) -> None:
+    lifestyle = {
+        **sample_routine_plan["lifestyle"],
+        "diet": {"increase": ["peanut butter", "leafy greens"], "limit": ["sugar"], "supplements": ["vitamin A", "zinc"]},
+    }
+
+    async def _narrate(schema: Any, messages: Any, **kwargs: Any) -> Any:
+        return schema.model_validate({"product_why": [], "concern_why": [], "notes": "", "lifestyle": lifestyle})
+
+    monkeypatch.setattr(recommendations, "invoke_structured", _narrate)
+    monkeypatch.setattr(recommendations, "_routine_cache_enabled", lambda: False)
+    repository = recording_repository
+
+    pregnant = RoutineIntake(pregnancy="yes", allergies=["Peanut"])
+    await recommendations.generate_routine_plan("t1", sample_analysis, pregnant, repository, engine="hybrid")
+    await recommendations.generate_routine_plan("t2", sample_analysis, RoutineIntake(pregnancy="no", allergies=["zinc"]), repository, engine="hybrid")
+
+    first, second = (saved["lifestyle"]["diet"] for saved in repository.saved)
+    assert first == {"increase": ["leafy greens"], "limit": ["sugar"], "supplements": []}
+    assert second["supplements"] == ["vitamin A"] and second["increase"] == ["peanut butter", "leafy greens"]
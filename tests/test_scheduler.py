@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+
+from app.scheduler import FairScheduler, Priority
+
+
+async def _run(scheduler: FairScheduler, priority: Priority, user: str, order: list[str], gate: asyncio.Event) -> None:
+    async with scheduler.slot(priority, user):
+        order.append(f"{priority.name.lower()}:{user}")
+        await gate.wait()
+
+
+@pytest.mark.asyncio
+async def test_interactive_first_then_round_robin_across_users() -> None:
+    scheduler = FairScheduler(slots=1)
+    order: list[str] = []
+    gate = asyncio.Event()
+    gate.set()
+
+    await scheduler.acquire(Priority.BACKGROUND, "holder")
+    tasks = [
+        asyncio.create_task(_run(scheduler, Priority.BACKGROUND, "heavy", order, gate)),
+        asyncio.create_task(_run(scheduler, Priority.BACKGROUND, "heavy", order, gate)),
+        asyncio.create_task(_run(scheduler, Priority.BACKGROUND, "heavy", order, gate)),
+        asyncio.create_task(_run(scheduler, Priority.BACKGROUND, "light", order, gate)),
+        asyncio.create_task(_run(scheduler, Priority.INTERACTIVE, "light", order, gate)),
+    ]
+    await asyncio.sleep(0)
+    assert scheduler.queue_depth(Priority.BACKGROUND) == 4
+    scheduler.release()
+    await asyncio.gather(*tasks)
+
+    assert order == [
+        "interactive:light",
+        "background:heavy",
+        "background:light",
+        "background:heavy",
+        "background:heavy",
+    ]
+    assert scheduler.in_use == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_does_not_leak_slot() -> None:
+    scheduler = FairScheduler(slots=1)
+    await scheduler.acquire(Priority.BATCH, "a")
+    waiter = asyncio.create_task(scheduler.acquire(Priority.BATCH, "b"))
+    await asyncio.sleep(0)
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    scheduler.release()
+    assert scheduler.in_use == 0
+    assert scheduler.queue_depth(Priority.BATCH) == 0
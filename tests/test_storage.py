@@ -0,0 +1,100 @@
+import json
+
+import httpx
+import pytest
+
+from app import storage
+from app.storage import TaskRepository, decode_cursor, encode_cursor, task_delta
+
+
+T2 = "00000000-0000-4000-8000-000000000002"
+
+
+def test_cursor_round_trip() -> None:
+    token = encode_cursor("2025-11-10T09:12:44.120331+00:00", T2)
+    assert decode_cursor(token) == ("2025-11-10T09:12:44.120331+00:00", T2)
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
+    # Both values end up in a query filter, so anything but a timestamp and a UUID is refused.
+    for created_at, task_id in [("2025-01-02", "t2),id.gt.(0"), ('2025-01-02",x', T2), (1, T2)]:
+        with pytest.raises(ValueError):
+            decode_cursor(encode_cursor(created_at, task_id))
+
+
+@pytest.mark.asyncio
+async def test_list_task_summaries_projects_columns_and_pages(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("SUPABASE_URL", "https://example.supabase.co")
+    monkeypatch.setenv("SUPABASE_SERVICE_ROLE_KEY", "service-key")
+    seen: list[httpx.Request] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request)
+        rows = [
+            {"id": "t3", "user_id": "u1", "status": "completed", "created_at": "2025-01-03", "skin_age": "31"},
+            {"id": T2, "user_id": "u1", "status": "completed", "created_at": "2025-01-02"},
+            {"id": "t1", "user_id": "u1", "status": "failed", "created_at": "2025-01-01"},
+        ]
+        return httpx.Response(200, json=rows)
+
+    real_client = httpx.AsyncClient
+    monkeypatch.setattr(
+        storage.httpx,
+        "AsyncClient",
+        lambda **kwargs: real_client(transport=httpx.MockTransport(handler), **kwargs),
+    )
+
+    page = await TaskRepository().list_task_summaries("u1", limit=2, include=["routine_json"])
+
+    params = seen[0].url.params
+    assert "routine_json" in params["select"]
+    assert "result," not in params["select"] + ","
+    assert params["limit"] == "3"
+    assert [item.id for item in page.items] == ["t3", T2]
+    assert page.items[0].skin_age == 31
+    assert decode_cursor(page.next_cursor) == ("2025-01-02", T2)
+
+    await TaskRepository().list_task_summaries("u1", limit=2, cursor=page.next_cursor)
+    assert seen[1].url.params["or"] == f'(created_at.lt."2025-01-02",and(created_at.eq."2025-01-02",id.lt."{T2}"))'
+
+
+@pytest.mark.asyncio
+async def test_update_task_records_changed_sections_and_serves_deltas(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("SUPABASE_URL", "https://example.supabase.co")
+    monkeypatch.setenv("SUPABASE_SERVICE_ROLE_KEY", "service-key")
+    row: dict = {"id": "t1", "user_id": "u1", "status": "queued", "result": None, "error": None, "routine_json": None}
+    row.update(version=1, change_log=[], section_hashes=storage.section_hashes(row))
+    conflicts = [1]
+    reads: list[str] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.method == "GET":
+            reads.append(request.url.params["select"])
+            return httpx.Response(200, json=[row])
+        if conflicts:
+            conflicts.pop()
+            return httpx.Response(200, json=[])
+        assert request.url.params["version"] == f"eq.{row['version']}"
+        row.update(json.loads(request.content))
+        return httpx.Response(200, json=[row])
+
+    real_client = httpx.AsyncClient
+    monkeypatch.setattr(
+        storage.httpx,
+        "AsyncClient",
+        lambda **kwargs: real_client(transport=httpx.MockTransport(handler), **kwargs),
+    )
+    repository = TaskRepository()
+    profile = {"skin_type": "oily"}
+
+    await repository.update_task("t1", status_value="processing")
+    await repository.update_task("t1", status_value="texture_complete", result_value={"global_profile": profile, "issues": {"oily_shine": [1]}})
+    await repository.update_task("t1", status_value="acne_complete", result_value={"global_profile": profile, "issues": {"oily_shine": [1], "acne_active": [2]}})
+    task = await repository.update_task("t1", status_value="acne_complete")
+
+    assert task.version == 4
+    # One read before the first write and one after its conflict; later writes reuse the returned revision.
+    assert len(reads) == 2
+    assert task_delta(task, 4) == {}
+    assert task_delta(task, 3) == {"issues.acne_active": [2], "status": "acne_complete"}
+    assert set(task_delta(task, 1)) == {"status", "global_profile", "issues.oily_shine", "issues.acne_active"}
+    assert task_delta(task, 0) is None
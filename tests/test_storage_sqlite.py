@@ -0,0 +1,77 @@
+import pytest
+
+from app import storage
+from app.storage import task_delta
+from app.storage_sqlite import SQLiteTaskRepository
+
+
+@pytest.mark.asyncio
+async def test_versioned_updates_and_deltas() -> None:
+    repository = SQLiteTaskRepository()
+    task = await repository.create_task(user_id="u1", real_age=30)
+    assert task.version == 1 and task.real_age == 30
+
+    await repository.update_task(task.id, status_value="processing")
+    result = {"global_profile": {"scores": {"hydration": 70}, "skin_age": {"estimated_age": 28}}}
+    updated = await repository.update_task(task.id, result_value=result)
+    assert updated is not None and updated.version == 3
+    assert task_delta(updated, since=2) == {"global_profile": result["global_profile"]}
+
+    unchanged = await repository.update_task(task.id, status_value="processing")
+    assert unchanged is not None and unchanged.version == 3
+    assert await repository.get_task(task.id, user_id="someone-else") is None
+    assert await repository.update_task("missing", status_value="failed") is None
+
+    # Snapshots never move a task back to an older version.
+    await repository.write_task_snapshot(task.id, {"status": "queued", "version": 2})
+    current = await repository.get_task(task.id)
+    assert current is not None and current.status == "processing"
+    await repository.aclose()
+
+
+@pytest.mark.asyncio
+async def test_summaries_paginate_and_images_round_trip() -> None:
+    repository = SQLiteTaskRepository()
+    ids = [(await repository.create_task(user_id="u1")).id for _ in range(3)]
+    await repository.update_task(
+        ids[0],
+        status_value="completed",
+        result_value={"global_profile": {"scores": {"hydration": 64}, "skin_type": {"label": "oily"}, "skin_age": {"estimated_age": 31}}},
+    )
+
+    first = await repository.list_task_summaries("u1", limit=2)
+    second = await repository.list_task_summaries("u1", limit=2, cursor=first.next_cursor)
+    assert first.next_cursor is not None and second.next_cursor is None
+    items = first.items + second.items
+    assert sorted(item.id for item in items) == sorted(ids)
+    completed = next(item for item in items if item.id == ids[0])
+    assert (completed.scores, completed.skin_type, completed.skin_age) == ({"hydration": 64}, "oily", 31)
+    assert completed.result is None
+
+    await repository.save_task_image(ids[0], user_id="u1", image_bytes=b"\xff\xd8jpeg", mime_type="image/jpeg")
+    image = await repository.load_task_image(ids[0], user_id="u1")
+    assert image is not None and image.data == b"\xff\xd8jpeg"
+    assert await repository.load_task_image(ids[0], user_id="u2") is None
+    await repository.aclose()
+
+
+@pytest.mark.asyncio
+async def test_trend_rollups_live_in_the_selected_store(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("TASK_STORAGE_BACKEND", "sqlite")
+    monkeypatch.setenv("TASK_STATE_BACKEND", "memory")
+    for cached in (storage._backend_store, storage.get_task_repository, storage.get_trend_repository):
+        cached.cache_clear()
+    try:
+        trends = storage.get_trend_repository()
+        assert trends is storage._backend_store() and isinstance(trends, SQLiteTaskRepository)
+        assert storage.get_task_repository() is not trends  # the state tier wraps tasks only
+
+        assert await trends.get_rollup("u1") is None
+        assert await trends.update_rollup("u1", lambda rollup: {"task_count": 1}) == {"task_count": 1}
+        await trends.update_rollup("u1", lambda rollup: {"task_count": rollup["task_count"] + 1})
+        assert await trends.get_rollup("u1") == {"task_count": 2}
+        assert await trends.get_rollup("u2") is None
+        await trends.aclose()
+    finally:
+        for cached in (storage._backend_store, storage.get_task_repository, storage.get_trend_repository):
+            cached.cache_clear()
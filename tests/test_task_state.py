@@ -0,0 +1,114 @@
+import json
+
+import httpx
+import pytest
+from redis.exceptions import WatchError
+
+from app import storage, task_state
+from app.storage_sqlite import SQLiteTaskRepository
+from app.task_state import MemoryTaskStateBackend, RedisTaskStateBackend, WriteBehindTaskRepository
+
+
+@pytest.mark.asyncio
+async def test_progress_is_absorbed_and_milestones_written_back(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("SUPABASE_URL", "https://example.supabase.co")
+    monkeypatch.setenv("SUPABASE_SERVICE_ROLE_KEY", "service-key")
+    seen: list[httpx.Request] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request)
+        if request.method == "POST":
+            row = dict(json.loads(request.content), id="t1", created_at="2025-01-01")
+            return httpx.Response(201, json=[row])
+        return httpx.Response(204)
+
+    real_client = httpx.AsyncClient
+    monkeypatch.setattr(
+        storage.httpx,
+        "AsyncClient",
+        lambda **kwargs: real_client(transport=httpx.MockTransport(handler), **kwargs),
+    )
+    repository = WriteBehindTaskRepository(storage.TaskRepository(), MemoryTaskStateBackend())
+
+    task = await repository.create_task(user_id="u1")
+    await repository.update_task(task.id, status_value="processing")
+    await repository.update_task(task.id, status_value="texture_complete", result_value={"issues": {"oily_shine": []}})
+    polled = await repository.get_task(task.id, user_id="u1")
+    assert [request.method for request in seen] == ["POST"]
+    assert polled.status == "texture_complete"
+    assert polled.version == 3
+    assert await repository.get_task(task.id, user_id="someone-else") is None
+
+    await repository.update_task(task.id, status_value="completed", result_value={"issues": {"oily_shine": [1]}})
+    await repository.drain()
+
+    flush = seen[-1]
+    assert flush.method == "PATCH"
+    assert flush.url.params["version"] == "lt.4"
+    assert json.loads(flush.content)["status"] == "completed"
+
+
+class _ContendedPipeline:
+    """Every transaction loses its WATCH, as under a hot key."""
+
+    def __init__(self, rows: dict[str, bytes]) -> None:
+        self._rows = rows
+        self.attempts = 0
+
+    async def __aenter__(self) -> "_ContendedPipeline":
+        return self
+
+    async def __aexit__(self, *exc: object) -> None:
+        return None
+
+    async def watch(self, key: str) -> None:
+        self.attempts += 1
+
+    async def get(self, key: str) -> bytes | None:
+        return self._rows.get(key)
+
+    def multi(self) -> None:
+        pass
+
+    def set(self, key: str, value: bytes, ex: int) -> None:
+        pass
+
+    async def execute(self) -> None:
+        raise WatchError("watched key changed")
+
+
+class _ContendedRedis:
+    def __init__(self) -> None:
+        self.rows: dict[str, bytes] = {}
+        self.pipe = _ContendedPipeline(self.rows)
+
+    def pipeline(self, transaction: bool) -> _ContendedPipeline:
+        return self.pipe
+
+    async def get(self, key: str) -> bytes | None:
+        return self.rows.get(key)
+
+    async def set(self, key: str, value: bytes, ex: int, nx: bool = False) -> None:
+        if not (nx and key in self.rows):
+            self.rows[key] = value
+
+    async def delete(self, key: str) -> None:
+        self.rows.pop(key, None)
+
+
+@pytest.mark.asyncio
+async def test_contended_update_gives_up_and_writes_through() -> None:
+    client = _ContendedRedis()
+    store = SQLiteTaskRepository()
+    repository = WriteBehindTaskRepository(store, RedisTaskStateBackend(client))
+    task = await repository.create_task(user_id="u1")
+    assert client.rows
+
+    await repository.update_task(task.id, status_value="processing")
+
+    assert client.pipe.attempts == task_state._UPDATE_ATTEMPTS
+    # The store has the write, and polls no longer see the stale cached row.
+    assert (await store.get_task(task.id)).status == "processing"
+    assert not client.rows
+    assert (await repository.get_task(task.id, user_id="u1")).status == "processing"
+    await repository.aclose()
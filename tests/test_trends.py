@@ -0,0 +1,99 @@
+import copy
+from typing import Any, Dict
+
+import pytest
+
+from app import routes, trends
+from app.blobs import BlobStore
+from app.scheduler import Priority
+from app.schemas import TrendsResponse, UpgradedFaceAnalysisResult
+from app.storage_sqlite import SQLiteTaskRepository
+from app.trends import apply_result, rebuild_rollup
+
+
+def test_rollup_folds_scores_and_regions_incrementally(sample_analysis: Dict[str, Any]) -> None:
+    later = copy.deepcopy(sample_analysis)
+    later["global_profile"]["scores"]["acne"] = 35
+    later["issues"]["acne_active"] = []
+
+    rollup = apply_result(None, "t1", sample_analysis, at="2025-01-01")
+    rollup = apply_result(rollup, "t2", later, at="2025-02-01")
+    assert apply_result(rollup, "t2", later) == rollup
+
+    acne = rollup["metrics"]["acne"]
+    assert acne["delta"] == -20
+    assert acne["moving_average"] == 45
+    assert [point["value"] for point in acne["series"]] == [55, 35]
+    assert rollup["metrics"]["skin_age"]["latest"] == 29
+    assert rollup["regions"] == {"LeftCheek": {"acne_active": 1}, "NoseBase": {"oily_shine": 2}}
+    assert rollup["latest_regions"] == {"NoseBase": {"oily_shine": 1}}
+    assert rebuild_rollup([("t1", "2025-01-01", sample_analysis), ("t2", "2025-02-01", later)]) == rollup
+
+    response = TrendsResponse.model_validate(rollup)
+    assert response.task_count == 2
+
+
+@pytest.mark.asyncio
+async def test_reanalysis_runs_as_batch_and_refreshes_the_rollup(
+    monkeypatch: pytest.MonkeyPatch, sample_analysis: Dict[str, Any], tmp_path: Any
+) -> None:
+    repository = SQLiteTaskRepository()
+    monkeypatch.setattr(trends, "get_trend_repository", lambda: repository)
+    monkeypatch.setattr(routes, "get_blob_store", lambda: BlobStore(str(tmp_path), 1024 * 1024))
+    task = await repository.create_task(user_id="u1")
+    await repository.update_task(task.id, status_value="completed", result_value=sample_analysis)
+    await repository.save_task_image(task.id, user_id="u1", image_bytes=b"img", mime_type="image/jpeg")
+    await repository.update_rollup("u1", lambda rollup: trends.apply_result(rollup, task.id, sample_analysis))
+    previous = UpgradedFaceAnalysisResult.model_validate(sample_analysis)
+    priorities: list[Priority] = []
+
+    async def _rerun(image: Any, previous: UpgradedFaceAnalysisResult, steps: list[str], **kwargs: Any) -> Any:
+        priorities.append(kwargs["priority"])
+        rerun = previous.model_copy(deep=True)
+        rerun.issues.acne_active[0].region = "Chin"
+        return rerun
+
+    monkeypatch.setattr(routes, "rerun_issue_steps", _rerun)
+    await routes._reanalyze_task(task.id, "u1", previous, ["acne"], None, repository)
+
+    assert priorities == [Priority.BATCH]
+    rollup = await repository.get_rollup("u1")
+    assert rollup["task_count"] == 1
+    assert rollup["regions"] == {"Chin": {"acne_active": 1}, "NoseBase": {"oily_shine": 1}}
+    assert rollup["latest_regions"] == rollup["regions"]
+    await repository.aclose()
+
+
+@pytest.mark.asyncio
+async def test_rebuild_counts_every_completed_task_and_caps_only_the_series(
+    monkeypatch: pytest.MonkeyPatch, sample_analysis: Dict[str, Any]
+) -> None:
+    monkeypatch.setenv("TREND_SERIES_LENGTH", "3")
+    monkeypatch.setattr(trends, "_REBUILD_PAGE_SIZE", 2)
+    repository = SQLiteTaskRepository()
+    history = []
+    for acne in (10, 20, 30, 40, 50):
+        result = copy.deepcopy(sample_analysis)
+        result["global_profile"]["scores"]["acne"] = acne
+        task = await repository.create_task(user_id="u1")
+        await repository.update_task(task.id, status_value="completed", result_value=result)
+        history.append((task.id, result))
+    await repository.create_task(user_id="u1")  # still running
+
+    rollup = await trends.rebuild_from_history("u1", repository)
+
+    assert rollup["task_count"] == 5
+    assert rollup["metrics"]["acne"]["mean"] == 30
+    assert [point["value"] for point in rollup["metrics"]["acne"]["series"]] == [30, 40, 50]
+    assert rollup["regions"]["LeftCheek"] == {"acne_active": 5}
+    assert rollup["last_task_id"] == history[-1][0]
+    assert await trends.rebuild_from_history("u2", repository) is None
+
+    # A live completion must not start a rollup that would hide the earlier history.
+    await trends.record_completed_analysis("u1", history[-1][0], history[-1][1], repository)
+    assert await repository.get_rollup("u1") is None
+    await repository.update_rollup("u1", lambda existing: existing or rollup)
+    late = await repository.create_task(user_id="u1")
+    await trends.record_completed_analysis("u1", late.id, sample_analysis, repository)
+    assert (await repository.get_rollup("u1"))["task_count"] == 6
+    await repository.aclose()
@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+from typing import Any, Dict
+
+import pytest
+
+from app import metrics, workflow
+from app.blobs import BlobStore
+from app.schemas import UpgradedFaceAnalysisResult
+
+
+@pytest.mark.asyncio
+async def test_rerun_replaces_only_selected_categories(
+    monkeypatch: pytest.MonkeyPatch,
+    sample_analysis: Dict[str, Any],
+    tmp_path: Any,
+) -> None:
+    calls: list[str] = []
+
+    async def _fake_step(schema: Any, instructions: str, *args: Any, **kwargs: Any) -> Any:
+        calls.append(schema.__name__)
+        issue = {"region": "MouthBottom", "intensity": 0.2, "area": 1, "description": "Rerun finding."}
+        return schema.model_validate({"issues": {"acne_active": [issue]}})
+
+    monkeypatch.setattr(workflow, "_invoke_step", _fake_step)
+    previous = UpgradedFaceAnalysisResult.model_validate(sample_analysis)
+    assert workflow.stale_steps(previous.model_dump()) == list(workflow.ISSUE_STEP_NAMES)
+
+    merged = await workflow.rerun_issue_steps(BlobStore(str(tmp_path), 1024).put(b"img", "image/jpeg"), previous, ["acne"])
+
+    assert calls == ["AcneRednessIssuesResult"]
+    assert [issue.description for issue in merged.issues.acne_active] == ["Rerun finding."]
+    assert merged.issues.oily_shine == previous.issues.oily_shine
+    assert merged.global_profile == previous.global_profile
+    assert workflow.stale_steps(merged.model_dump()) == ["texture", "pigmentation", "aging"]
+
+
+@pytest.mark.asyncio
+async def test_gating_skips_and_downgrades_steps_from_step_one_scores(
+    monkeypatch: pytest.MonkeyPatch,
+    sample_analysis: Dict[str, Any],
+    tmp_path: Any,
+) -> None:
+    profile = sample_analysis["global_profile"]
+    profile["scores"].update(acne=3, sensitivity_redness=4, wrinkles=5, dark_circles=15)
+    calls: Dict[str, Any] = {}
+
+    async def _fake_step(schema: Any, instructions: str, *args: Any, **kwargs: Any) -> Any:
+        calls[schema.__name__] = kwargs.get("model_name")
+        if schema.__name__ == "GlobalProfileResult":
+            return schema.model_validate({"global_profile": profile})
+        return schema.model_validate({"issues": {}})
+
+    monkeypatch.setattr(workflow, "_invoke_step", _fake_step)
+    monkeypatch.setenv("OPENROUTER_FAST_MODEL", "small-model")
+    metrics.reset()
+    image = BlobStore(str(tmp_path), 1024).put(b"img", "image/jpeg")
+
+    result = await workflow.run_upgraded_workflow(image)
+
+    assert "AcneRednessIssuesResult" not in calls
+    assert calls["AgingIssuesResult"] == "small-model"
+    assert calls["TextureIssuesResult"] is None
+    assert set(result.skipped_steps) == {"acne"} and "sensitivity_redness=4" in result.skipped_steps["acne"]
+    assert set(result.downgraded_steps) == {"aging"}
+    assert result.issues.acne_active == []
+    assert metrics.get_counter("workflow.llm_calls_saved") == 1
+
+    monkeypatch.setenv("STEP_GATING", "0")
+    calls.clear()
+    result = await workflow.run_upgraded_workflow(image)
+    assert len(calls) == 5 and not result.skipped_steps and not result.downgraded_steps